@@ -0,0 +1,263 @@
+import logging
+import os
+import threading
+from typing import Dict, Optional, Union
+
+import zstandard
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.types import Text, TypeDecorator
+
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Store large note content zstd compressed. SQLite only: PostgreSQL
+# already compresses large values itself (TOAST).
+NOTE_COMPRESSION = os.getenv("NOTE_COMPRESSION", "0") == "1"
+# Content of fewer UTF-8 bytes than this stays text
+NOTE_COMPRESSION_MIN_SIZE = int(os.getenv("NOTE_COMPRESSION_MIN_SIZE", "1024"))
+NOTE_COMPRESSION_LEVEL = int(os.getenv("NOTE_COMPRESSION_LEVEL", "3"))
+# The shared dictionary is trained once, from up to DICT_SAMPLES notes,
+# when compression is first turned on and there are at least
+# DICT_MIN_SAMPLES of them; until then content is compressed without one
+NOTE_COMPRESSION_DICT_SIZE = int(
+    os.getenv("NOTE_COMPRESSION_DICT_SIZE", str(64 * 1024))
+)
+NOTE_COMPRESSION_DICT_SAMPLES = int(
+    os.getenv("NOTE_COMPRESSION_DICT_SAMPLES", "2000")
+)
+NOTE_COMPRESSION_DICT_MIN_SAMPLES = int(
+    os.getenv("NOTE_COMPRESSION_DICT_MIN_SAMPLES", "100")
+)
+# Rows per transaction when existing content is compressed or expanded
+NOTE_COMPRESSION_BATCH = int(os.getenv("NOTE_COMPRESSION_BATCH", "500"))
+
+# Content of a notes row as text, in raw SQL on SQLite
+SQLITE_CONTENT = (
+    "CASE WHEN typeof(content) = 'blob' THEN note_text(content) "
+    "ELSE content END"
+)
+
+# Bytes of a sample the dictionary is trained on; what notes share is
+# mostly near their start
+_SAMPLE_BYTES = 16 * 1024
+
+
+class ContentCodec:
+    """zstd compression of note content with shared dictionaries.
+
+    Every dictionary content was ever compressed with is kept, and frames
+    carry the id of theirs; new content uses the latest. zstd contexts
+    can't be shared between threads, so each thread gets its own.
+    """
+
+    def __init__(
+        self,
+        min_size: int = NOTE_COMPRESSION_MIN_SIZE,
+        level: int = NOTE_COMPRESSION_LEVEL,
+    ):
+        self.min_size = min_size
+        self.level = level
+        self._dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+        self.current: Optional[int] = None
+        self._local = threading.local()
+
+    def add_dictionary(self, data: bytes) -> int:
+        dictionary = zstandard.ZstdCompressionDict(data)
+        self._dictionaries[dictionary.dict_id()] = dictionary
+        self.current = dictionary.dict_id()
+        self._local = threading.local()
+        return self.current
+
+    def _compressor(self) -> zstandard.ZstdCompressor:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            dictionary = self._dictionaries.get(self.current)
+            compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=dictionary
+            )
+            self._local.compressor = compressor
+        return compressor
+
+    def _decompressor(self, data: bytes) -> zstandard.ZstdDecompressor:
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        decompressors = getattr(self._local, "decompressors", None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id and dict_id not in self._dictionaries:
+                raise ValueError(f"Unknown compression dictionary {dict_id}")
+            decompressor = zstandard.ZstdDecompressor(
+                dict_data=self._dictionaries.get(dict_id)
+            )
+            decompressors[dict_id] = decompressor
+        return decompressor
+
+    def encode(self, content: str) -> Union[str, bytes]:
+        """Compressed content, or the content itself if short or if
+        compressing doesn't make it smaller"""
+        raw = content.encode()
+        if len(raw) < self.min_size:
+            return content
+        data = self._compressor().compress(raw)
+        return data if len(data) < len(raw) else content
+
+    def decode(self, data: bytes) -> str:
+        return self._decompressor(data).decompress(data).decode()
+
+    def preview(self, data: bytes, chars: int) -> str:
+        """The first ``chars`` characters, decompressing no more than that"""
+        size = chars * 4
+        with self._decompressor(data).stream_reader(data) as reader:
+            raw = reader.read(size)
+            while len(raw) < size:
+                more = reader.read(size - len(raw))
+                if not more:
+                    break
+                raw += more
+        return raw.decode(errors="ignore")[:chars]
+
+
+content_codec = ContentCodec()
+
+
+class CompressedText(TypeDecorator):
+    """Text stored zstd compressed when NOTE_COMPRESSION is on.
+
+    On SQLite a TEXT column takes the compressed bytes as a blob, which
+    reads tell from text by type, so rows of both kinds can live side by
+    side and the setting can be changed at any time. Raw SQL reads
+    content through ``note_text`` (see SQLITE_CONTENT).
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not NOTE_COMPRESSION or dialect.name != "sqlite":
+            return value
+        return content_codec.encode(value)
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return content_codec.decode(value)
+        return value
+
+
+def _note_text(value):
+    return content_codec.decode(value) if isinstance(value, bytes) else value
+
+
+def _note_preview(value, chars):
+    if isinstance(value, bytes):
+        return content_codec.preview(value, chars)
+    return value[:chars] if value is not None else None
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+    dbapi_connection.create_function(
+        "note_text", 1, _note_text, deterministic=True
+    )
+    dbapi_connection.create_function(
+        "note_preview", 2, _note_preview, deterministic=True
+    )
+
+
+async def _train_dictionary(conn: AsyncConnection) -> None:
+    result = await conn.execute(
+        text(
+            f"SELECT {SQLITE_CONTENT} FROM notes "
+            "WHERE content IS NOT NULL ORDER BY random() LIMIT :samples"
+        ),
+        {"samples": NOTE_COMPRESSION_DICT_SAMPLES},
+    )
+    samples = [content.encode()[:_SAMPLE_BYTES] for content in result.scalars()]
+    if len(samples) < NOTE_COMPRESSION_DICT_MIN_SAMPLES:
+        return
+    try:
+        dictionary = zstandard.train_dictionary(
+            NOTE_COMPRESSION_DICT_SIZE, samples
+        )
+    except zstandard.ZstdError as e:
+        logger.warning("Training a compression dictionary failed: %s", e)
+        return
+    await conn.execute(
+        text(
+            "INSERT INTO compression_dictionaries (id, data, created_at) "
+            "VALUES (:id, :data, CURRENT_TIMESTAMP)"
+        ),
+        {"id": dictionary.dict_id(), "data": dictionary.as_bytes()},
+    )
+    await conn.commit()
+    content_codec.add_dictionary(dictionary.as_bytes())
+    logger.info(
+        "Trained compression dictionary %d from %d notes",
+        dictionary.dict_id(),
+        len(samples),
+    )
+
+
+async def _migrate_rows(conn: AsyncConnection) -> int:
+    """Compress the content that should be, or expand all of it when
+    compression is off; a batch per transaction"""
+    if NOTE_COMPRESSION:
+        pending = (
+            "typeof(content) = 'text' "
+            "AND length(CAST(content AS BLOB)) >= :min_size"
+        )
+    else:
+        pending = "typeof(content) = 'blob'"
+    select_batch = text(
+        f"SELECT id, content FROM notes WHERE id > :after AND {pending} "
+        "ORDER BY id LIMIT :batch"
+    )
+    update_row = text("UPDATE notes SET content = :content WHERE id = :id")
+    after = migrated = 0
+    while True:
+        result = await conn.execute(
+            select_batch,
+            {
+                "after": after,
+                "min_size": content_codec.min_size,
+                "batch": NOTE_COMPRESSION_BATCH,
+            },
+        )
+        rows = result.all()
+        if not rows:
+            return migrated
+        values = []
+        for note_id, content in rows:
+            if NOTE_COMPRESSION:
+                content = content_codec.encode(content)
+            else:
+                content = content_codec.decode(content)
+            values.append({"id": note_id, "content": content})
+        await conn.execute(update_row, values)
+        await conn.commit()
+        after = rows[-1].id
+        migrated += len(rows)
+
+
+async def prepare_note_compression(conn: AsyncConnection) -> None:
+    """Load the compression dictionaries, then bring the stored content
+    in line with NOTE_COMPRESSION, training a dictionary first if there
+    is none yet"""
+    if conn.dialect.name != "sqlite":
+        return
+    result = await conn.execute(
+        text("SELECT data FROM compression_dictionaries ORDER BY created_at")
+    )
+    for data in result.scalars():
+        content_codec.add_dictionary(data)
+    await conn.commit()
+    if NOTE_COMPRESSION and content_codec.current is None:
+        await _train_dictionary(conn)
+    migrated = await _migrate_rows(conn)
+    if migrated:
+        action = "Compressed" if NOTE_COMPRESSION else "Expanded"
+        logger.info("%s the content of %d notes", action, migrated)
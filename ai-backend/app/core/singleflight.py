@@ -0,0 +1,134 @@
+import asyncio
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+class SupersededError(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller starts the call; callers arriving while it is in
+    flight wait for the same result. The call is cancelled once every
+    caller waiting for it has been cancelled.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            self.calls += 1
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody wants the result any more. Forget it right away so
+                # a new caller starts afresh instead of joining a
+                # cancelled call.
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
+
+
+class LatestOnly:
+    """Lets only the most recent request per key run.
+
+    Starting a request cancels the one still running under the same key,
+    which raises ``SupersededError``.
+    """
+
+    def __init__(self):
+        self._current: Dict[Hashable, asyncio.Event] = {}
+        self.superseded = 0
+
+    def _claim(self, key: Hashable) -> asyncio.Event:
+        previous = self._current.get(key)
+        if previous is not None:
+            previous.set()
+        event = self._current[key] = asyncio.Event()
+        return event
+
+    def _release(self, key: Hashable, event: asyncio.Event) -> None:
+        if self._current.get(key) is event:
+            del self._current[key]
+
+    async def _until_superseded(
+        self, event: asyncio.Event, awaitable: Awaitable[T]
+    ) -> T:
+        task = asyncio.ensure_future(awaitable)
+        superseded = asyncio.ensure_future(event.wait())
+        try:
+            await asyncio.wait(
+                {task, superseded}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if task.done():
+                return task.result()
+            self.superseded += 1
+            raise SupersededError("Superseded by a newer request")
+        finally:
+            for future in (task, superseded):
+                future.cancel()
+            await asyncio.gather(task, superseded, return_exceptions=True)
+
+    async def run(self, key: Hashable, awaitable: Awaitable[T]) -> T:
+        event = self._claim(key)
+        try:
+            return await self._until_superseded(event, awaitable)
+        finally:
+            self._release(key, event)
+
+    async def iterate(
+        self, key: Hashable, iterator: AsyncIterator[Any]
+    ) -> AsyncIterator[Any]:
+        """Yield from ``iterator`` until a newer request claims ``key``"""
+        event = self._claim(key)
+        try:
+            while True:
+                try:
+                    item = await self._until_superseded(
+                        event, iterator.__anext__()
+                    )
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            self._release(key, event)
+            await iterator.aclose()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, JSON, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, JSON, Boolean, Float, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 from datetime import datetime, timezone
@@ -25,8 +25,12 @@ class DocumentVersion(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     note_id = Column(Integer, ForeignKey("notes.id"), nullable=False)
     version_number = Column(Integer, nullable=False)
-    content = Column(Text, nullable=False)
-    content_hash = Column(String(64))  
+    content = Column(Text)  # uncompressed, for versions stored without storage
+    content_hash = Column(String(64))  # sha256 of the content
+    storage = Column(String(8))  # full (keyframe) or delta, both in data
+    data = Column(LargeBinary)  # zstd compressed
+    chain = Column(Integer, default=0)  # deltas since the last keyframe
+    size = Column(Integer)  # characters of content
     change_description = Column(String(255))
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -35,14 +39,21 @@ class DocumentVersion(Base):
     note = relationship("Note")
     user = relationship("User")
 
+    __table_args__ = (
+        Index("ix_document_versions_note_id_version_number", "note_id", "version_number", unique=True),
+    )
+
 
 class AIUsageLog(Base):
     __tablename__ = "ai_usage_logs"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # None for anonymous calls
     operation_type = Column(String(50), nullable=False)  # autocomplete, translate, etc
     provider = Column(String(50), nullable=False)  # ollama, openai, groq
+    request_count = Column(Integer, default=1)  # calls aggregated into this row
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
     tokens_used = Column(Integer, default=0)
     execution_time = Column(Float) #seconds
     success = Column(Boolean, default=True)
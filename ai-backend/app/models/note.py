@@ -1,5 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, func
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DateTime,
+    ForeignKey,
+    Index,
+    LargeBinary,
+    func,
+)
 from sqlalchemy.orm import relationship
+from app.core.compressed_text import CompressedText
 from app.core.database import Base
 
 
@@ -8,15 +18,38 @@ class Note(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String(256), nullable=False)
-    content = Column(Text)
+    content = Column(CompressedText)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Bumped by every update; an update of a version that was changed in
+    # the meantime fails with StaleDataError
+    version = Column(Integer, nullable=False, server_default="1")
 
     user = relationship("User", back_populates="notes")
 
+    __table_args__ = (
+        # Serves a user's notes newest first, and the keyset pagination
+        # that continues from (updated_at, id)
+        Index("ix_notes_user_id_updated_at", "user_id", "updated_at", "id"),
+    )
+    # eager_defaults reads the generated timestamps back with RETURNING
+    # on flush, instead of a SELECT when they are next accessed
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
+
     def __repr__(self):
         return f"<Note(id={self.id}, title='{self.title}', user_id={self.user_id})>"
 
     def __str__(self):
         return f"Note: {self.title}"
+
+
+class CompressionDictionary(Base):
+    """A zstd dictionary note content was compressed with"""
+
+    __tablename__ = "compression_dictionaries"
+
+    # zstd dictionary id
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=func.now())
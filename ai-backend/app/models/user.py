@@ -11,6 +11,9 @@ class User(Base):
     password_hash = Column(String(256), nullable=False)
     created_at = Column(DateTime, default=func.now())
     notes = relationship("Note", back_populates="user")
+    ai_settings = relationship(
+        "AISettings", back_populates="user", uselist=False
+    )
 
     def __repr__(self):
         return f"<User(id={self.id}, email='{self.email}')>"
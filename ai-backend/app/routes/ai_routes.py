@@ -3,13 +3,17 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from app.core.database import get_db
 from app.routes.auth import get_current_user
 from app.models.user import User
-from app.schemas.simple_ai_schemas import (
+from app.schemas.ai_schemas import (
     AutocompleteRequest, 
     GrammarRequest, 
     TranslateRequest, 
     AIResponse
 )
-from app.services.unified_ai_service import UnifiedAIService, AIProvider
+from app.services.unified_ai_service import (
+    AIProvider,
+    UnifiedAIService,
+    get_ai_service,
+)
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
@@ -17,14 +21,14 @@ router = APIRouter(prefix="/ai", tags=["ai"])
 @router.post("/autocomplete", response_model=AIResponse)
 async def autocomplete_text(
     request: AutocompleteRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    ai_service: UnifiedAIService = Depends(get_ai_service),
 ):
     try:
-        ai_service = UnifiedAIService()
-        
         result = await ai_service.autocomplete(
             text=request.text,
-            preferred_provider=request.preferred_provider
+            preferred_provider=request.preferred_provider,
+            user_id=current_user.id,
         )
         
         return AIResponse(
@@ -43,14 +47,14 @@ async def autocomplete_text(
 @router.post("/grammar", response_model=AIResponse)
 async def check_grammar(
     request: GrammarRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    ai_service: UnifiedAIService = Depends(get_ai_service),
 ):
     try:
-        ai_service = UnifiedAIService()
-        
         result = await ai_service.grammar_check(
             text=request.text,
-            preferred_provider=request.preferred_provider
+            preferred_provider=request.preferred_provider,
+            user_id=current_user.id,
         )
         
         return AIResponse(
@@ -69,15 +73,15 @@ async def check_grammar(
 @router.post("/translate", response_model=AIResponse)
 async def translate_text(
     request: TranslateRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    ai_service: UnifiedAIService = Depends(get_ai_service),
 ):
     try:
-        ai_service = UnifiedAIService()
-        
         result = await ai_service.translate(
             text=request.text,
             target_language=request.target_language,
-            preferred_provider=request.preferred_provider
+            preferred_provider=request.preferred_provider,
+            user_id=current_user.id,
         )
         
         return AIResponse(
@@ -94,9 +98,11 @@ async def translate_text(
 
 
 @router.get("/health")
-async def health_check(current_user: User = Depends(get_current_user)):
+async def health_check(
+    current_user: User = Depends(get_current_user),
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+):
     try:
-        ai_service = UnifiedAIService()
         results = await ai_service.health_check()
         
         return {
@@ -1,17 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.requests import HTTPConnection
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.security.utils import get_authorization_scheme_param
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
 from app.core.database import get_db
-from app.services.auth_service import AuthService, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.services.auth_service import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    AuthService,
+    PasswordHashBusyError,
+)
 from app.schemas.user import UserCreate, UserResponse, Token
+from app.services.token_verifier import InvalidTokenError, token_verifier
+from app.services.user_cache import user_cache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
+def _busy(e: PasswordHashBusyError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, try again later",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 @router.post("/register", response_model=UserResponse)
 async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     auth_service = AuthService(db)
@@ -25,6 +41,8 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
         )
+    except PasswordHashBusyError as e:
+        raise _busy(e)
 
 
 @router.post("/login", response_model=Token)
@@ -34,9 +52,12 @@ async def login(
 ):
     auth_service = AuthService(db)
 
-    user = await auth_service.authenticate_user(
-        form_data.username, form_data.password
-    )
+    try:
+        user = await auth_service.authenticate_user(
+            form_data.username, form_data.password
+        )
+    except PasswordHashBusyError as e:
+        raise _busy(e)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -52,29 +73,53 @@ async def login(
     return Token(access_token=access_token, token_type="bearer")
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
-):
-    from jose import JWTError, jwt
-    from app.services.auth_service import SECRET_KEY, ALGORITHM
-
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-
+async def _user_from_token(token: str, db: AsyncSession):
+    """The user a token was issued to, or None when it isn't valid"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        payload = token_verifier.verify(token)
+    except InvalidTokenError:
+        return None
+    email: str = payload.get("sub")
+    if email is None:
+        return None
+
+    expires = payload.get("exp")
+    user = user_cache.get(email, expires)
+    if user is not None:
+        return user
 
     auth_service = AuthService(db)
     user = await auth_service.get_user_by_email(email)
     if user is None:
-        raise credentials_exception
+        return None
+
+    user_cache.set(email, expires, user)
+    return user
 
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
+):
+    user = await _user_from_token(token, db)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
+
+
+async def get_optional_user(
+    connection: HTTPConnection, db: AsyncSession = Depends(get_db)
+):
+    """The signed-in user, or None for anonymous requests.
+
+    Works for WebSockets too, which ``oauth2_scheme`` doesn't support.
+    """
+    scheme, token = get_authorization_scheme_param(
+        connection.headers.get("Authorization")
+    )
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return await _user_from_token(token, db)
@@ -1,25 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+import os
+import time
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import HTMLResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
-import markdown
+from typing import Iterator, List, Optional, Union
 
+from app.core.cache import etag_matches
 from app.core.database import get_db
-from app.services.note_service import NoteService
-from app.schemas.note import NoteCreate, NoteUpdate, NoteResponse
+from app.services.incremental_renderer import (
+    iter_note_html,
+    render_note_html,
+    use_incremental,
+)
+from app.services.markdown_renderer import content_key, render_cache
+from app.services.render_executor import (
+    RenderSaturatedError,
+    RenderTimeoutError,
+    render_executor,
+)
+from app.services.note_search import SearchUnavailableError, search_notes
+from app.services.note_write_buffer import get_note_service
+from app.services.version_service import VersionService
+from app.services.note_service import (
+    VersionConflictError,
+    decode_cursor,
+    encode_cursor,
+)
+from app.schemas.note import (
+    NoteCreate,
+    NotePage,
+    NotePatch,
+    NotePatchResponse,
+    NoteResponse,
+    NoteSearchPage,
+    NoteSummary,
+    NoteUpdate,
+    NoteVersionCreate,
+    NoteVersionResponse,
+    NoteVersionSummary,
+    NoteView,
+)
 from app.models.user import User
 from app.routes.auth import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/notes", tags=["notes"])
 
+NOTES_PAGE_SIZE = int(os.getenv("NOTES_PAGE_SIZE", "50"))
+NOTES_PAGE_MAX = int(os.getenv("NOTES_PAGE_MAX", "200"))
+# Ranked results can't continue from a cursor; deep offsets cost a scan
+NOTES_SEARCH_MAX_OFFSET = int(os.getenv("NOTES_SEARCH_MAX_OFFSET", "1000"))
+# Attempts at numbering a named version while saves race it
+NOTE_VERSION_RETRIES = int(os.getenv("NOTE_VERSION_RETRIES", "3"))
+
 
-@router.get("/", response_model=List[NoteResponse])
+@router.get("/", response_model=Union[List[NoteResponse], NotePage])
 async def get_notes(
+    limit: Optional[int] = Query(None, ge=1, le=NOTES_PAGE_MAX),
+    cursor: Optional[str] = None,
+    view: NoteView = NoteView.FULL,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    service = NoteService(db)
-    notes = await service.get_user_notes(current_user.id)
-    return notes
+    """The user's notes, newest first.
+
+    Without parameters every note is returned in full. With ``limit``,
+    ``cursor`` or ``view=list`` a page is returned instead, together with
+    the cursor of the next page; ``view=list`` sends only id, title,
+    updated_at and a preview of each note.
+    """
+    service = get_note_service(db)
+    if limit is None and cursor is None and view == NoteView.FULL:
+        notes = await service.get_user_notes(current_user.id)
+        return notes
+
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        )
+    summary = view == NoteView.LIST
+    notes, next_cursor = await service.get_user_notes_page(
+        current_user.id, limit or NOTES_PAGE_SIZE, after, summary
+    )
+    model = NoteSummary if summary else NoteResponse
+    return NotePage(
+        items=[
+            model.model_validate(note, from_attributes=True) for note in notes
+        ],
+        next_cursor=encode_cursor(next_cursor) if next_cursor else None,
+    )
+
+
+@router.get("/search", response_model=NoteSearchPage)
+async def search(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=NOTES_SEARCH_MAX_OFFSET),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Full-text search over the user's notes, best matches first.
+
+    All words must match, "quoted phrases" match as a whole and ``word*``
+    matches prefixes. Matches are wrapped in ``<mark>`` in the title and
+    the snippet, which are otherwise the note's Markdown, not HTML.
+    """
+    try:
+        hits, more = await search_notes(db, current_user.id, q, limit, offset)
+    except SearchUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e)
+        )
+    return NoteSearchPage(
+        items=hits, next_offset=offset + len(hits) if more else None
+    )
 
 
 @router.post(
@@ -30,7 +138,7 @@ async def create_note(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    service = NoteService(db)
+    service = get_note_service(db)
     note = await service.create_note(note_data, current_user.id)
     return note
 
@@ -41,7 +149,7 @@ async def get_note(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    service = NoteService(db)
+    service = get_note_service(db)
     note = await service.get_note_by_id(note_id)
     if not note or note.user_id != current_user.id:
         raise HTTPException(
@@ -50,42 +158,189 @@ async def get_note(
     return note
 
 
+def _wants_html(request: Request, stream: bool) -> bool:
+    accept = request.headers.get("accept", "")
+    return stream or (
+        "text/html" in accept and "application/json" not in accept
+    )
+
+
+def _stream_html(content: str) -> Iterator[str]:
+    # Headers are sent by the time a render overruns, so the response is
+    # aborted rather than ending in truncated HTML.
+    deadline = time.monotonic() + render_executor.timeout
+    for piece in iter_note_html(content):
+        yield piece
+        if time.monotonic() > deadline:
+            render_executor.timeouts += 1
+            raise RenderTimeoutError(render_executor.retry_after)
+
+
+class _RenderSlotResponse(StreamingResponse):
+    """Streams a render holding a render slot, freed once the response
+    ends however it ends, including before the body was ever started"""
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            render_executor.release()
+
+
 @router.get("/{note_id}/html")
 async def get_note_html(
     note_id: int,
+    request: Request,
+    response: Response,
+    stream: bool = False,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    service = NoteService(db)
+    service = get_note_service(db)
     note = await service.get_note_by_id(note_id)
     if not note or note.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Note not found"
         )
 
-    # Simple markdown to HTML conversion
-    try:
-        # Basic markdown conversion without preprocessing
-        html_content = markdown.markdown(
-            note.content,
-            extensions=[
-                'markdown.extensions.extra',  # Tables, footnotes, etc.
-                'markdown.extensions.nl2br',  # Convert newlines to <br>
-                'markdown.extensions.fenced_code',  # Code blocks
-                'markdown.extensions.tables',  # Table support
-            ],
-            tab_length=4,
+    content = note.content or ""
+    cache_key = content_key(content)
+    as_html = _wants_html(request, stream)
+    etag = f'"{cache_key}-html"' if as_html else f'"{cache_key}"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers
         )
 
-    except Exception as e:
-        print(f"Markdown conversion error: {e}")
-        # Simple fallback
-        html_content = note.content.replace(
-            '\n', '<br>'
-        )  # Return just the HTML content as JSON
+    html_content = render_cache.get(note_id, cache_key)
+    if html_content is None and as_html:
+        # Rendered block by block on Starlette's thread pool while the
+        # response is being sent; the full document is never held in
+        # memory, so it isn't added to the render cache either.
+        try:
+            render_executor.reserve()
+        except RenderSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Renderer is busy, try again later",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        return _RenderSlotResponse(
+            _stream_html(content),
+            media_type="text/html; charset=utf-8",
+            headers=cache_headers,
+        )
+
+    if html_content is None:
+        try:
+            # Incremental renders share an in-process block cache, so they
+            # stay on the thread pool.
+            html_content = await render_executor.run(
+                render_note_html,
+                content,
+                allow_process=not use_incremental(content),
+            )
+            render_cache.put(note_id, cache_key, html_content)
+        except RenderSaturatedError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Renderer is busy, try again later",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except RenderTimeoutError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Rendering timed out, try again later",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except Exception as e:
+            logger.warning("Markdown conversion error: %s", e)
+            # Simple fallback, not cached so the next request retries
+            html_content = content.replace('\n', '<br>')
+
+    if as_html:
+        return HTMLResponse(html_content, headers=cache_headers)
+    response.headers.update(cache_headers)
     return {"html": html_content}
 
 
+@router.get("/{note_id}/versions", response_model=List[NoteVersionSummary])
+async def list_versions(
+    note_id: int,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """The note's versions, newest first, without their content"""
+    return await VersionService(db).history(note_id, current_user.id, limit)
+
+
+@router.post(
+    "/{note_id}/versions",
+    response_model=NoteVersionSummary,
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_version(
+    note_id: int,
+    version_data: NoteVersionCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Record the note as it is now as a named version.
+
+    Named versions are never thinned out by the retention of autosaves.
+    """
+    for _ in range(NOTE_VERSION_RETRIES):
+        note = await get_note_service(db).get_note_by_id(note_id)
+        if not note or note.user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Note not found"
+            )
+        try:
+            version = await VersionService(db).record(
+                note,
+                is_auto_save=False,
+                change_description=version_data.change_description,
+            )
+            await db.commit()
+            return version
+        except IntegrityError:
+            # A save recorded the same version number first; number it
+            # after that one
+            await db.rollback()
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="The note is being saved, try again",
+    )
+
+
+@router.get(
+    "/{note_id}/versions/{version_number}",
+    response_model=NoteVersionResponse,
+)
+async def get_version(
+    note_id: int,
+    version_number: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    found = await VersionService(db).get(
+        note_id, current_user.id, version_number
+    )
+    if found is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Version not found"
+        )
+    version, content = found
+    summary = NoteVersionSummary.model_validate(version)
+    return NoteVersionResponse(**summary.model_dump(), content=content)
+
+
 @router.put("/{note_id}", response_model=NoteResponse)
 async def update_note(
     note_id: int,
@@ -93,30 +348,56 @@ async def update_note(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    service = NoteService(db)
-    existing_note = await service.get_note_by_id(note_id)
-    if not existing_note or existing_note.user_id != current_user.id:
+    service = get_note_service(db)
+    note = await service.update_note(note_id, current_user.id, note_data)
+    if not note:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Note not found"
         )
-    note = await service.update_note(note_id, note_data)
     return note
 
 
-@router.delete("/{note_id}")
-async def delete_note(
+@router.patch("/{note_id}", response_model=NotePatchResponse)
+async def patch_note(
     note_id: int,
+    patch: NotePatch,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    service = NoteService(db)
-    existing_note = await service.get_note_by_id(note_id)
-    if not existing_note or existing_note.user_id != current_user.id:
+    """Edit a note by text operations instead of sending all its content.
+
+    The operations must have been made on ``base_version`` of the note;
+    if it has changed since, nothing is applied and 409 is returned with
+    the current version, for the client to fetch the note and rebase.
+    Only the new version and updated_at are returned.
+    """
+    service = get_note_service(db)
+    try:
+        note = await service.patch_note(note_id, current_user.id, patch)
+    except VersionConflictError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(e), "version": e.version},
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        )
+    if not note:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Note not found"
         )
-    success = await service.delete_note(note_id)
-    if not success:
+    return note
+
+
+@router.delete("/{note_id}")
+async def delete_note(
+    note_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    service = get_note_service(db)
+    if not await service.delete_note(note_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Note not found"
         )
@@ -1,73 +1,351 @@
-from fastapi import APIRouter, HTTPException, status
+import asyncio
+import json
+from functools import partial
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+)
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.core.singleflight import SupersededError
+from app.models.user import User
+from app.routes.auth import get_current_user, get_optional_user
 from app.schemas.ai_schemas import (
-    AutocompleteRequest, 
-    GrammarRequest, 
-    TranslateRequest, 
-    AIResponse
+    AutocompleteRequest,
+    GrammarRequest,
+    TranslateRequest,
+    AIResponse,
+    UsageGroup,
+    UsageSummaryRow,
+)
+from app.services.usage_service import UsageService
+from app.services.unified_ai_service import (
+    AIProvider,
+    UnifiedAIService,
+    get_ai_service,
 )
-from app.services.unified_ai_service import UnifiedAIService
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
-ai_service = UnifiedAIService()
-
 
 @router.get("/health")
-async def health_check():
+async def health_check(
+    deep: bool = False,
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+):
+    """Provider health; ``deep`` runs a real generation on every provider"""
     try:
-        health = await ai_service.health_check()
+        health = await ai_service.health_check(deep)
         return {"status": "healthy", "providers": health}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"AI service error: {str(e)}"
+            detail=f"AI service error: {str(e)}",
         )
 
 
 @router.post("/autocomplete", response_model=AIResponse)
-async def autocomplete_text(request: AutocompleteRequest):
+async def autocomplete_text(
+    request: AutocompleteRequest,
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+    user: Optional[User] = Depends(get_optional_user),
+):
     try:
-        response = await ai_service.autocomplete(request.text)
+        call = ai_service.autocomplete(request.text, user_id=_user_id(user))
+        key = _supersede_key(user, request)
+        if key is not None:
+            call = ai_service.autocomplete_requests.run(key, call)
+        response = await call
         return AIResponse(
-            success=response["success"], 
-            result=response["result"], 
-            provider_used=response.get("provider_used", "unknown")
+            success=response["success"],
+            result=response["result"],
+            provider_used=response.get("provider_used", "unknown"),
         )
+    except SupersededError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Autocomplete error: {str(e)}"
+            detail=f"Autocomplete error: {str(e)}",
         )
 
 
 @router.post("/grammar", response_model=AIResponse)
-async def check_grammar(request: GrammarRequest):
+async def check_grammar(
+    request: GrammarRequest,
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+    user: Optional[User] = Depends(get_optional_user),
+):
     try:
-        response = await ai_service.grammar_check(request.text)
+        response = await ai_service.grammar_check(
+            request.text, user_id=_user_id(user)
+        )
         return AIResponse(
-            success=response["success"], 
-            result=response["result"], 
-            provider_used=response.get("provider_used", "unknown")
+            success=response["success"],
+            result=response["result"],
+            provider_used=response.get("provider_used", "unknown"),
         )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Grammar check error: {str(e)}"
+            detail=f"Grammar check error: {str(e)}",
         )
 
 
 @router.post("/translate", response_model=AIResponse)
-async def translate_text(request: TranslateRequest):
+async def translate_text(
+    request: TranslateRequest,
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+    user: Optional[User] = Depends(get_optional_user),
+):
     """Переклад тексту"""
     try:
-        response = await ai_service.translate(request.text, request.target_language)
+        response = await ai_service.translate(
+            request.text, request.target_language, user_id=_user_id(user)
+        )
         return AIResponse(
-            success=response["success"], 
-            result=response["result"], 
-            provider_used=response.get("provider_used", "unknown")
+            success=response["success"],
+            result=response["result"],
+            provider_used=response.get("provider_used", "unknown"),
         )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Translation error: {str(e)}"
-        )
\ No newline at end of file
+            detail=f"Translation error: {str(e)}",
+        )
+
+
+@router.get("/usage", response_model=List[UsageSummaryRow])
+async def usage_summary(
+    group_by: List[UsageGroup] = Query([UsageGroup.DAY, UsageGroup.PROVIDER]),
+    days: int = Query(30, ge=1, le=366),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """The current user's AI usage over the last ``days``, per group.
+
+    Usage is written in batches, so the last minute or so may be missing.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    usage_service = UsageService(db)
+    return await usage_service.summarize(
+        current_user.id,
+        [group.value for group in dict.fromkeys(group_by)],
+        since,
+    )
+
+
+def _user_id(user: Optional[User]) -> Optional[int]:
+    """Who AI usage is recorded for; None for anonymous requests"""
+    return user.id if user is not None else None
+
+
+def _preferred(request: AutocompleteRequest):
+    if request.preferred_provider is None:
+        return None
+    return AIProvider(request.preferred_provider.value)
+
+
+def _supersede_key(
+    user: Optional[User], request: AutocompleteRequest
+) -> Optional[Hashable]:
+    """Requests sharing this key replace each other; None opts out.
+
+    Keys are scoped to the signed-in user, so nobody can cancel another
+    user's requests by sending their session or note id. Anonymous
+    requests have nothing to scope them by but an address a proxy may
+    share, so they are never superseded.
+    """
+    if user is None:
+        return None
+    if request.session_id is None and request.note_id is None:
+        return None
+    return ("autocomplete", user.id, request.session_id, request.note_id)
+
+
+async def _stream_events(
+    ai_service: UnifiedAIService,
+    request: AutocompleteRequest,
+    key: Optional[Hashable] = None,
+    user_id: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    events = ai_service.stream_autocomplete(
+        request.text, _preferred(request), user_id
+    )
+    if key is not None:
+        events = ai_service.autocomplete_requests.iterate(key, events)
+    try:
+        async for event in events:
+            yield event
+    except SupersededError:
+        yield {"event": "superseded"}
+    except Exception as e:
+        yield {"event": "error", "detail": f"Autocomplete error: {str(e)}"}
+
+
+@router.post("/autocomplete/stream")
+async def stream_autocomplete(
+    request: AutocompleteRequest,
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+    user: Optional[User] = Depends(get_optional_user),
+):
+    """Autocomplete as Server-Sent Events.
+
+    Events: ``provider`` (with time to first token), one ``token`` per
+    piece of text, then ``done`` or ``error``. A newer request for the
+    same session and note from the same user ends the stream with
+    ``superseded``.
+    """
+    key = _supersede_key(user, request)
+
+    return _sse_response(
+        _stream_events(ai_service, request, key, _user_id(user))
+    )
+
+
+def _sse_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    async def body():
+        async for event in events:
+            name = event.pop("event")
+            yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _progress_events(
+    run: Callable[..., Awaitable[Dict[str, Any]]], error_prefix: str
+) -> AsyncIterator[Dict[str, Any]]:
+    """Events of a chunked operation: progress..., then result or error"""
+    events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(
+        run(
+            progress=lambda done, total: events.put_nowait(
+                {"event": "progress", "done": done, "total": total}
+            )
+        )
+    )
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+        response = task.result()
+        yield {
+            "event": "result",
+            "result": response["result"],
+            "provider_used": response.get("provider_used", "unknown"),
+        }
+    except Exception as e:
+        yield {"event": "error", "detail": f"{error_prefix}: {str(e)}"}
+    finally:
+        task.cancel()
+
+
+@router.post("/grammar/stream")
+async def stream_grammar(
+    request: GrammarRequest,
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+    user: Optional[User] = Depends(get_optional_user),
+):
+    """Grammar check as Server-Sent Events.
+
+    Long texts are checked in chunks; a ``progress`` event follows each
+    chunk, then ``result`` or ``error``.
+    """
+    return _sse_response(
+        _progress_events(
+            partial(
+                ai_service.grammar_check, request.text, user_id=_user_id(user)
+            ),
+            "Grammar check error",
+        )
+    )
+
+
+@router.post("/translate/stream")
+async def stream_translate(
+    request: TranslateRequest,
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+    user: Optional[User] = Depends(get_optional_user),
+):
+    """Translation as Server-Sent Events, reported like /grammar/stream"""
+    return _sse_response(
+        _progress_events(
+            partial(
+                ai_service.translate,
+                request.text,
+                request.target_language,
+                user_id=_user_id(user),
+            ),
+            "Translation error",
+        )
+    )
+
+
+@router.websocket("/autocomplete/ws")
+async def autocomplete_websocket(
+    websocket: WebSocket,
+    ai_service: UnifiedAIService = Depends(get_ai_service),
+    user: Optional[User] = Depends(get_optional_user),
+):
+    """Autocomplete over a WebSocket.
+
+    Each message is an autocomplete request; the reply is the same
+    sequence of events as the SSE endpoint, one JSON message per event.
+    A new message supersedes the request still streaming on the socket.
+    """
+
+    async def send_events(request, key):
+        async for event in _stream_events(
+            ai_service, request, key, _user_id(user)
+        ):
+            await websocket.send_json(event)
+
+    await websocket.accept()
+    streaming = set()
+    try:
+        while True:
+            try:
+                request = AutocompleteRequest.model_validate_json(
+                    await websocket.receive_text()
+                )
+            except ValidationError as e:
+                await websocket.send_json(
+                    {"event": "error", "detail": e.errors()[0]["msg"]}
+                )
+                continue
+            key = _supersede_key(user, request) or (
+                "websocket",
+                id(websocket),
+            )
+            task = asyncio.create_task(send_events(request, key))
+            streaming.add(task)
+            task.add_done_callback(streaming.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in streaming:
+            task.cancel()
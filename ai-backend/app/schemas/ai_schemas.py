@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional
+from datetime import date
 from enum import Enum
 
 
@@ -12,6 +13,10 @@ class AIProviderEnum(str, Enum):
 class AutocompleteRequest(BaseModel):
     text: str
     preferred_provider: Optional[AIProviderEnum] = None
+    # A newer request from the same signed-in user with the same session
+    # and note cancels this one
+    session_id: Optional[str] = None
+    note_id: Optional[int] = None
 
 
 class GrammarRequest(BaseModel):
@@ -28,4 +33,23 @@ class TranslateRequest(BaseModel):
 class AIResponse(BaseModel):
     success: bool
     result: str
-    provider_used: Optional[str] = None
\ No newline at end of file
+    provider_used: Optional[str] = None
+
+
+class UsageGroup(str, Enum):
+    DAY = "day"
+    PROVIDER = "provider"
+    OPERATION = "operation"
+
+
+class UsageSummaryRow(BaseModel):
+    # Only the fields grouped by are set
+    day: Optional[date] = None
+    provider: Optional[str] = None
+    operation: Optional[str] = None
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    errors: int
+    avg_latency_ms: float
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
 from datetime import datetime
-from typing import Optional
+from enum import Enum
+from typing import Annotated, List, Literal, Optional, Union
 
 
 class NoteBase(BaseModel):
@@ -22,12 +23,51 @@ class NoteResponse(NoteBase):
     user_id: int = Field(..., description="Owner user id")
     created_at: datetime = Field(..., description="Creation date")
     updated_at: datetime = Field(..., description="Last update date")
+    version: int = Field(..., description="Version, bumped by every update")
 
     model_config = ConfigDict(
         from_attributes=True, json_encoders={datetime: lambda v: v.isoformat()}
     )
 
 
+class InsertOp(BaseModel):
+    op: Literal["insert"]
+    pos: int = Field(..., ge=0, description="Offset to insert at")
+    text: str = Field(..., description="Text to insert")
+
+
+class DeleteOp(BaseModel):
+    op: Literal["delete"]
+    pos: int = Field(..., ge=0, description="Offset of the first character")
+    count: int = Field(..., ge=1, description="Number of characters")
+
+
+TextOp = Annotated[Union[InsertOp, DeleteOp], Field(discriminator="op")]
+
+
+class NotePatch(BaseModel):
+    base_version: int = Field(
+        ..., description="Version of the note the operations were made on"
+    )
+    ops: List[TextOp] = Field(
+        default_factory=list,
+        max_length=1000,
+        description=(
+            "Applied in order, each to the result of the previous one; "
+            "offsets count Unicode code points"
+        ),
+    )
+    title: Optional[str] = Field(None, description="Updated note title")
+
+
+class NotePatchResponse(BaseModel):
+    id: int = Field(..., description="Unique note id")
+    version: int = Field(..., description="Version after the update")
+    updated_at: datetime = Field(..., description="Last update date")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class NoteInDb(NoteBase):
     id: int
     user_id: int
@@ -35,3 +75,58 @@ class NoteInDb(NoteBase):
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class NoteView(str, Enum):
+    FULL = "full"
+    LIST = "list"
+
+
+class NoteSummary(BaseModel):
+    id: int = Field(..., description="Unique note id")
+    title: str = Field(..., description="Note title")
+    updated_at: datetime = Field(..., description="Last update date")
+    preview: str = Field("", description="Start of the note content")
+
+
+class NotePage(BaseModel):
+    items: List[Union[NoteSummary, NoteResponse]]
+    next_cursor: Optional[str] = Field(
+        None, description="Cursor of the next page; None on the last page"
+    )
+
+
+class NoteSearchHit(BaseModel):
+    id: int = Field(..., description="Unique note id")
+    title: str = Field(..., description="Title with matches highlighted")
+    snippet: str = Field(..., description="Content around the matches")
+    updated_at: datetime = Field(..., description="Last update date")
+    rank: float = Field(..., description="Relevance; higher is better")
+
+
+class NoteSearchPage(BaseModel):
+    items: List[NoteSearchHit]
+    next_offset: Optional[int] = Field(
+        None, description="Offset of the next page; None on the last page"
+    )
+
+
+class NoteVersionCreate(BaseModel):
+    change_description: Optional[str] = Field(
+        None, max_length=255, description="What changed"
+    )
+
+
+class NoteVersionSummary(BaseModel):
+    version_number: int = Field(..., description="Number of the version")
+    created_at: datetime = Field(..., description="Creation date")
+    is_auto_save: bool = Field(..., description="Recorded by a save")
+    change_description: Optional[str] = Field(None, description="What changed")
+    content_hash: Optional[str] = Field(None, description="sha256 of content")
+    size: Optional[int] = Field(None, description="Characters of content")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class NoteVersionResponse(NoteVersionSummary):
+    content: str = Field(..., description="Note content in markdown")
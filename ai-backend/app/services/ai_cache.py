@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.cache import LRUCache
+
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(24 * 60 * 60)))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "4096"))
+AI_CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# SQLite file keeping results across restarts; empty keeps them in memory
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "")
+# Autocomplete is sampled and expected to vary, so it isn't cached
+AI_CACHE_OPERATIONS = frozenset(
+    op.strip()
+    for op in os.getenv("AI_CACHE_OPERATIONS", "grammar,translate").split(",")
+    if op.strip()
+)
+
+# Entries in memory: (expires_at, result, tokens)
+Entry = Tuple[float, str, int]
+
+
+def normalize_text(text: str) -> str:
+    # Only differences that can't change the result: line endings and
+    # surrounding whitespace, which results are stripped of anyway.
+    return text.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+class _DiskStore:
+    """SQLite table backing the in-memory cache across restarts"""
+
+    # Expired and excess rows are pruned every this many writes
+    PRUNE_EVERY = 64
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+            "tokens INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, result, tokens FROM ai_cache "
+                "WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def set(self, key: str, entry: Entry) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_cache "
+                "(key, expires_at, result, tokens) VALUES (?, ?, ?, ?)",
+                (key, *entry),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self) -> None:
+        self._conn.execute(
+            "DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),)
+        )
+        # Entries closest to expiry go first
+        self._conn.execute(
+            "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache "
+            "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_cache")
+
+
+class AICache:
+    """Results of AI operations keyed by operation, input and model.
+
+    Entries expire after ``ttl`` seconds and the in-memory tier is bounded
+    by entry count and size. With a ``path`` results are also written to a
+    SQLite file, so they survive restarts; memory misses fall back to it.
+    """
+
+    def __init__(
+        self,
+        ttl: float = AI_CACHE_TTL,
+        max_entries: int = AI_CACHE_MAX_ENTRIES,
+        max_bytes: int = AI_CACHE_MAX_BYTES,
+        path: str = AI_CACHE_PATH,
+        operations=AI_CACHE_OPERATIONS,
+    ):
+        self.ttl = ttl
+        self.operations = frozenset(operations)
+        self._memory = LRUCache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            sizeof=lambda entry: len(entry[1]) * 2 + 64,
+        )
+        self._disk = _DiskStore(path, max_entries) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    def enabled_for(self, operation: str) -> bool:
+        return self.ttl > 0 and operation in self.operations
+
+    @staticmethod
+    def key(
+        operation: str,
+        text: str,
+        target_language: Optional[str],
+        provider: str,
+        model: str,
+    ) -> str:
+        parts = [
+            operation,
+            normalize_text(text),
+            target_language or "",
+            provider,
+            model,
+        ]
+        return hashlib.sha256(
+            json.dumps(parts, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[Entry]:
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] <= time.time():
+            self._memory.pop(key)
+            entry = None
+        if entry is None and self._disk is not None:
+            entry = self._disk.get(key)
+            if entry is not None:
+                self._memory.set(key, entry)
+        return entry
+
+    def peek(self, key: str) -> Optional[str]:
+        """Look up a result without counting a miss"""
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        self.tokens_saved += entry[2]
+        return entry[1]
+
+    def get(self, key: str) -> Optional[str]:
+        result = self.peek(key)
+        if result is None:
+            self.misses += 1
+        return result
+
+    def record_miss(self) -> None:
+        self.misses += 1
+
+    def set(self, key: str, result: str, tokens: int = 0) -> None:
+        entry = (time.time() + self.ttl, result, tokens)
+        self._memory.set(key, entry)
+        if self._disk is not None:
+            self._disk.set(key, entry)
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        memory = self._memory.stats()
+        return {
+            "entries": memory["entries"],
+            "bytes": memory["bytes"],
+            "persistent": self._disk is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+ai_cache = AICache()
@@ -0,0 +1,119 @@
+import bisect
+import os
+import re
+from typing import List, NamedTuple, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+
+# Upper bound on the text sent in one prompt; about 1500 tokens of English
+AI_CHUNK_MAX_CHARS = int(os.getenv("AI_CHUNK_MAX_CHARS", "6000"))
+
+_FENCE_RE = FencedBlockPreprocessor.FENCED_BLOCK_RE
+_BLANK_LINES_RE = re.compile(r'\n(?:[ \t]*\n)+')
+_HEADING_RE = re.compile(r'[ ]{0,3}#{1,6}(?:[ \t]|$)')
+_TABLE_ROW_RE = re.compile(r'^[ ]{0,3}\|', re.MULTILINE)
+
+
+class Chunk(NamedTuple):
+    """A piece of a document and the whitespace around it.
+
+    ``prefix + text + suffix`` of every chunk, in order, is the original
+    document; only ``text`` is sent to the model. ``text`` is empty only
+    in the one chunk of a document that is all whitespace.
+    """
+
+    prefix: str
+    text: str
+    suffix: str
+
+
+def _blocks(text: str) -> List[Tuple[str, str]]:
+    """Split at blank lines outside fenced code: (block, separator) pairs"""
+    spans = [m.span() for m in _FENCE_RE.finditer(text)]
+    starts = [start for start, _ in spans]
+    blocks = []
+    position = 0
+    for match in _BLANK_LINES_RE.finditer(text):
+        i = bisect.bisect_right(starts, match.start()) - 1
+        if i >= 0 and match.start() < spans[i][1]:
+            continue
+        blocks.append((text[position : match.start()], match.group()))
+        position = match.end()
+    blocks.append((text[position:], ""))
+    return blocks
+
+
+def _atomic(block: str) -> bool:
+    # Code and tables are sent whole even when too long: a split would
+    # hand the model half a table or half a code block.
+    return bool(_FENCE_RE.search(block) or _TABLE_ROW_RE.search(block))
+
+
+def _chunk(text: str) -> Chunk:
+    core = text.strip()
+    if not core:
+        return Chunk(text, "", "")
+    start = text.index(core)
+    return Chunk(text[:start], core, text[start + len(core) :])
+
+
+def split_markdown(
+    text: str, max_chars: int = AI_CHUNK_MAX_CHARS
+) -> List[Chunk]:
+    """Split Markdown into chunks of at most ``max_chars`` characters.
+
+    Chunks end at blank lines and preferably before headings. Fenced code
+    and tables are never split; a single paragraph longer than
+    ``max_chars`` is split at line and sentence boundaries.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=max_chars,
+        chunk_overlap=0,
+        separators=["\n", ". ", " ", ""],
+        keep_separator="end",
+        strip_whitespace=False,
+    )
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    size = 0
+    # Whitespace not yet part of a chunk; it becomes the next one's prefix
+    blank = ""
+
+    def add(piece: str):
+        nonlocal blank
+        chunk = _chunk(blank + piece)
+        if chunk.text:
+            chunks.append(chunk)
+            blank = ""
+        else:
+            blank = chunk.prefix
+
+    def flush():
+        nonlocal current, size
+        if current:
+            add("".join(current))
+        current, size = [], 0
+
+    for block, separator in _blocks(text):
+        if len(block) > max_chars and not _atomic(block):
+            flush()
+            pieces = splitter.split_text(block)
+            for piece in pieces[:-1]:
+                add(piece)
+            block = pieces[-1] if pieces else ""
+        elif current and (
+            size + len(block) > max_chars
+            or (_HEADING_RE.match(block) and size >= max_chars // 2)
+        ):
+            flush()
+        current.append(block + separator)
+        size += len(block) + len(separator)
+    flush()
+    if blank:
+        if chunks:
+            prefix, core, suffix = chunks[-1]
+            chunks[-1] = Chunk(prefix, core, suffix + blank)
+        else:
+            chunks.append(Chunk(blank, "", ""))
+    return chunks
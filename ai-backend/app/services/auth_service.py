@@ -1,5 +1,8 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -7,25 +10,84 @@ from sqlalchemy import select
 
 from app.models.user import User
 from app.schemas.user import UserCreate
+from app.services.user_cache import user_cache
 
 SECRET_KEY = "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor; stored hashes with a different cost are rehashed on
+# the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Upper bound on bcrypt computations running at the same time
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Upper bound on computations queued or running; a request waits at most
+# PASSWORD_HASH_WAIT seconds for room before it is turned away
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+PASSWORD_HASH_WAIT = float(os.getenv("PASSWORD_HASH_WAIT", "2"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "2"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a small dedicated pool keeps hashing off the
+# event loop without letting a login burst take every CPU.
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+_password_slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+class PasswordHashBusyError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Too many password checks in progress")
+        self.retry_after = retry_after
+
+
+async def _run_password_hash(fn, *args):
+    try:
+        await asyncio.wait_for(_password_slots.acquire(), PASSWORD_HASH_WAIT)
+    except asyncio.TimeoutError:
+        raise PasswordHashBusyError(PASSWORD_HASH_RETRY_AFTER)
+    loop = asyncio.get_running_loop()
+    try:
+        future = _password_executor.submit(fn, *args)
+    except BaseException:
+        _password_slots.release()
+        raise
+    # Freed when the hash really finishes, not when the caller gives up,
+    # so abandoned requests still count against the bound.
+    future.add_done_callback(
+        lambda _: loop.call_soon_threadsafe(_password_slots.release)
+    )
+    return await asyncio.wrap_future(future)
 
 
 class AuthService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    def verify_password(
+    async def verify_password(
         self, plain_password: str, hashed_password: str
     ) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+        return await _run_password_hash(
+            pwd_context.verify, plain_password, hashed_password
+        )
+
+    async def verify_and_update_password(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        return await _run_password_hash(
+            pwd_context.verify_and_update, plain_password, hashed_password
+        )
 
-    def get_password_hash(self, password: str) -> str:
-        return pwd_context.hash(password)
+    async def get_password_hash(self, password: str) -> str:
+        return await _run_password_hash(pwd_context.hash, password)
 
     def create_access_token(
         self, data: dict, expires_delta: Optional[timedelta] = None
@@ -50,13 +112,16 @@ class AuthService:
         existing_user = await self.get_user_by_email(user_data.email)
         if existing_user:
             raise ValueError("User with this email already exists")
+        # Nothing to write yet: hand the connection back while bcrypt runs
+        await self.db.commit()
 
-        hashed_password = self.get_password_hash(user_data.password)
+        hashed_password = await self.get_password_hash(user_data.password)
         db_user = User(email=user_data.email, password_hash=hashed_password)
 
         self.db.add(db_user)
         await self.db.commit()
         await self.db.refresh(db_user)
+        user_cache.invalidate(db_user.email)
         return db_user
 
     async def authenticate_user(
@@ -65,6 +130,15 @@ class AuthService:
         user = await self.get_user_by_email(email)
         if not user:
             return None
-        if not self.verify_password(password, user.password_hash):
+        # Nothing to write yet: hand the connection back while bcrypt runs
+        await self.db.commit()
+        valid, new_hash = await self.verify_and_update_password(
+            password, user.password_hash
+        )
+        if not valid:
             return None
+        if new_hash:
+            user.password_hash = new_hash
+            await self.db.commit()
+            user_cache.invalidate(user.email)
         return user
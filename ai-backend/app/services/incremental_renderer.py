@@ -0,0 +1,287 @@
+import bisect
+import hashlib
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import markdown
+from markdown.extensions.abbr import AbbrExtension
+from markdown.extensions.def_list import DefListProcessor
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from markdown.util import ETX, STX
+
+from app.core.cache import LRUCache
+from app.services.markdown_renderer import (
+    TAB_LENGTH,
+    content_key,
+    markdown_pool,
+    render_markdown,
+)
+
+# Below this size a full render is cheaper than splitting and hashing;
+# 0 disables incremental rendering.
+INCREMENTAL_RENDER_MIN_SIZE = int(
+    os.getenv("INCREMENTAL_RENDER_MIN_SIZE", "65536")
+)
+# Streamed responses are flushed in pieces of about this many characters.
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "16384"))
+BLOCK_CACHE_MAX_ENTRIES = int(os.getenv("BLOCK_CACHE_MAX_ENTRIES", "20000"))
+BLOCK_CACHE_MAX_BYTES = int(
+    os.getenv("BLOCK_CACHE_MAX_BYTES", str(128 * 1024 * 1024))
+)
+
+_FENCE_RE = FencedBlockPreprocessor.FENCED_BLOCK_RE
+_DEF_LIST_RE = DefListProcessor.RE
+_DEF_TERMLESS_RE = re.compile(r'[ ]{0,3}:[ ]{1,3}')
+_LIST_ITEM_RE = re.compile(r'^(?:\d+\.|[*+-])[ ]')
+_HTML_RE = re.compile(r'^[ ]*<|<!--', re.MULTILINE)
+_ABBR_DELETE_RE = re.compile(
+    r'^[*]\[[^\\]*?\][ ]?:[ ]*\n?[ ]*(""|\'\')[ ]*$', re.MULTILINE
+)
+# Anything that could be a reference or abbreviation definition
+_DEFINITION_RE = re.compile(r'\][ ]?:')
+# A first line of only indentation, then a blank line: an empty code
+# block, which rendered on its own would be dropped as blank input
+_LEADING_BLANK_CODE_RE = re.compile(r'[ ]{%d,}\n\n' % TAB_LENGTH)
+
+Definitions = Tuple[Dict[str, tuple], Dict[str, str]]
+_NO_DEFINITIONS: Definitions = ({}, {})
+
+
+def _normalize(text: str) -> str:
+    # Same normalisation Markdown applies before parsing, so block
+    # boundaries found here are the ones the block parser sees.
+    text = text.replace(STX, "").replace(ETX, "")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = text.expandtabs(TAB_LENGTH)
+    return re.sub(r'(?<=\n) +\n', '\n', text)
+
+
+def _fenced_spans(text: str) -> List[Tuple[int, int]]:
+    return [m.span() for m in _FENCE_RE.finditer(text)]
+
+
+def _in_spans(spans: List[Tuple[int, int]], pos: int) -> bool:
+    i = bisect.bisect_right(spans, (pos, float("inf"))) - 1
+    return i >= 0 and spans[i][0] <= pos < spans[i][1]
+
+
+def _needs_full_render(text: str, spans: List[Tuple[int, int]]) -> bool:
+    # Footnotes are numbered and collected across the whole document, and
+    # raw HTML blocks may span blank lines.
+    if (
+        "[^" in text
+        or _ABBR_DELETE_RE.search(text)
+        or _LEADING_BLANK_CODE_RE.match(text)
+    ):
+        return True
+    return any(not _in_spans(spans, m.start()) for m in _HTML_RE.finditer(text))
+
+
+def iter_blocks(
+    text: str, spans: Optional[List[Tuple[int, int]]] = None
+) -> Iterator[str]:
+    """Split normalised Markdown into chunks that render independently.
+
+    Chunks are cut at blank lines, except where the block parser would
+    attach the next block to the previous one: indented continuations,
+    list items, block quotes, definition lists, blocks following link or
+    abbreviation definitions, blank lines padding an indented code block,
+    and fenced code blocks containing blank lines. Chunks are produced
+    lazily so callers can start rendering before the whole note is split.
+    """
+    lines = text.split("\n")
+    line_starts = [0]
+    for line in lines[:-1]:
+        line_starts.append(line_starts[-1] + len(line) + 1)
+
+    fence_ends = {}
+    for start, end in _fenced_spans(text) if spans is None else spans:
+        first = bisect.bisect_right(line_starts, start) - 1
+        last = bisect.bisect_right(line_starts, max(start, end - 1)) - 1
+        fence_ends[first] = last
+
+    # The last two chunks stay open: a following block may still be
+    # merged into them.
+    chunks: List[Tuple[int, int]] = []
+    i, n = 0, len(lines)
+    while i < n:
+        if lines[i] == "":
+            i += 1
+            continue
+        start = i
+        while i < n and lines[i] != "":
+            i = fence_ends.get(i, i) + 1
+
+        block = "\n".join(lines[start:i])
+        if _DEF_TERMLESS_RE.match(block) and len(chunks) > 1:
+            # The definition takes the previous paragraph as its term and
+            # joins a definition list right before that paragraph.
+            chunks[-2:] = [(chunks[-2][0], chunks[-1][1])]
+        if chunks and _continues_previous(lines, chunks[-1], block, start):
+            chunks[-1] = (chunks[-1][0], i)
+        else:
+            chunks.append((start, i))
+        if len(chunks) > 2:
+            first, last = chunks.pop(0)
+            yield "\n".join(lines[first:last])
+
+    for first, last in chunks:
+        yield "\n".join(lines[first:last])
+
+
+def _continues_previous(
+    lines: List[str], previous: Tuple[int, int], block: str, start: int
+) -> bool:
+    if block.startswith((" ", ">")) or _LIST_ITEM_RE.match(block):
+        return True
+    # Definitions render to nothing, so whatever follows them attaches to
+    # the block before; keep them with it.
+    if _DEF_LIST_RE.search(block) or _DEFINITION_RE.search(block):
+        return True
+    previous_end = previous[1]
+    # Extra blank lines after an indented code block become part of it
+    return start - previous_end > 1 and lines[previous_end - 1].startswith(" ")
+
+
+def _abbreviations(md: markdown.Markdown) -> Dict[str, str]:
+    for extension in md.registeredExtensions:
+        if isinstance(extension, AbbrExtension):
+            return extension.abbrs
+    return {}
+
+
+class IncrementalRenderer:
+    """Renders large notes block by block, reusing unchanged blocks.
+
+    Block HTML is cached by block hash together with a hash of the
+    document's reference links and abbreviations, which are the only
+    definitions from the ``extra`` extension that affect other blocks.
+    Documents using constructs that can't be rendered piecewise
+    (footnotes, raw HTML blocks) fall back to a full render, so the output
+    always matches ``render_markdown`` byte for byte.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = BLOCK_CACHE_MAX_ENTRIES,
+        max_bytes: int = BLOCK_CACHE_MAX_BYTES,
+    ):
+        self._html = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self._definitions = LRUCache(max_entries=max_entries)
+        self.full_renders = 0
+        self.blocks_rendered = 0
+
+    def render(self, content: str) -> str:
+        return "".join(self.iter_render(content))
+
+    def iter_render(self, content: str) -> Iterator[str]:
+        """Yield the rendered HTML of ``content`` piece by piece"""
+        text = _normalize(content)
+        spans = _fenced_spans(text)
+        definitions: Optional[Definitions] = _NO_DEFINITIONS
+        full_render = _needs_full_render(text, spans)
+        if not full_render and _DEFINITION_RE.search(text):
+            definitions = self._collect_definitions(iter_blocks(text, spans))
+            full_render = definitions is None
+        if full_render:
+            self.full_renders += 1
+            yield render_markdown(content)
+            return
+
+        context_key = self._context_key(definitions)
+        separator = ""
+        for block in iter_blocks(text, spans):
+            key = (content_key(block), context_key)
+            html = self._html.get(key)
+            if html is None:
+                html, _ = self._render_block(block, definitions)
+                self._html.set(key, html)
+            if html:
+                yield separator + html
+                separator = "\n"
+
+    def _render_block(
+        self, block: str, definitions: Definitions
+    ) -> Tuple[str, Definitions]:
+        self.blocks_rendered += 1
+        with markdown_pool.acquire() as md:
+            references, abbreviations = definitions
+            md.references.update(references)
+            abbrs = _abbreviations(md)
+            abbrs.update(abbreviations)
+            html = md.convert(block)
+            return html, (dict(md.references), dict(abbrs))
+
+    def _collect_definitions(
+        self, blocks: Iterable[str]
+    ) -> Optional[Definitions]:
+        references: Dict[str, tuple] = {}
+        abbreviations: Dict[str, str] = {}
+        for block in blocks:
+            if not _DEFINITION_RE.search(block):
+                continue
+            block_key = content_key(block)
+            found = self._definitions.get(block_key)
+            if found is None:
+                html, found = self._render_block(block, _NO_DEFINITIONS)
+                self._definitions.set(block_key, found)
+                self._html.set((block_key, self._context_key(None)), html)
+            for merged, new in zip((references, abbreviations), found):
+                for name, value in new.items():
+                    # Redefinitions resolve by document order, which a
+                    # per-block render can't reproduce
+                    if merged.get(name, value) != value:
+                        return None
+                    merged[name] = value
+        return references, abbreviations
+
+    @staticmethod
+    def _context_key(definitions: Optional[Definitions]) -> str:
+        if not definitions or definitions == _NO_DEFINITIONS:
+            return ""
+        references, abbreviations = definitions
+        return hashlib.sha256(
+            repr(
+                (sorted(references.items()), sorted(abbreviations.items()))
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "blocks": self._html.stats(),
+            "blocks_rendered": self.blocks_rendered,
+            "full_renders": self.full_renders,
+        }
+
+
+incremental_renderer = IncrementalRenderer()
+
+
+def use_incremental(content: str) -> bool:
+    return 0 < INCREMENTAL_RENDER_MIN_SIZE <= len(content)
+
+
+def render_note_html(content: str) -> str:
+    if use_incremental(content):
+        return incremental_renderer.render(content)
+    return render_markdown(content)
+
+
+def iter_note_html(
+    content: str, chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[str]:
+    if not use_incremental(content):
+        yield render_markdown(content)
+        return
+
+    buffer: List[str] = []
+    size = 0
+    for piece in incremental_renderer.iter_render(content):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set
+
+import markdown
+
+from app.core.cache import LRUCache
+
+MARKDOWN_EXTENSIONS = (
+    'markdown.extensions.extra',  # Tables, footnotes, etc.
+    'markdown.extensions.nl2br',  # Convert newlines to <br>
+    'markdown.extensions.fenced_code',  # Code blocks
+    'markdown.extensions.tables',  # Table support
+)
+TAB_LENGTH = 4
+
+MARKDOWN_POOL_SIZE = int(os.getenv("MARKDOWN_POOL_SIZE", "8"))
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "512"))
+RENDER_CACHE_MAX_BYTES = int(
+    os.getenv("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+
+# Part of every cache key, so changing the extension set never serves
+# HTML rendered with the old configuration.
+_RENDER_CONFIG_KEY = "\0".join(
+    MARKDOWN_EXTENSIONS + (f"tab_length={TAB_LENGTH}",)
+).encode("utf-8")
+
+
+class MarkdownPool:
+    """Pool of preconfigured Markdown instances.
+
+    Building a Markdown instance loads and registers every extension, which
+    dominates the cost of rendering small notes. Instances are reset and
+    returned to the pool after each conversion; the queue makes acquiring
+    one safe from concurrent threads, and extra instances are created on
+    demand when the pool is empty.
+    """
+
+    def __init__(self, max_size: int = MARKDOWN_POOL_SIZE):
+        self.max_size = max_size
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=max_size)
+        self.created = 0
+
+    def _create(self) -> markdown.Markdown:
+        self.created += 1
+        return markdown.Markdown(
+            extensions=list(MARKDOWN_EXTENSIONS), tab_length=TAB_LENGTH
+        )
+
+    @contextmanager
+    def acquire(self) -> Iterator[markdown.Markdown]:
+        try:
+            md = self._idle.get_nowait()
+        except queue.Empty:
+            md = self._create()
+
+        # If the conversion raises, the instance may be left half-way
+        # through a document and is dropped instead of being pooled.
+        yield md
+        md.reset()
+        try:
+            self._idle.put_nowait(md)
+        except queue.Full:
+            pass
+
+    def convert(self, content: str) -> str:
+        with self.acquire() as md:
+            return md.convert(content)
+
+
+markdown_pool = MarkdownPool()
+
+
+def render_markdown(content: str) -> str:
+    return markdown_pool.convert(content)
+
+
+def content_key(content: str) -> str:
+    digest = hashlib.sha256(_RENDER_CONFIG_KEY)
+    digest.update(b"\0")
+    digest.update(content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Rendered HTML keyed by content hash, with per-note invalidation.
+
+    Notes with identical content share one entry; an entry is dropped once
+    no note references it any more. Which note uses which entry is only
+    tracked while the entry is cached, so the bookkeeping is bounded by
+    the cache too.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RENDER_CACHE_MAX_ENTRIES,
+        max_bytes: int = RENDER_CACHE_MAX_BYTES,
+    ):
+        self._cache = LRUCache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            on_evict=self._evicted,
+        )
+        self._note_keys: Dict[int, str] = {}
+        self._key_notes: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, note_id: int, key: str) -> Optional[str]:
+        html = self._cache.get(key)
+        if html is not None:
+            self._track(note_id, key)
+        return html
+
+    def put(self, note_id: int, key: str, html: str) -> None:
+        self._track(note_id, key)
+        self._cache.set(key, html)
+
+    def invalidate(self, note_id: int) -> None:
+        with self._lock:
+            key = self._note_keys.pop(note_id, None)
+            if key is not None:
+                self._release(note_id, key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._note_keys.clear()
+            self._key_notes.clear()
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, object]:
+        return {**self._cache.stats(), "notes": len(self._note_keys)}
+
+    def _track(self, note_id: int, key: str) -> None:
+        with self._lock:
+            previous = self._note_keys.get(note_id)
+            if previous == key:
+                return
+            if previous is not None:
+                self._release(note_id, previous)
+            self._note_keys[note_id] = key
+            self._key_notes.setdefault(key, set()).add(note_id)
+
+    def _release(self, note_id: int, key: str) -> None:
+        notes = self._key_notes.get(key)
+        if notes is None:
+            return
+        notes.discard(note_id)
+        if not notes:
+            del self._key_notes[key]
+            self._cache.pop(key)
+
+    def _evicted(self, key: str) -> None:
+        with self._lock:
+            for note_id in self._key_notes.pop(key, ()):
+                if self._note_keys.get(note_id) == key:
+                    del self._note_keys[note_id]
+
+
+render_cache = RenderCache()
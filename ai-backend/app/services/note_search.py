@@ -0,0 +1,377 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, Float, Integer, String, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.compressed_text import SQLITE_CONTENT
+from app.models.note import Note
+
+# Words of a search query beyond this are ignored
+NOTE_SEARCH_MAX_TERMS = int(os.getenv("NOTE_SEARCH_MAX_TERMS", "16"))
+# Length of the content snippet around the matches, in words
+NOTE_SEARCH_SNIPPET_WORDS = int(os.getenv("NOTE_SEARCH_SNIPPET_WORDS", "16"))
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+_TERM_RE = re.compile(r'"([^"]*)"?|(\S+)')
+_WORD_RE = re.compile(r"\w+")
+
+# Words of a phrase, and whether its last word is a prefix
+Term = Tuple[List[str], bool]
+
+
+class SearchUnavailableError(Exception):
+    pass
+
+
+def parse_query(query: str) -> List[Term]:
+    """Terms of a search query.
+
+    Words and "quoted phrases" must all match; a trailing ``*`` makes the
+    last word a prefix. Punctuation only separates words, so user input
+    can't inject query syntax.
+    """
+    terms: List[Term] = []
+    for match in _TERM_RE.finditer(query):
+        phrase, bare = match.groups()
+        source = phrase if phrase is not None else bare
+        words = _WORD_RE.findall(source.lower())
+        if not words:
+            continue
+        prefix = phrase is None and bare.endswith("*")
+        terms.append((words, prefix))
+        if sum(len(words) for words, _ in terms) >= NOTE_SEARCH_MAX_TERMS:
+            break
+    return terms
+
+
+class _SQLiteIndex:
+    """FTS5 table ``notes_fts`` indexing the title and content of every note.
+
+    The table stores only the index. Its external content is the
+    ``notes_fts_source`` view, which reads the text from ``notes``
+    through ``note_text`` so snippets work whatever form content is
+    stored in (see CompressedText). Triggers on ``notes`` keep it
+    current: FTS5 can only remove a row given the text it was indexed
+    with, which only a trigger still sees once the row has changed. The
+    owner is an indexed column holding a token per user that every
+    query matches too, so a search only visits the user's notes.
+    """
+
+    SOURCE = (
+        "CREATE VIEW notes_fts_source AS "
+        f"SELECT id, title, coalesce({SQLITE_CONTENT}, '') AS content, "
+        "'u' || user_id AS owner FROM notes"
+    )
+    TRIGGERS = {
+        "notes_fts_insert": "AFTER INSERT ON notes BEGIN {insert} END",
+        "notes_fts_update": (
+            "AFTER UPDATE OF title, content, user_id ON notes "
+            "BEGIN {delete} {insert} END"
+        ),
+        "notes_fts_delete": "AFTER DELETE ON notes BEGIN {delete} END",
+    }
+    INSERT = (
+        "INSERT INTO notes_fts (rowid, title, content, owner) VALUES ("
+        "new.id, new.title, coalesce(note_text(new.content), ''), "
+        "'u' || new.user_id);"
+    )
+    DELETE = (
+        "INSERT INTO notes_fts (notes_fts, rowid, title, content, owner) "
+        "VALUES ('delete', old.id, old.title, "
+        "coalesce(note_text(old.content), ''), 'u' || old.user_id);"
+    )
+
+    async def create(self, conn: AsyncConnection) -> None:
+        result = await conn.execute(
+            text(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE name LIKE 'notes_fts%'"
+            )
+        )
+        schema = dict(result.all())
+        sql = schema.get("notes_fts")
+        if (
+            sql is not None
+            and "notes_fts_source" in sql
+            and {"notes_fts_source", *self.TRIGGERS} <= schema.keys()
+        ):
+            return
+        if sql is not None:
+            # Made when the table kept its own copy of the text or before
+            # owners were matchable, or left without its triggers: rebuilt
+            # from the notes
+            await conn.execute(text("DROP TABLE notes_fts"))
+        await conn.execute(text("DROP VIEW IF EXISTS notes_fts_source"))
+        await conn.execute(text(self.SOURCE))
+        for name, body in self.TRIGGERS.items():
+            await conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            await conn.execute(
+                text(
+                    f"CREATE TRIGGER {name} "
+                    + body.format(insert=self.INSERT, delete=self.DELETE)
+                )
+            )
+        await conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE notes_fts USING fts5("
+                "title, content, owner, "
+                "content = 'notes_fts_source', content_rowid = 'id', "
+                "tokenize = 'unicode61 remove_diacritics 2', "
+                "prefix = '2 3')"
+            )
+        )
+        await conn.execute(
+            text("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+        )
+
+    async def index(
+        self, db: AsyncSession, note_id: int, user_id: int, title, content
+    ) -> None:
+        # Done by the triggers on notes
+        pass
+
+    async def remove(self, db: AsyncSession, note_id: int) -> None:
+        pass
+
+    @staticmethod
+    def owner(user_id: int) -> str:
+        return f"u{user_id}"
+
+    def match(self, terms: List[Term], user_id: int) -> str:
+        # The terms only match text; the owner token only the owner column
+        phrases = " ".join(
+            '"' + " ".join(words) + '"' + ("*" if prefix else "")
+            for words, prefix in terms
+        )
+        owner = self.owner(user_id)
+        return f'owner : "{owner}" AND {{title content}} : ({phrases})'
+
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        terms: List[Term],
+        limit: int,
+        offset: int,
+    ):
+        # The owner is part of MATCH, so only the user's notes are ever
+        # ranked. rank is bm25, lower for better matches, with title
+        # matches counting 10 times and the owner column not at all;
+        # sorting on it directly lets FTS5 skip work
+        query = text(
+            "SELECT n.id, n.updated_at, "
+            "highlight(notes_fts, 0, :start, :end) AS title, "
+            "snippet(notes_fts, 1, :start, :end, '…', :words) AS snippet, "
+            "-notes_fts.rank AS rank "
+            "FROM notes_fts JOIN notes AS n ON n.id = notes_fts.rowid "
+            "WHERE notes_fts MATCH :match "
+            "AND notes_fts.rank MATCH 'bm25(10.0, 1.0, 0.0)' "
+            "ORDER BY notes_fts.rank "
+            "LIMIT :limit OFFSET :offset"
+        ).columns(
+            id=Integer,
+            updated_at=DateTime,
+            title=String,
+            snippet=String,
+            rank=Float,
+        )
+        return await db.execute(
+            query,
+            {
+                "start": HIGHLIGHT_START,
+                "end": HIGHLIGHT_END,
+                "words": NOTE_SEARCH_SNIPPET_WORDS,
+                "match": self.match(terms, user_id),
+                "limit": limit,
+                "offset": offset,
+            },
+        )
+
+
+class _PostgresIndex:
+    """``note_search`` table with a GIN-indexed tsvector per note.
+
+    Like the FTS5 table it holds no copy of the text: headlines are made
+    from ``notes``. The 'simple' configuration is used since notes come
+    in any language.
+    """
+
+    DOCUMENT = (
+        "setweight(to_tsvector('simple', :title), 'A') || "
+        "setweight(to_tsvector('simple', :content), 'B')"
+    )
+
+    async def create(self, conn: AsyncConnection) -> None:
+        exists = await conn.execute(
+            text("SELECT to_regclass('note_search') IS NOT NULL")
+        )
+        if exists.scalar():
+            # Made when it kept its own copy of the text
+            await conn.execute(
+                text(
+                    "ALTER TABLE note_search "
+                    "DROP COLUMN IF EXISTS title, "
+                    "DROP COLUMN IF EXISTS content"
+                )
+            )
+            return
+        await conn.execute(
+            text(
+                "CREATE TABLE note_search ("
+                "note_id INTEGER PRIMARY KEY "
+                "REFERENCES notes (id) ON DELETE CASCADE, "
+                "user_id INTEGER NOT NULL, "
+                "document TSVECTOR NOT NULL)"
+            )
+        )
+        await conn.execute(
+            text(
+                "CREATE INDEX ix_note_search_document "
+                "ON note_search USING GIN (document)"
+            )
+        )
+        await conn.execute(
+            text("CREATE INDEX ix_note_search_user_id ON note_search (user_id)")
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO note_search "
+                "SELECT id, user_id, "
+                "setweight(to_tsvector('simple', title), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(content, '')), 'B') "
+                "FROM notes"
+            )
+        )
+
+    async def index(
+        self, db: AsyncSession, note_id: int, user_id: int, title, content
+    ) -> None:
+        await db.execute(
+            text(
+                "INSERT INTO note_search (note_id, user_id, document) "
+                f"VALUES (:id, :user_id, {self.DOCUMENT}) "
+                "ON CONFLICT (note_id) DO UPDATE SET "
+                "user_id = excluded.user_id, document = excluded.document"
+            ),
+            {
+                "id": note_id,
+                "user_id": user_id,
+                "title": title,
+                "content": content or "",
+            },
+        )
+
+    async def remove(self, db: AsyncSession, note_id: int) -> None:
+        await db.execute(
+            text("DELETE FROM note_search WHERE note_id = :id"),
+            {"id": note_id},
+        )
+
+    @staticmethod
+    def match(terms: List[Term]) -> str:
+        phrases = []
+        for words, prefix in terms:
+            if prefix:
+                words = words[:-1] + [words[-1] + ":*"]
+            phrases.append("(" + " <-> ".join(words) + ")")
+        return " & ".join(phrases)
+
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        terms: List[Term],
+        limit: int,
+        offset: int,
+    ):
+        # Headlines are costly, so only the page's rows get them
+        query = text(
+            "SELECT n.id, n.updated_at, "
+            "ts_headline('simple', n.title, hit.q, :title_options) AS title, "
+            "ts_headline('simple', coalesce(n.content, ''), hit.q, :options) "
+            "AS snippet, "
+            "hit.rank "
+            "FROM ("
+            "SELECT s.note_id, q, ts_rank_cd(s.document, q) AS rank "
+            "FROM note_search AS s, to_tsquery('simple', :match) AS q "
+            "WHERE s.user_id = :user_id AND s.document @@ q "
+            "ORDER BY rank DESC, s.note_id DESC "
+            "LIMIT :limit OFFSET :offset"
+            ") AS hit "
+            "JOIN notes AS n ON n.id = hit.note_id "
+            "ORDER BY hit.rank DESC, n.id DESC"
+        ).columns(
+            id=Integer,
+            updated_at=DateTime,
+            title=String,
+            snippet=String,
+            rank=Float,
+        )
+        marks = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}"
+        return await db.execute(
+            query,
+            {
+                "title_options": f"{marks}, HighlightAll=true",
+                "options": (
+                    f"{marks}, MaxWords={NOTE_SEARCH_SNIPPET_WORDS}, "
+                    f"MinWords={max(1, NOTE_SEARCH_SNIPPET_WORDS // 2)}"
+                ),
+                "match": self.match(terms),
+                "user_id": user_id,
+                "limit": limit,
+                "offset": offset,
+            },
+        )
+
+
+_BACKENDS = {"sqlite": _SQLiteIndex(), "postgresql": _PostgresIndex()}
+
+
+def _backend(bind) -> Optional[Any]:
+    return _BACKENDS.get(bind.dialect.name)
+
+
+async def create_search_index(conn: AsyncConnection) -> None:
+    """Create the search index if missing, filling it from existing notes"""
+    backend = _backend(conn)
+    if backend is not None:
+        await backend.create(conn)
+
+
+async def index_note(db: AsyncSession, note: Note) -> None:
+    """Add or refresh a note in the index, in the session's transaction"""
+    backend = _backend(db.bind)
+    if backend is not None:
+        await backend.index(db, note.id, note.user_id, note.title, note.content)
+
+
+async def remove_note(db: AsyncSession, note_id: int) -> None:
+    backend = _backend(db.bind)
+    if backend is not None:
+        await backend.remove(db, note_id)
+
+
+async def search_notes(
+    db: AsyncSession, user_id: int, query: str, limit: int, offset: int = 0
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """A page of a user's notes matching ``query``, best first.
+
+    Returns the hits and whether there are more. Matches are wrapped in
+    ``HIGHLIGHT_START``/``HIGHLIGHT_END``; the text around them is the
+    note's Markdown as is, not escaped HTML.
+    """
+    backend = _backend(db.bind)
+    if backend is None:
+        raise SearchUnavailableError(
+            f"Search isn't supported on {db.bind.dialect.name}"
+        )
+    terms = parse_query(query)
+    if not terms:
+        return [], False
+    result = await backend.search(db, user_id, terms, limit + 1, offset)
+    hits = [dict(row) for row in result.mappings()]
+    return hits[:limit], len(hits) > limit
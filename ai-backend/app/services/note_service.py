@@ -1,8 +1,69 @@
+import base64
+import json
+import os
+from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List, Optional
+from sqlalchemy import String, and_, case, delete, func, or_, select, type_coerce, update
+from sqlalchemy.orm.exc import StaleDataError
+from typing import Any, List, Optional, Sequence, Tuple
 from app.models.note import Note
-from app.schemas.note import NoteCreate, NoteUpdate
+from app.schemas.note import DeleteOp, NoteCreate, NotePatch, NoteUpdate, TextOp
+from app.services.markdown_renderer import render_cache
+from app.services.note_search import index_note, remove_note
+from app.services.version_service import NOTE_VERSIONS, VersionService
+
+# Characters of content sent with each note in list view
+NOTE_PREVIEW_CHARS = int(os.getenv("NOTE_PREVIEW_CHARS", "200"))
+
+# (updated_at, id) of the last note of a page
+Cursor = Tuple[Any, int]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    updated_at, note_id = cursor
+    if isinstance(updated_at, datetime):
+        updated_at = updated_at.isoformat()
+    data = json.dumps([updated_at, note_id]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Raises ValueError for a cursor that wasn't made by encode_cursor"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, note_id = json.loads(data)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(updated_at, str) or not isinstance(note_id, int):
+        raise ValueError("Invalid cursor")
+    return updated_at, note_id
+
+
+class VersionConflictError(Exception):
+    """The note was updated since the version an update was made on"""
+
+    def __init__(self, version: Optional[int]):
+        super().__init__("Note was modified since version was read")
+        self.version = version
+
+
+def apply_text_ops(content: str, ops: Sequence[TextOp]) -> str:
+    """Apply insert/delete operations in order; ValueError if out of range"""
+    for i, op in enumerate(ops):
+        if isinstance(op, DeleteOp):
+            end = op.pos + op.count
+            if end > len(content):
+                raise ValueError(
+                    f"Operation {i} deletes past the end of the content"
+                )
+            content = content[:op.pos] + content[end:]
+        else:
+            if op.pos > len(content):
+                raise ValueError(
+                    f"Operation {i} inserts past the end of the content"
+                )
+            content = content[:op.pos] + op.text + content[op.pos:]
+    return content
 
 
 class NoteService:
@@ -16,10 +77,16 @@ class NoteService:
             user_id=user_id
         )
         self.db.add(db_note)
+        await self.db.flush()
+        await index_note(self.db, db_note)
+        await self._record_version(db_note)
         await self.db.commit()
-        await self.db.refresh(db_note)
         return db_note
     
+    async def _record_version(self, note: Note) -> None:
+        if NOTE_VERSIONS:
+            await VersionService(self.db).record(note)
+    
     async def get_note_by_id(self, note_id: int) -> Optional[Note]:
         result = await self.db.execute(select(Note).where(Note.id == note_id))
         return result.scalar_one_or_none()
@@ -29,28 +96,164 @@ class NoteService:
             select(Note).where(Note.user_id == user_id).order_by(Note.updated_at.desc())
         )
         return result.scalars().all()
+
+    def _updated_at_key(self):
+        # SQLite keeps timestamps as text in the format of whatever wrote
+        # them (CURRENT_TIMESTAMP has no fraction of a second, SQLAlchemy
+        # writes microseconds). Cursors carry and compare that text, which
+        # is also what ORDER BY sorts on.
+        if self.db.bind.dialect.name == "sqlite":
+            return type_coerce(Note.updated_at, String)
+        return Note.updated_at
+
+    async def get_user_notes_page(
+        self,
+        user_id: int,
+        limit: int,
+        cursor: Optional[Cursor] = None,
+        summary: bool = False,
+    ) -> Tuple[List[Any], Optional[Cursor]]:
+        """A page of notes, newest first, and the cursor of the next one.
+
+        Pages continue from the (updated_at, id) of the previous page's
+        last note, so each one is a range scan of the (user_id,
+        updated_at, id) index however deep it is. With ``summary`` only
+        id, title, updated_at and the first NOTE_PREVIEW_CHARS characters
+        of content are loaded, as rows with those attributes.
+        """
+        updated_at = self._updated_at_key()
+        if summary:
+            preview = func.substr(Note.content, 1, NOTE_PREVIEW_CHARS)
+            if self.db.bind.dialect.name == "sqlite":
+                # Compressed content is a blob that substr can't read
+                preview = case(
+                    (
+                        func.typeof(Note.content) == "blob",
+                        func.note_preview(Note.content, NOTE_PREVIEW_CHARS),
+                    ),
+                    else_=preview,
+                )
+            query = select(
+                Note.id,
+                Note.title,
+                updated_at.label("updated_key"),
+                Note.updated_at,
+                func.coalesce(preview, "").label("preview"),
+            )
+        else:
+            query = select(Note, updated_at.label("updated_key"))
+        query = query.where(Note.user_id == user_id)
+
+        if cursor is not None:
+            cursor_updated_at, cursor_id = cursor
+            if not isinstance(updated_at.type, String):
+                cursor_updated_at = datetime.fromisoformat(cursor_updated_at)
+            query = query.where(
+                or_(
+                    updated_at < cursor_updated_at,
+                    and_(updated_at == cursor_updated_at, Note.id < cursor_id),
+                )
+            )
+        query = query.order_by(Note.updated_at.desc(), Note.id.desc())
+
+        # One more than asked for tells whether there is a next page
+        result = await self.db.execute(query.limit(limit + 1))
+        rows = result.all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            last_id = last.id if summary else last.Note.id
+            next_cursor = (last.updated_key, last_id)
+        if not summary:
+            rows = [row.Note for row in rows]
+        return rows, next_cursor
     
-    async def update_note(self, note_id: int, note_data: NoteUpdate) -> Optional[Note]:
-        note = await self.get_note_by_id(note_id)
-        if not note:
-            return None
-        
+    async def update_note(
+        self, note_id: int, user_id: int, note_data: NoteUpdate
+    ) -> Optional[Note]:
+        """Update a user's note in one UPDATE ... RETURNING.
+
+        Returns None if the user has no note with that id.
+        """
+        values = {}
         if note_data.title is not None:
-            note.title = note_data.title
+            values["title"] = note_data.title
         if note_data.content is not None:
-            note.content = note_data.content
-        
+            values["content"] = note_data.content
+        if not values:
+            result = await self.db.execute(
+                select(Note).where(Note.id == note_id, Note.user_id == user_id)
+            )
+            return result.scalar_one_or_none()
+
+        result = await self.db.execute(
+            update(Note)
+            .where(Note.id == note_id, Note.user_id == user_id)
+            .values(version=Note.version + 1, **values)
+            .returning(Note)
+        )
+        note = result.scalar_one_or_none()
+        if not note:
+            return None
+        await index_note(self.db, note)
+        await self._record_version(note)
         await self.db.commit()
-        await self.db.refresh(note)
+        render_cache.invalidate(note_id)
         return note
-    
-    async def delete_note(self, note_id: int) -> bool:
-        note = await self.get_note_by_id(note_id)
+
+    async def patch_note(
+        self, note_id: int, user_id: int, patch: NotePatch
+    ) -> Optional[Note]:
+        """Apply text operations and a new title to a user's note.
+
+        Raises VersionConflictError unless the note is still at
+        ``patch.base_version``, also when another update gets in between
+        reading and writing it, and ValueError for an operation that
+        doesn't fit the content. Only id, version and updated_at of the
+        returned note are meant to be read.
+        """
+        result = await self.db.execute(
+            select(Note).where(Note.id == note_id, Note.user_id == user_id)
+        )
+        note = result.scalar_one_or_none()
         if not note:
+            return None
+        if note.version != patch.base_version:
+            raise VersionConflictError(note.version)
+        if not patch.ops and patch.title is None:
+            return note
+
+        if patch.ops:
+            note.content = apply_text_ops(note.content or "", patch.ops)
+        if patch.title is not None:
+            note.title = patch.title
+        try:
+            # UPDATE ... WHERE version = base_version
+            await self.db.flush()
+        except StaleDataError:
+            await self.db.rollback()
+            version = await self.db.scalar(
+                select(Note.version).where(Note.id == note_id)
+            )
+            raise VersionConflictError(version)
+        await index_note(self.db, note)
+        await self._record_version(note)
+        await self.db.commit()
+        render_cache.invalidate(note_id)
+        return note
+    
+    async def delete_note(self, note_id: int, user_id: int) -> bool:
+        """Delete a user's note; False if the user has no note with that id"""
+        await VersionService(self.db).delete_note_versions(note_id, user_id)
+        result = await self.db.execute(
+            delete(Note)
+            .where(Note.id == note_id, Note.user_id == user_id)
+            .returning(Note.id)
+        )
+        if result.scalar_one_or_none() is None:
             return False
-        
-        await self.db.delete(note)
+        await remove_note(self.db, note_id)
         await self.db.commit()
+        render_cache.invalidate(note_id)
         return True
-        
-            
\ No newline at end of file
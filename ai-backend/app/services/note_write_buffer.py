@@ -0,0 +1,506 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models.note import Note
+from app.schemas.note import NotePatch, NoteUpdate
+from app.services.markdown_renderer import render_cache
+from app.services.note_search import index_note
+from app.services.note_service import (
+    NOTE_PREVIEW_CHARS,
+    Cursor,
+    NoteService,
+    VersionConflictError,
+    apply_text_ops,
+)
+from app.services.version_service import NOTE_VERSIONS, VersionService
+
+logger = logging.getLogger(__name__)
+
+# Buffer autosaves of notes instead of writing each one (single process
+# only: the buffer is this process's memory)
+NOTE_WRITE_BEHIND = os.getenv("NOTE_WRITE_BEHIND", "0") == "1"
+# Seconds between writes of the buffered notes; all saves of a note
+# within it become one UPDATE
+NOTE_WRITE_BEHIND_WINDOW = float(os.getenv("NOTE_WRITE_BEHIND_WINDOW", "5"))
+# Buffered notes that trigger a write before the window is up
+NOTE_WRITE_BEHIND_MAX_NOTES = int(
+    os.getenv("NOTE_WRITE_BEHIND_MAX_NOTES", "1000")
+)
+# Append-only log of the buffered saves, replayed on start
+NOTE_WAL_PATH = os.getenv("NOTE_WAL_PATH", "./notes.wal")
+# fsync every save: survives power loss, not only a crash of the process
+NOTE_WAL_FSYNC = os.getenv("NOTE_WAL_FSYNC", "0") == "1"
+# Seconds shutdown waits for the buffered notes to be written
+NOTE_WRITE_BEHIND_SHUTDOWN_TIMEOUT = float(
+    os.getenv("NOTE_WRITE_BEHIND_SHUTDOWN_TIMEOUT", "10")
+)
+
+Record = Dict[str, Any]
+
+
+def _utcnow() -> datetime:
+    # Naive UTC, like the timestamps the database generates
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _copy(note: Note) -> Note:
+    """A copy of a note that belongs to no session"""
+    return Note(
+        id=note.id,
+        title=note.title,
+        content=note.content,
+        user_id=note.user_id,
+        created_at=note.created_at,
+        updated_at=note.updated_at,
+        version=note.version,
+    )
+
+
+class NoteWriteBuffer:
+    """Holds the latest save of notes in memory and writes them in batches.
+
+    A save replaces the buffered copy of its note, which reads are served
+    from, and is appended to a write-ahead log first. Every ``window``
+    seconds all buffered notes are written in one transaction, so however
+    many saves a note got meanwhile it costs one UPDATE. Once written,
+    the log segments they were in are deleted; whatever is left in the
+    log when the process dies is written by ``start`` on the next run.
+
+    Text operations are logged as such rather than as the content they
+    result in, so a keystroke costs a few bytes of log.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = NOTE_WRITE_BEHIND,
+        window: float = NOTE_WRITE_BEHIND_WINDOW,
+        max_notes: int = NOTE_WRITE_BEHIND_MAX_NOTES,
+        wal_path: str = NOTE_WAL_PATH,
+        fsync: bool = NOTE_WAL_FSYNC,
+        session_factory=None,
+    ):
+        self.enabled = enabled
+        self.window = window
+        self.max_notes = max_notes
+        self.wal_path = wal_path
+        self.fsync = fsync
+        self.session_factory = session_factory or AsyncSessionLocal
+        # Buffered copies of the notes saved since they were last written
+        self._notes: Dict[int, Note] = {}
+        self._wal = None
+        self._segment = 0
+        self._flush_lock = asyncio.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.saves = 0
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        self.replayed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def get(self, note_id: int) -> Optional[Note]:
+        return self._notes.get(note_id)
+
+    def for_user(self, user_id: int) -> Dict[int, Note]:
+        return {
+            note_id: note
+            for note_id, note in self._notes.items()
+            if note.user_id == user_id
+        }
+
+    async def _load(
+        self, db: AsyncSession, note_id: int, user_id: int
+    ) -> Optional[Note]:
+        note = self._notes.get(note_id)
+        if note is None:
+            result = await db.execute(
+                select(Note).where(Note.id == note_id, Note.user_id == user_id)
+            )
+            stored = result.scalar_one_or_none()
+            if stored is None:
+                return None
+            # Another save of the note may have been buffered meanwhile
+            note = self._notes.get(note_id) or _copy(stored)
+        return note if note.user_id == user_id else None
+
+    def _append(self, record: Record) -> None:
+        if self._wal is None:
+            self._wal = open(self.wal_path, "a", encoding="utf-8")
+        self._wal.write(json.dumps(record) + "\n")
+        self._wal.flush()
+        if self.fsync:
+            os.fsync(self._wal.fileno())
+
+    def _save(self, note: Note, record: Record, values: Record) -> None:
+        """Log a save of ``note``, then apply ``values`` to the buffer"""
+        version = note.version + 1
+        updated_at = _utcnow()
+        self._append(
+            {
+                "id": note.id,
+                "version": version,
+                "updated_at": updated_at.isoformat(),
+                **record,
+            }
+        )
+        for name, value in values.items():
+            setattr(note, name, value)
+        note.version = version
+        note.updated_at = updated_at
+        self._notes[note.id] = note
+        self.saves += 1
+        if len(self._notes) >= self.max_notes:
+            self._wake.set()
+
+    async def update(
+        self,
+        db: AsyncSession,
+        note_id: int,
+        user_id: int,
+        title: Optional[str] = None,
+        content: Optional[str] = None,
+    ) -> Optional[Note]:
+        note = await self._load(db, note_id, user_id)
+        if note is None:
+            return None
+        values = {}
+        if title is not None:
+            values["title"] = title
+        if content is not None:
+            values["content"] = content
+        if values:
+            self._save(note, values, values)
+        return note
+
+    async def patch(
+        self, db: AsyncSession, note_id: int, user_id: int, patch: NotePatch
+    ) -> Optional[Note]:
+        note = await self._load(db, note_id, user_id)
+        if note is None:
+            return None
+        if note.version != patch.base_version:
+            raise VersionConflictError(note.version)
+        record, values = {}, {}
+        if patch.ops:
+            values["content"] = apply_text_ops(note.content or "", patch.ops)
+            record["base"] = note.version
+            record["ops"] = [op.model_dump() for op in patch.ops]
+        if patch.title is not None:
+            record["title"] = values["title"] = patch.title
+        if values:
+            self._save(note, record, values)
+        return note
+
+    def discard(self, note_id: int) -> None:
+        """Forget the buffered saves of a deleted note"""
+        self._notes.pop(note_id, None)
+
+    def _segments(self) -> List[str]:
+        """Log segments set aside by flushes, oldest first"""
+        paths = glob.glob(glob.escape(self.wal_path) + ".*")
+        suffix = len(self.wal_path) + 1
+        return sorted(
+            (p for p in paths if p[suffix:].isdigit()),
+            key=lambda p: int(p[suffix:]),
+        )
+
+    def _rotate(self) -> None:
+        """Set the log aside; later saves go to a new one"""
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+        if os.path.exists(self.wal_path):
+            self._segment += 1
+            os.replace(self.wal_path, f"{self.wal_path}.{self._segment}")
+
+    async def flush(self) -> int:
+        """Write every buffered note in one transaction"""
+        async with self._flush_lock:
+            if not self._notes:
+                return 0
+            # Everything logged so far is covered by this snapshot
+            self._rotate()
+            segments = self._segments()
+            snapshot = [_copy(note) for note in self._notes.values()]
+            # Bound names can't be those of the columns they set
+            rows = [
+                {
+                    "b_id": note.id,
+                    "b_user_id": note.user_id,
+                    "b_title": note.title,
+                    "b_content": note.content,
+                    "b_version": note.version,
+                    "b_updated_at": note.updated_at,
+                }
+                for note in snapshot
+            ]
+            table = Note.__table__
+            statement = (
+                update(table)
+                .where(
+                    table.c.id == bindparam("b_id"),
+                    table.c.user_id == bindparam("b_user_id"),
+                )
+                .values(
+                    title=bindparam("b_title"),
+                    content=bindparam("b_content"),
+                    version=bindparam("b_version"),
+                    updated_at=bindparam("b_updated_at"),
+                )
+            )
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(statement, rows)
+                    # Notes deleted since their save must stay out of the
+                    # search index
+                    result = await session.execute(
+                        select(Note.id).where(
+                            Note.id.in_([note.id for note in snapshot])
+                        )
+                    )
+                    existing = set(result.scalars())
+                    for note in snapshot:
+                        if note.id in existing:
+                            await index_note(session, note)
+                            if NOTE_VERSIONS:
+                                await VersionService(session).record(note)
+                    await session.commit()
+            except Exception as e:
+                # Still buffered and logged; the next flush retries
+                self.failed += 1
+                logger.warning("Writing %d notes failed: %s", len(rows), e)
+                return 0
+
+            for note in snapshot:
+                buffered = self._notes.get(note.id)
+                if buffered is not None and buffered.version == note.version:
+                    del self._notes[note.id]
+            for path in segments:
+                os.remove(path)
+            self.flushes += 1
+            self.written += len(rows)
+            return len(rows)
+
+    def _read_log(self) -> List[Record]:
+        records = []
+        for path in self._segments() + [self.wal_path]:
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+        return records
+
+    def _remove_log(self) -> None:
+        for path in self._segments() + [self.wal_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def replay(self) -> int:
+        """Write the saves left in the log by a previous run"""
+        records = self._read_log()
+        if not records:
+            self._remove_log()
+            return 0
+        note_ids = {record["id"] for record in records}
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(Note).where(Note.id.in_(note_ids))
+            )
+            notes = {note.id: note for note in result.scalars()}
+            changed: Set[int] = set()
+            for record in records:
+                note = notes.get(record["id"])
+                if note is None or record["version"] <= note.version:
+                    # Deleted, or written before the process stopped
+                    continue
+                if "ops" in record:
+                    if record["base"] != note.version:
+                        logger.warning(
+                            "Skipping logged edit of note %d: made on "
+                            "version %d, which is lost",
+                            note.id,
+                            record["base"],
+                        )
+                        continue
+                    ops = NotePatch(
+                        base_version=record["base"], ops=record["ops"]
+                    ).ops
+                    note.content = apply_text_ops(note.content or "", ops)
+                if "content" in record:
+                    note.content = record["content"]
+                if "title" in record:
+                    note.title = record["title"]
+                note.version = record["version"]
+                note.updated_at = datetime.fromisoformat(record["updated_at"])
+                changed.add(note.id)
+            for note_id in changed:
+                await index_note(session, notes[note_id])
+                if NOTE_VERSIONS:
+                    await VersionService(session).record(notes[note_id])
+            await session.commit()
+        self._remove_log()
+        self.replayed += len(changed)
+        if changed:
+            logger.info(
+                "Wrote %d notes saved before the last shutdown", len(changed)
+            )
+        return len(changed)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+        await self.flush()
+
+    async def start(self) -> None:
+        """Replay the log, then buffer saves if enabled"""
+        await self.replay()
+        if not self.enabled or self._task is not None:
+            return
+        self._closing = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(
+        self, timeout: float = NOTE_WRITE_BEHIND_SHUTDOWN_TIMEOUT
+    ) -> None:
+        """Write the buffered notes; what doesn't make it stays in the log"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "%d buffered notes not written before shutdown",
+                len(self._notes),
+            )
+        self._task = None
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "buffered": len(self._notes),
+            "saves": self.saves,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+            "replayed": self.replayed,
+        }
+
+
+note_write_buffer = NoteWriteBuffer()
+
+
+class BufferedNoteService(NoteService):
+    """NoteService whose updates go through the write buffer.
+
+    Reads see the buffered version of a note. Search results and the
+    order of pages follow what was last written to the database.
+    """
+
+    def __init__(self, db: AsyncSession, buffer: NoteWriteBuffer):
+        super().__init__(db)
+        self.buffer = buffer
+
+    async def get_note_by_id(self, note_id: int) -> Optional[Note]:
+        note = self.buffer.get(note_id)
+        if note is not None:
+            return note
+        return await super().get_note_by_id(note_id)
+
+    async def get_user_notes(self, user_id: int) -> List[Note]:
+        notes = await super().get_user_notes(user_id)
+        buffered = self.buffer.for_user(user_id)
+        if not buffered:
+            return notes
+        notes = [buffered.get(note.id, note) for note in notes]
+        notes.sort(key=lambda note: note.updated_at, reverse=True)
+        return notes
+
+    async def get_user_notes_page(
+        self,
+        user_id: int,
+        limit: int,
+        cursor: Optional[Cursor] = None,
+        summary: bool = False,
+    ) -> Tuple[List[Any], Optional[Cursor]]:
+        rows, next_cursor = await super().get_user_notes_page(
+            user_id, limit, cursor, summary
+        )
+        buffered = self.buffer.for_user(user_id)
+        if not buffered:
+            return rows, next_cursor
+        if not summary:
+            return [buffered.get(note.id, note) for note in rows], next_cursor
+        page = []
+        for row in rows:
+            note = buffered.get(row.id)
+            if note is not None:
+                row = SimpleNamespace(
+                    id=note.id,
+                    title=note.title,
+                    updated_at=note.updated_at,
+                    preview=(note.content or "")[:NOTE_PREVIEW_CHARS],
+                )
+            page.append(row)
+        return page, next_cursor
+
+    async def update_note(
+        self, note_id: int, user_id: int, note_data: NoteUpdate
+    ) -> Optional[Note]:
+        note = await self.buffer.update(
+            self.db, note_id, user_id, note_data.title, note_data.content
+        )
+        if note is not None:
+            render_cache.invalidate(note_id)
+        return note
+
+    async def patch_note(
+        self, note_id: int, user_id: int, patch: NotePatch
+    ) -> Optional[Note]:
+        note = await self.buffer.patch(self.db, note_id, user_id, patch)
+        if note is not None:
+            render_cache.invalidate(note_id)
+        return note
+
+    async def delete_note(self, note_id: int, user_id: int) -> bool:
+        deleted = await super().delete_note(note_id, user_id)
+        if deleted:
+            self.buffer.discard(note_id)
+        return deleted
+
+
+def get_note_service(db: AsyncSession) -> NoteService:
+    """The NoteService to use: buffered while the write buffer runs"""
+    if note_write_buffer.running:
+        return BufferedNoteService(db, note_write_buffer)
+    return NoteService(db)
@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Recent successful calls kept per provider for latency percentiles
+PROVIDER_LATENCY_WINDOW = int(os.getenv("PROVIDER_LATENCY_WINDOW", "200"))
+# Seconds of call outcomes the error rate is computed over
+PROVIDER_ERROR_WINDOW = float(os.getenv("PROVIDER_ERROR_WINDOW", "60"))
+# The breaker opens after this many failures in a row, or when at least
+# PROVIDER_BREAKER_MIN_CALLS calls in the window failed at this rate.
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "5"))
+PROVIDER_BREAKER_ERROR_RATE = float(
+    os.getenv("PROVIDER_BREAKER_ERROR_RATE", "0.5")
+)
+PROVIDER_BREAKER_MIN_CALLS = int(os.getenv("PROVIDER_BREAKER_MIN_CALLS", "10"))
+# Seconds an open breaker waits before letting a probe call through
+PROVIDER_BREAKER_COOLDOWN = float(os.getenv("PROVIDER_BREAKER_COOLDOWN", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailableError(Exception):
+    pass
+
+
+class ProviderStats:
+    """Circuit breaker, error rate and recent latencies of one provider.
+
+    The breaker is closed while the provider works. Too many failures open
+    it, and calls are refused until the cooldown has passed; then a single
+    probe call is let through (half-open). The probe's outcome closes the
+    breaker again or restarts the cooldown.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        window: int = PROVIDER_LATENCY_WINDOW,
+        error_window: float = PROVIDER_ERROR_WINDOW,
+        failure_threshold: int = PROVIDER_BREAKER_FAILURES,
+        error_rate_threshold: float = PROVIDER_BREAKER_ERROR_RATE,
+        min_calls: int = PROVIDER_BREAKER_MIN_CALLS,
+        cooldown: float = PROVIDER_BREAKER_COOLDOWN,
+    ):
+        self.name = name
+        self.error_window = error_window
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._latencies: deque = deque(maxlen=window)
+        # (monotonic time, succeeded) of recent calls
+        self._outcomes: deque = deque()
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._consecutive_failures = 0
+        self._last_success: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def _cooled_down(self, now: float) -> bool:
+        return now - self._opened_at >= self.cooldown
+
+    def available(self) -> bool:
+        """Whether a call would currently be let through"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return self._cooled_down(time.monotonic())
+            return not self._probing
+
+    def acquire(self) -> None:
+        """Admit one call, or raise ``ProviderUnavailableError``"""
+        with self._lock:
+            if self.state == OPEN and self._cooled_down(time.monotonic()):
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise ProviderUnavailableError(f"Provider {self.name} circuit is open")
+
+    def _record(self, now: float, succeeded: bool) -> None:
+        self._outcomes.append((now, succeeded))
+        self._expire(now)
+
+    def _expire(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.error_window:
+            self._outcomes.popleft()
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._record(now, True)
+            self._last_success = now
+            if latency is not None:
+                self._latencies.append(latency)
+            self.successes += 1
+            self._consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info("Provider %s circuit closed", self.name)
+            self.state = CLOSED
+            self._probing = False
+
+    def record_failure(self, timeout: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._record(now, False)
+            self.failures += 1
+            if timeout:
+                self.timeouts += 1
+            self._consecutive_failures += 1
+            if self.state == HALF_OPEN or self._should_open():
+                if self.state != OPEN:
+                    logger.warning(
+                        "Provider %s circuit opened after %d failures",
+                        self.name,
+                        self._consecutive_failures,
+                    )
+                self.state = OPEN
+                self._opened_at = now
+                self._probing = False
+
+    def record_cancelled(self) -> None:
+        with self._lock:
+            self.cancelled += 1
+            # A cancelled probe proves nothing; let the next call probe
+            self._probing = False
+
+    def _should_open(self) -> bool:
+        if self._consecutive_failures >= self.failure_threshold:
+            return True
+        calls = len(self._outcomes)
+        return (
+            calls >= self.min_calls
+            and self._error_rate() >= self.error_rate_threshold
+        )
+
+    def _error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        failed = sum(1 for _, succeeded in self._outcomes if not succeeded)
+        return failed / len(self._outcomes)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._error_rate()
+
+    def since_last_success(self) -> Optional[float]:
+        """Seconds since the last successful call, None if there was none"""
+        last_success = self._last_success
+        if last_success is None:
+            return None
+        return time.monotonic() - last_success
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * p / 100))
+        return latencies[index]
+
+    def expected_latency(self, default: float) -> float:
+        """Median latency scaled by the chance of having to retry"""
+        p50 = self.percentile(50)
+        if p50 is None:
+            p50 = default
+        return p50 / max(0.05, 1.0 - self.error_rate())
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 4),
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class ProviderHealth:
+    """``ProviderStats`` for every provider, created on first use"""
+
+    def __init__(self, window: int = PROVIDER_LATENCY_WINDOW, **breaker):
+        self.window = window
+        self.breaker = breaker
+        self._providers: Dict[str, ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, provider: str) -> ProviderStats:
+        with self._lock:
+            stats = self._providers.get(provider)
+            if stats is None:
+                stats = self._providers[provider] = ProviderStats(
+                    provider, self.window, **self.breaker
+                )
+            return stats
+
+    def rank(
+        self, providers: Sequence[str], default_latency: float
+    ) -> List[str]:
+        """Available providers, fastest expected first.
+
+        Providers without latency samples count as ``default_latency``;
+        ties keep the order of ``providers``.
+        """
+        available = [name for name in providers if self[name].available()]
+        return sorted(
+            available,
+            key=lambda name: self[name].expected_latency(default_latency),
+        )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            providers = dict(self._providers)
+        return {name: stats.stats() for name, stats in providers.items()}
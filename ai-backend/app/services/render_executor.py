@@ -0,0 +1,148 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Sizes are in characters of Markdown source.
+RENDER_INLINE_MAX_SIZE = int(os.getenv("RENDER_INLINE_MAX_SIZE", "32768"))
+RENDER_PROCESS_MIN_SIZE = int(os.getenv("RENDER_PROCESS_MIN_SIZE", "262144"))
+RENDER_USE_PROCESSES = os.getenv("RENDER_USE_PROCESSES", "1") == "1"
+RENDER_THREAD_WORKERS = int(os.getenv("RENDER_THREAD_WORKERS", "4"))
+RENDER_PROCESS_WORKERS = int(os.getenv("RENDER_PROCESS_WORKERS", "2"))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", "16"))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "10"))
+RENDER_RETRY_AFTER = int(os.getenv("RENDER_RETRY_AFTER", "2"))
+
+
+class RenderSaturatedError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Render executor is saturated")
+        self.retry_after = retry_after
+
+
+class RenderTimeoutError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Render timed out")
+        self.retry_after = retry_after
+
+
+class RenderExecutor:
+    """Runs CPU-bound Markdown rendering off the event loop.
+
+    Small documents are rendered inline, medium ones on a thread pool and
+    large ones on a process pool so they don't hold the GIL. The number of
+    renders queued or running is bounded; once the bound is reached new
+    renders are refused instead of piling up behind the slow ones.
+    """
+
+    def __init__(
+        self,
+        inline_max_size: int = RENDER_INLINE_MAX_SIZE,
+        process_min_size: int = RENDER_PROCESS_MIN_SIZE,
+        use_processes: bool = RENDER_USE_PROCESSES,
+        thread_workers: int = RENDER_THREAD_WORKERS,
+        process_workers: int = RENDER_PROCESS_WORKERS,
+        max_pending: int = RENDER_MAX_PENDING,
+        timeout: float = RENDER_TIMEOUT,
+        retry_after: int = RENDER_RETRY_AFTER,
+    ):
+        self.inline_max_size = inline_max_size
+        self.process_min_size = process_min_size
+        self.use_processes = use_processes
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_pool(self, size: int, allow_process: bool) -> Executor:
+        with self._lock:
+            if (
+                allow_process
+                and self.use_processes
+                and size >= self.process_min_size
+            ):
+                if self._process_pool is None:
+                    # spawn: forking a process that runs an event loop and
+                    # worker threads is not safe
+                    self._process_pool = ProcessPoolExecutor(
+                        max_workers=self.process_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                return self._process_pool
+
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self.thread_workers,
+                    thread_name_prefix="render",
+                )
+            return self._thread_pool
+
+    def reserve(self) -> None:
+        """Take a render slot, or raise if the executor is saturated"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise RenderSaturatedError(self.retry_after)
+            self._pending += 1
+
+    def release(self, _future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(
+        self,
+        fn: Callable[[str], str],
+        content: str,
+        allow_process: bool = True,
+    ) -> str:
+        size = len(content)
+        if size <= self.inline_max_size:
+            return fn(content)
+
+        self.reserve()
+        try:
+            future = self._get_pool(size, allow_process).submit(fn, content)
+        except BaseException:
+            self.release()
+            raise
+        # Released when the worker really finishes, not when the caller
+        # gives up, so timed-out renders still count against the bound.
+        future.add_done_callback(self.release)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise RenderTimeoutError(self.retry_after)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pools = (self._thread_pool, self._process_pool)
+            self._thread_pool = None
+            self._process_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+render_executor = RenderExecutor()
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from jose import JWTError, jwt
+
+from app.services.auth_service import ALGORITHM, SECRET_KEY
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+class TokenVerifier:
+    """Verifies access tokens issued by ``AuthService.create_access_token``.
+
+    A token seen for the first time gets python-jose's full validation:
+    signature, algorithm and every registered claim. Tokens that passed
+    are kept in a small LRU keyed by their signature, so repeat requests
+    with the same token skip the decoding; the only checks whose outcome
+    can change later, expiry and not-before, still run on every call.
+    """
+
+    def __init__(
+        self,
+        secret_key: str = SECRET_KEY,
+        algorithm: str = ALGORITHM,
+        cache_size: int = TOKEN_CACHE_SIZE,
+    ):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.cache_size = cache_size
+        self._verified: "OrderedDict[str, Tuple[str, Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        signing_input, _, signature = token.rpartition(".")
+        if not signing_input or not signature:
+            raise InvalidTokenError("Malformed token")
+
+        with self._lock:
+            cached = self._verified.get(signature)
+            if cached is not None:
+                self._verified.move_to_end(signature)
+        # The signature alone is not enough: it must belong to the same
+        # header and payload it was verified with.
+        if cached is not None and cached[0] == signing_input:
+            self.hits += 1
+            claims = cached[1]
+            self._check_time_claims(claims)
+        else:
+            self.misses += 1
+            claims = self._decode(token)
+            if self.cache_size > 0:
+                with self._lock:
+                    self._verified[signature] = (signing_input, claims)
+                    while len(self._verified) > self.cache_size:
+                        self._verified.popitem(last=False)
+        return claims
+
+    def _decode(self, token: str) -> Dict[str, Any]:
+        try:
+            return jwt.decode(
+                token, self.secret_key, algorithms=[self.algorithm]
+            )
+        except JWTError as e:
+            raise InvalidTokenError(str(e))
+
+    @staticmethod
+    def _check_time_claims(claims: Dict[str, Any]) -> None:
+        now = time.time()
+        exp = claims.get("exp")
+        if exp is not None:
+            if not isinstance(exp, (int, float)):
+                raise InvalidTokenError("Invalid exp claim")
+            if exp < now:
+                raise InvalidTokenError("Token has expired")
+        nbf = claims.get("nbf")
+        if nbf is not None:
+            if not isinstance(nbf, (int, float)):
+                raise InvalidTokenError("Invalid nbf claim")
+            if nbf > now:
+                raise InvalidTokenError("Token is not yet valid")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._verified),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+token_verifier = TokenVerifier()
@@ -1,9 +1,21 @@
+import asyncio
+import logging
 import os
-from typing import Dict, Any, Optional, List
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
 from enum import Enum
 
+import httpx
+from fastapi.requests import HTTPConnection
 from langchain.prompts import PromptTemplate, ChatPromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
 from langchain.callbacks.base import BaseCallbackHandler
 from langchain_openai import ChatOpenAI
 from langchain_groq import ChatGroq
@@ -11,6 +23,46 @@ from langchain_ollama import OllamaLLM
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_huggingface import HuggingFaceEndpoint
 
+from app.core.singleflight import LatestOnly, SingleFlight
+from app.services.ai_cache import AICache, ai_cache, normalize_text
+from app.services.ai_chunker import Chunk, split_markdown
+from app.services.provider_health import (
+    ProviderHealth,
+    ProviderUnavailableError,
+)
+from app.services.usage_tracker import usage_tracker
+
+logger = logging.getLogger(__name__)
+
+# Connection pool of each provider's HTTP client
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "20"))
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "10"))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", "60"))
+AI_HTTP_TIMEOUT = float(os.getenv("AI_HTTP_TIMEOUT", "60"))
+
+# Seconds a provider gets per call; AI_TIMEOUT_<PROVIDER> (e.g.
+# AI_TIMEOUT_OLLAMA) overrides it for one provider.
+AI_PROVIDER_TIMEOUT = float(os.getenv("AI_PROVIDER_TIMEOUT", "20"))
+# Hedging: once the running provider is slower than this percentile of its
+# recent latencies, the next provider is started alongside it.
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "1") == "1"
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+# Used until a provider has AI_HEDGE_MIN_SAMPLES successful calls
+AI_HEDGE_DEFAULT_DELAY = float(os.getenv("AI_HEDGE_DEFAULT_DELAY", "2"))
+AI_HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+AI_HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "0.1"))
+# Chunks of one long grammar or translate request sent at the same time
+AI_CHUNK_CONCURRENCY = int(os.getenv("AI_CHUNK_CONCURRENCY", "4"))
+# Seconds a health report is reused, and the timeout of a health ping
+AI_HEALTH_TTL = float(os.getenv("AI_HEALTH_TTL", "10"))
+AI_HEALTH_TIMEOUT = float(os.getenv("AI_HEALTH_TIMEOUT", "3"))
+# A provider that answered a real request this many seconds ago counts as
+# healthy without being pinged
+AI_HEALTH_RECENT = float(os.getenv("AI_HEALTH_RECENT", "60"))
+
+# Called with (chunks done, total chunks)
+ProgressCallback = Callable[[int, int], None]
+
 
 class AIProvider(Enum):
     OLLAMA = "ollama"
@@ -20,67 +72,197 @@ class AIProvider(Enum):
     HUGGINGFACE = "huggingface"
 
 
+# Static fallback order, used to break ties when ranking providers
+PROVIDER_PRIORITY = (
+    AIProvider.GROQ,
+    AIProvider.GEMINI,
+    AIProvider.OPENAI,
+    AIProvider.HUGGINGFACE,
+    AIProvider.OLLAMA,
+)
+
+
+def _llm_usage(response) -> Tuple[int, int, int]:
+    """(prompt, completion, total) tokens reported for an LLM run.
+
+    Chat models report usage on the message, Ollama in the generation info
+    and older integrations in ``llm_output``.
+    """
+    prompt = completion = total = 0
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            info = generation.generation_info or {}
+            if usage:
+                input_tokens = usage.get("input_tokens", 0)
+                output_tokens = usage.get("output_tokens", 0)
+            elif "eval_count" in info:
+                input_tokens = info.get("prompt_eval_count") or 0
+                output_tokens = info.get("eval_count") or 0
+            else:
+                continue
+            found = True
+            prompt += input_tokens
+            completion += output_tokens
+            total += (usage or {}).get(
+                "total_tokens", input_tokens + output_tokens
+            )
+    if not found and response.llm_output:
+        token_usage = response.llm_output.get("token_usage") or {}
+        prompt = token_usage.get("prompt_tokens", 0)
+        completion = token_usage.get("completion_tokens", 0)
+        total = token_usage.get("total_tokens", prompt + completion)
+    return prompt, completion, total
+
+
 class TokenUsageCallback(BaseCallbackHandler):
-    """Callback для відстеження використання токенів"""
-    
+    """Callback для відстеження використання токенів
+
+    Pass a new instance in the ``config`` of a call to count that call
+    alone; concurrent calls then can't mix up their numbers.
+    """
+
+    # Counting is cheap; don't hop to a thread for it
+    run_inline = True
+
     def __init__(self):
         self.total_tokens = 0
         self.prompt_tokens = 0
         self.completion_tokens = 0
-    
+
     def on_llm_end(self, response, **kwargs):
-        if hasattr(response, 'llm_output') and response.llm_output:
-            token_usage = response.llm_output.get('token_usage', {})
-            self.total_tokens += token_usage.get('total_tokens', 0)
-            self.prompt_tokens += token_usage.get('prompt_tokens', 0)
-            self.completion_tokens += token_usage.get('completion_tokens', 0)
+        prompt, completion, total = _llm_usage(response)
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        self.total_tokens += total
+
+    def add(self, usage: Dict[str, int]) -> None:
+        self.total_tokens += usage.get("total_tokens", 0)
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+
+    def usage(self) -> Dict[str, int]:
+        return {
+            "total_tokens": self.total_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+def _secret(value) -> str:
+    if hasattr(value, "get_secret_value"):
+        return value.get_secret_value()
+    return value or ""
+
+
+def _sum_usage(usages) -> Dict[str, int]:
+    total = TokenUsageCallback()
+    for usage in usages:
+        total.add(usage)
+    return total.usage()
 
 
 class UnifiedAIService:
-    def __init__(self):
+    """AI operations with provider fallback.
+
+    Building the provider clients and prompts is expensive, so the
+    application creates one instance at startup (see ``get_ai_service``).
+    Each HTTP-based provider gets its own pooled ``httpx.AsyncClient`` that
+    keeps connections and TLS sessions alive between requests; call
+    ``aclose`` on shutdown to release them.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[AICache] = None,
+        providers: Optional[Dict[AIProvider, Any]] = None,
+        hedge: bool = AI_HEDGE_ENABLED,
+    ):
         self.providers = {}
+        self.cache = cache if cache is not None else ai_cache
+        self.hedge = hedge
+        self.hedged = 0
+        self.provider_health = ProviderHealth()
+        self.in_flight = SingleFlight()
+        # Autocomplete requests per (session, note); a newer one cancels
+        # the one still running
+        self.autocomplete_requests = LatestOnly()
+        self._http_clients: List[httpx.AsyncClient] = []
+        # Time to first token of streamed completions, per provider
+        self._ttft: Dict[str, Dict[str, float]] = {}
+        # Health reports by depth: (expires at, report)
+        self._health: Dict[bool, Tuple[float, Dict[str, Any]]] = {}
+        self._health_client: Optional[httpx.AsyncClient] = None
+        # Tokens used by all calls since start; each call is counted by its
+        # own callback and added here
         self.token_callback = TokenUsageCallback()
-        self.setup_providers()
+        if providers is None:
+            self.setup_providers()
+        else:
+            self.providers = dict(providers)
         self.setup_prompts()
-    
+
+    def _http_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=AI_HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    def _http_client(self) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(
+            limits=self._http_limits(), timeout=AI_HTTP_TIMEOUT
+        )
+        self._http_clients.append(client)
+        return client
+
+    async def aclose(self):
+        clients, self._http_clients = self._http_clients, []
+        self._health_client = None
+        for client in clients:
+            await client.aclose()
+
     def setup_providers(self):
         try:
             self.providers[AIProvider.OLLAMA] = OllamaLLM(
                 base_url="http://localhost:11434",
                 model="llama3:8b",
-                callbacks=[self.token_callback]
+                async_client_kwargs={"limits": self._http_limits()},
             )
         except:
             pass
-        
+
         if os.getenv("OPENAI_API_KEY"):
             self.providers[AIProvider.OPENAI] = ChatOpenAI(
                 api_key=os.getenv("OPENAI_API_KEY"),
                 model="gpt-3.5-turbo",
                 temperature=0.7,
-                callbacks=[self.token_callback]
+                http_async_client=self._http_client(),
+                # Report usage in streamed responses too
+                stream_usage=True,
             )
-        
+
         # Groq
         if os.getenv("GROQ_API_KEY"):
             self.providers[AIProvider.GROQ] = ChatGroq(
                 api_key=os.getenv("GROQ_API_KEY"),
                 model="llama3-8b-8192",
                 temperature=0.7,
-                callbacks=[self.token_callback]
+                http_async_client=self._http_client(),
             )
-        
+
         if os.getenv("GOOGLE_API_KEY"):
             try:
                 self.providers[AIProvider.GEMINI] = ChatGoogleGenerativeAI(
                     google_api_key=os.getenv("GOOGLE_API_KEY"),
                     model="gemini-pro",
                     temperature=0.7,
-                    callbacks=[self.token_callback]
                 )
             except ImportError:
-                print("Google Generative AI package not installed")
-        
+                logger.warning("Google Generative AI package not installed")
+
         if os.getenv("HUGGINGFACE_API_KEY"):
             try:
                 self.providers[AIProvider.HUGGINGFACE] = HuggingFaceEndpoint(
@@ -90,29 +272,38 @@ class UnifiedAIService:
                     model_kwargs={
                         "temperature": 0.7,
                         "max_length": 1000,
-                        "do_sample": True
+                        "do_sample": True,
                     },
-                    callbacks=[self.token_callback]
                 )
             except ImportError:
-                print("Hugging Face package not installed")
-    
+                logger.warning("Hugging Face package not installed")
+
     def setup_prompts(self):
         self.chat_prompts = {
-            "autocomplete": ChatPromptTemplate.from_messages([
-                SystemMessage(content="""You are a Markdown writing assistant. Continue the given Markdown text naturally and coherently.
+            "autocomplete": ChatPromptTemplate.from_messages(
+                [
+                    (
+                        "system",
+                        """You are a Markdown writing assistant. Continue the given Markdown text naturally and coherently.
                 
 Rules:
 - Maintain Markdown formatting (headers, lists, links, etc.)
 - Continue in the same style and tone
 - Don't explain what you're doing
 - Return ONLY the continuation text
-- Preserve existing formatting patterns"""),
-                HumanMessage(content="Continue this Markdown text naturally:\n\n{text}")
-            ]),
-            
-            "grammar": ChatPromptTemplate.from_messages([
-                SystemMessage(content="""You are a Markdown grammar expert. Fix grammar and spelling errors while preserving Markdown formatting.
+- Preserve existing formatting patterns""",
+                    ),
+                    (
+                        "human",
+                        "Continue this Markdown text naturally:\n\n{text}",
+                    ),
+                ]
+            ),
+            "grammar": ChatPromptTemplate.from_messages(
+                [
+                    (
+                        "system",
+                        """You are a Markdown grammar expert. Fix grammar and spelling errors while preserving Markdown formatting.
 
 Rules:
 - Keep ALL Markdown syntax intact (**, *, #, [], (), etc.)
@@ -120,12 +311,19 @@ Rules:
 - Don't change the meaning or structure
 - Don't explain changes
 - Return ONLY the corrected text
-- Preserve headers, links, lists, and code blocks exactly"""),
-                HumanMessage(content="Fix grammar and spelling errors in this Markdown text:\n\n{text}")
-            ]),
-            
-            "translate": ChatPromptTemplate.from_messages([
-                SystemMessage(content="""You are a professional Markdown translator. Translate text while preserving ALL Markdown formatting.
+- Preserve headers, links, lists, and code blocks exactly""",
+                    ),
+                    (
+                        "human",
+                        "Fix grammar and spelling errors in this Markdown text:\n\n{text}",
+                    ),
+                ]
+            ),
+            "translate": ChatPromptTemplate.from_messages(
+                [
+                    (
+                        "system",
+                        """You are a professional Markdown translator. Translate text while preserving ALL Markdown formatting.
 
 Rules:
 - Translate ONLY the text content, not Markdown syntax
@@ -133,11 +331,16 @@ Rules:
 - Preserve URLs, code snippets, and technical terms
 - Don't explain the translation
 - Return ONLY the translated text with original formatting
-- Maintain the same structure and layout"""),
-                HumanMessage(content="Translate this Markdown text to {target_language}:\n\n{text}")
-            ])
+- Maintain the same structure and layout""",
+                    ),
+                    (
+                        "human",
+                        "Translate this Markdown text to {target_language}:\n\n{text}",
+                    ),
+                ]
+            ),
         }
-        
+
         self.text_prompts = {
             "autocomplete": """You are a Markdown writing assistant. Continue the given Markdown text naturally and coherently.
 
@@ -151,7 +354,6 @@ Rules:
 Continue this Markdown text naturally:
 
 {text}""",
-            
             "grammar": """You are a Markdown grammar expert. Fix grammar and spelling errors while preserving Markdown formatting.
 
 Rules:
@@ -165,7 +367,6 @@ Rules:
 Fix grammar and spelling errors in this Markdown text:
 
 {text}""",
-            
             "translate": """You are a professional Markdown translator. Translate text while preserving ALL Markdown formatting.
 
 Rules:
@@ -178,164 +379,713 @@ Rules:
 
 Translate this Markdown text to {target_language}:
 
-{text}"""
+{text}""",
         }
-    
-    async def _execute_with_chain(self, provider: AIProvider, operation: str, **kwargs) -> str:
+
+    async def _execute_with_chain(
+        self, provider: AIProvider, operation: str, **kwargs
+    ) -> str:
         """Виконання операції через LangChain prompts"""
+        result, _ = await self._invoke_chain(provider, operation, **kwargs)
+        return result
+
+    def _build_prompt(self, provider: AIProvider, operation: str, **kwargs):
+        """Prompt text for Ollama, chat messages for the other providers"""
+        if provider not in self.providers:
+            raise Exception(f"Provider {provider.value} not available")
+
+        variables = {"text": kwargs.get("text", "")}
+        if operation == "translate":
+            variables["target_language"] = kwargs.get(
+                "target_language", "Ukrainian"
+            )
+
+        if provider == AIProvider.OLLAMA:
+            if operation not in self.text_prompts:
+                raise Exception(
+                    f"Operation {operation} not supported for Ollama"
+                )
+            return self.text_prompts[operation].format(**variables)
+
+        if operation not in self.chat_prompts:
+            raise Exception(f"Operation {operation} not supported")
+        return self.chat_prompts[operation].format_messages(**variables)
+
+    async def _invoke_chain(
+        self, provider: AIProvider, operation: str, **kwargs
+    ) -> Tuple[str, Dict[str, int]]:
+        """Run an operation, returning the result and the tokens it used"""
         try:
-            if provider not in self.providers:
-                raise Exception(f"Provider {provider.value} not available")
-            
-            llm = self.providers[provider]
-            
-            if provider == AIProvider.OLLAMA:
-                if operation not in self.text_prompts:
-                    raise Exception(f"Operation {operation} not supported for Ollama")
-                
-                prompt_template = self.text_prompts[operation]
-                
-                if operation == "translate":
-                    prompt_text = prompt_template.format(
-                        text=kwargs.get("text", ""),
-                        target_language=kwargs.get("target_language", "Ukrainian")
-                    )
-                else:
-                    prompt_text = prompt_template.format(text=kwargs.get("text", ""))
-                
-                result = await llm.ainvoke(prompt_text)
-                
-            else:
-                if operation not in self.chat_prompts:
-                    raise Exception(f"Operation {operation} not supported")
-                
-                prompt_template = self.chat_prompts[operation]
-                
-                if operation == "translate":
-                    messages = prompt_template.format_messages(
-                        text=kwargs.get("text", ""),
-                        target_language=kwargs.get("target_language", "Ukrainian")
-                    )
-                else:
-                    messages = prompt_template.format_messages(text=kwargs.get("text", ""))
-                
-                result = await llm.ainvoke(messages)
-            
+            prompt = self._build_prompt(provider, operation, **kwargs)
+            usage = TokenUsageCallback()
+            result = await self.providers[provider].ainvoke(
+                prompt, config={"callbacks": [usage]}
+            )
+
             if hasattr(result, 'content'):
-                return result.content.strip()
+                return result.content.strip(), usage.usage()
             else:
-                return str(result).strip()
-            
+                return str(result).strip(), usage.usage()
+
         except Exception as e:
             raise Exception(f"Provider {provider.value} failed: {str(e)}")
-    
-    async def _execute_with_fallback(self, operation: str, preferred_provider: AIProvider = None, **kwargs) -> Dict[str, Any]:
-        
-        provider_order = []
-        if preferred_provider and preferred_provider in self.providers:
-            provider_order.append(preferred_provider)
-        
-        priority_order = [AIProvider.GROQ, AIProvider.GEMINI, AIProvider.OPENAI, AIProvider.HUGGINGFACE, AIProvider.OLLAMA]
-        for provider in priority_order:
-            if provider in self.providers and provider not in provider_order:
-                provider_order.append(provider)
-        
-        last_error = None
-        
-        for provider in provider_order:
-            try:
-                result = await self._execute_with_chain(provider, operation, **kwargs)
-                
-                return {
-                    "success": True,
-                    "result": result,
-                    "provider_used": provider.value,
-                    "token_usage": {
-                        "total_tokens": self.token_callback.total_tokens,
-                        "prompt_tokens": self.token_callback.prompt_tokens,
-                        "completion_tokens": self.token_callback.completion_tokens
+
+    async def _astream_chain(
+        self,
+        provider: AIProvider,
+        operation: str,
+        usage: Optional[TokenUsageCallback] = None,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """Yield the non-empty pieces of a result as the provider sends them.
+
+        ``usage`` counts the tokens of the stream once it has ended.
+        """
+        prompt = self._build_prompt(provider, operation, **kwargs)
+        config = {"callbacks": [usage]} if usage is not None else None
+        started = False
+        async for chunk in self.providers[provider].astream(
+            prompt, config=config
+        ):
+            piece = chunk.content if hasattr(chunk, 'content') else chunk
+            if not isinstance(piece, str):
+                piece = str(piece)
+            if not started:
+                # Same as the stripped result of a non-streamed call
+                piece = piece.lstrip()
+            if piece:
+                started = True
+                yield piece
+
+    def _provider_order(
+        self, preferred_provider: Optional[AIProvider] = None
+    ) -> List[AIProvider]:
+        """Providers whose circuit isn't open, fastest expected first.
+
+        The preferred provider goes first when it is available; the others
+        are ranked by recent latency and error rate, with
+        ``PROVIDER_PRIORITY`` breaking ties between providers without
+        enough history.
+        """
+        candidates = [p for p in PROVIDER_PRIORITY if p in self.providers]
+        ranked = self.provider_health.rank(
+            [provider.value for provider in candidates],
+            default_latency=AI_HEDGE_DEFAULT_DELAY,
+        )
+        provider_order = [AIProvider(name) for name in ranked]
+        if preferred_provider in provider_order:
+            provider_order.remove(preferred_provider)
+            provider_order.insert(0, preferred_provider)
+        return provider_order
+
+    async def _execute_with_fallback(
+        self,
+        operation: str,
+        preferred_provider: AIProvider = None,
+        user_id: Optional[int] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        provider_order = self._provider_order(preferred_provider)
+
+        cache_keys = {}
+        if self.cache.enabled_for(operation):
+            cache_keys = {
+                provider: self.cache.key(
+                    operation,
+                    kwargs.get("text", ""),
+                    kwargs.get("target_language"),
+                    provider.value,
+                    self._get_provider_model(provider),
+                )
+                for provider in provider_order
+            }
+            # A result any available provider already produced beats
+            # calling the preferred one again
+            for provider in provider_order:
+                cached = self.cache.peek(cache_keys[provider])
+                if cached is not None:
+                    return {
+                        "success": True,
+                        "result": cached,
+                        "provider_used": provider.value,
+                        "cached": True,
+                        "token_usage": _sum_usage([]),
                     }
-                }
-                
-            except Exception as e:
-                last_error = e
-                print(f"Provider {provider.value} failed for {operation}: {e}")
-                continue
-        
-        raise Exception(f"All providers failed for {operation}. Last error: {last_error}")
-    
-    async def autocomplete(self, text: str, preferred_provider: AIProvider = None, use_memory: bool = True) -> Dict[str, Any]:
-        return await self._execute_with_fallback(
-            operation="autocomplete",
-            preferred_provider=preferred_provider,
-            text=text
+            self.cache.record_miss()
+
+        # Identical requests already in flight share that call's result;
+        # its tokens are charged to the user who started it
+        flight_key = (
+            operation,
+            normalize_text(kwargs.get("text", "")),
+            kwargs.get("target_language"),
+            preferred_provider,
         )
-    
-    async def grammar_check(self, text: str, preferred_provider: AIProvider = None) -> Dict[str, Any]:
-        return await self._execute_with_fallback(
-            operation="grammar",
-            preferred_provider=preferred_provider,
-            text=text
+        result = await self.in_flight.do(
+            flight_key,
+            lambda: self._race_providers(
+                operation, provider_order, cache_keys, user_id, **kwargs
+            ),
+        )
+        return dict(result)
+
+    async def _timed_invoke(
+        self,
+        provider: AIProvider,
+        operation: str,
+        user_id: Optional[int] = None,
+        **kwargs,
+    ) -> Tuple[str, Dict[str, int]]:
+        stats = self.provider_health[provider.value]
+        stats.acquire()
+        started = time.perf_counter()
+        try:
+            result, usage = await asyncio.wait_for(
+                self._invoke_chain(provider, operation, **kwargs),
+                timeout=self._timeout(provider),
+            )
+        except asyncio.TimeoutError:
+            stats.record_failure(timeout=True)
+            error = (
+                f"Provider {provider.value} timed out after "
+                f"{self._timeout(provider)}s"
+            )
+            self._record_usage(user_id, provider, operation, {}, started, error)
+            raise Exception(error)
+        except asyncio.CancelledError:
+            stats.record_cancelled()
+            raise
+        except Exception as e:
+            stats.record_failure()
+            self._record_usage(
+                user_id, provider, operation, {}, started, str(e)
+            )
+            raise
+        stats.record_success(time.perf_counter() - started)
+        self._record_usage(user_id, provider, operation, usage, started)
+        return result, usage
+
+    def _record_usage(
+        self,
+        user_id: Optional[int],
+        provider: AIProvider,
+        operation: str,
+        usage: Dict[str, int],
+        started: float,
+        error: Optional[str] = None,
+    ) -> None:
+        self.token_callback.add(usage)
+        usage_tracker.record(
+            user_id,
+            provider.value,
+            operation,
+            usage,
+            time.perf_counter() - started,
+            success=error is None,
+            error=error,
         )
-    
-    async def translate(self, text: str, target_language: str, preferred_provider: AIProvider = None) -> Dict[str, Any]:
+
+    def _timeout(self, provider: AIProvider) -> float:
+        return float(
+            os.getenv(f"AI_TIMEOUT_{provider.name}", AI_PROVIDER_TIMEOUT)
+        )
+
+    def _hedge_delay(self, provider: AIProvider) -> Optional[float]:
+        """How long to wait on ``provider`` before starting a backup"""
+        if not self.hedge:
+            return None
+        stats = self.provider_health[provider.value]
+        delay = None
+        if stats.samples >= AI_HEDGE_MIN_SAMPLES:
+            delay = stats.percentile(AI_HEDGE_PERCENTILE)
+        if delay is None:
+            delay = AI_HEDGE_DEFAULT_DELAY
+        # A provider that never answers in time has no latency samples;
+        # don't let it use up most of its timeout before the backup starts
+        delay = min(delay, self._timeout(provider) / 2)
+        return max(delay, AI_HEDGE_MIN_DELAY)
+
+    async def _race_providers(
+        self,
+        operation: str,
+        provider_order: List[AIProvider],
+        cache_keys: Dict[AIProvider, str],
+        user_id: Optional[int] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Call providers in order, hedging slow ones with the next.
+
+        A provider that fails hands over to the next one immediately. With
+        hedging on, one that hasn't answered within its usual latency
+        (``AI_HEDGE_PERCENTILE``) gets the next provider started alongside
+        it; the first success wins and the others are cancelled.
+        """
+        remaining = list(provider_order)
+        running: Dict[asyncio.Task, AIProvider] = {}
+        last_error = None
+        hedge_at = None
+
+        def start_next():
+            nonlocal hedge_at
+            provider = remaining.pop(0)
+            task = asyncio.create_task(
+                self._timed_invoke(provider, operation, user_id, **kwargs)
+            )
+            running[task] = provider
+            delay = self._hedge_delay(provider)
+            hedge_at = None if delay is None else time.monotonic() + delay
+
+        try:
+            while running or remaining:
+                if not running:
+                    start_next()
+                timeout = None
+                if remaining and hedge_at is not None:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    self.hedged += 1
+                    start_next()
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        result, usage = task.result()
+                        if provider in cache_keys:
+                            self.cache.set(
+                                cache_keys[provider],
+                                result,
+                                usage["total_tokens"],
+                            )
+                        return {
+                            "success": True,
+                            "result": result,
+                            "provider_used": provider.value,
+                            "cached": False,
+                            "token_usage": usage,
+                        }
+                    last_error = error
+                    if not isinstance(error, ProviderUnavailableError):
+                        logger.warning(
+                            "Provider %s failed for %s: %s",
+                            provider.value,
+                            operation,
+                            error,
+                        )
+                if remaining:
+                    start_next()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        if last_error is None:
+            raise Exception(f"No AI provider is available for {operation}")
+        raise Exception(
+            f"All providers failed for {operation}. Last error: {last_error}"
+        )
+
+    async def autocomplete(
+        self,
+        text: str,
+        preferred_provider: AIProvider = None,
+        use_memory: bool = True,
+        user_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
         return await self._execute_with_fallback(
-            operation="translate",
+            operation="autocomplete",
             preferred_provider=preferred_provider,
+            user_id=user_id,
             text=text,
-            target_language=target_language
         )
 
-    async def health_check(self) -> Dict[str, Any]:
-        results = {}
-        
-        for provider_type in self.providers.keys():
+    async def stream_autocomplete(
+        self,
+        text: str,
+        preferred_provider: AIProvider = None,
+        user_id: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a continuation as events: provider, token..., done.
+
+        Providers are tried in the usual fallback order until one produces
+        its first token; after that the stream is committed to it and a
+        failure is raised to the caller. The done event carries the tokens
+        the stream used.
+        """
+        last_error = None
+
+        for provider in self._provider_order(preferred_provider):
+            health = self.provider_health[provider.value]
             try:
-                test_result = await self._execute_with_chain(
-                    provider_type, 
-                    "autocomplete", 
-                    text="Hello"
-                )
-                
-                results[provider_type.value] = {
-                    "healthy": True,
-                    "response_preview": test_result[:50] + "..." if len(test_result) > 50 else test_result,
-                    "model": self._get_provider_model(provider_type)
+                health.acquire()
+            except ProviderUnavailableError as e:
+                last_error = e
+                continue
+            started = time.perf_counter()
+            usage = TokenUsageCallback()
+            stream = self._astream_chain(
+                provider, "autocomplete", usage, text=text
+            )
+            try:
+                try:
+                    first = await asyncio.wait_for(
+                        stream.__anext__(), timeout=self._timeout(provider)
+                    )
+                except StopAsyncIteration:
+                    first = ""
+                except asyncio.CancelledError:
+                    health.record_cancelled()
+                    raise
+                except Exception as e:
+                    last_error = e
+                    self._record_ttft(provider, None)
+                    health.record_failure(
+                        timeout=isinstance(e, asyncio.TimeoutError)
+                    )
+                    self._record_usage(
+                        user_id,
+                        provider,
+                        "autocomplete",
+                        {},
+                        started,
+                        str(e) or type(e).__name__,
+                    )
+                    logger.warning(
+                        "Provider %s failed for stream: %s", provider.value, e
+                    )
+                    continue
+
+                ttft = time.perf_counter() - started
+                self._record_ttft(provider, ttft)
+                # Time to first token isn't comparable with the latency of
+                # whole calls, so only the outcome is recorded
+                health.record_success()
+                yield {
+                    "event": "provider",
+                    "provider": provider.value,
+                    "ttft_ms": round(ttft * 1000, 1),
                 }
-                
-            except Exception as e:
-                results[provider_type.value] = {
-                    "healthy": False,
-                    "error": str(e),
-                    "model": self._get_provider_model(provider_type)
+                try:
+                    if first:
+                        yield {"event": "token", "token": first}
+                        async for piece in stream:
+                            yield {"event": "token", "token": piece}
+                finally:
+                    # Also when the client goes away mid-stream
+                    self._record_usage(
+                        user_id,
+                        provider,
+                        "autocomplete",
+                        usage.usage(),
+                        started,
+                    )
+                yield {
+                    "event": "done",
+                    "provider": provider.value,
+                    "token_usage": usage.usage(),
                 }
-        
+                return
+            finally:
+                await stream.aclose()
+
+        if last_error is None:
+            raise Exception("No AI provider is available for autocomplete")
+        raise Exception(
+            f"All providers failed for autocomplete. Last error: {last_error}"
+        )
+
+    def _record_ttft(self, provider: AIProvider, ttft: Optional[float]):
+        stats = self._ttft.setdefault(
+            provider.value,
+            {"streams": 0, "failures": 0, "total_ms": 0.0, "last_ms": 0.0},
+        )
+        if ttft is None:
+            stats["failures"] += 1
+            return
+        stats["streams"] += 1
+        stats["last_ms"] = round(ttft * 1000, 1)
+        stats["total_ms"] += ttft * 1000
+
+    def get_provider_stats(self) -> Dict[str, Any]:
+        return {
+            "hedged": self.hedged,
+            "in_flight": self.in_flight.stats(),
+            "superseded": self.autocomplete_requests.superseded,
+            "providers": self.provider_health.stats(),
+        }
+
+    def get_streaming_stats(self) -> Dict[str, Dict[str, float]]:
         return {
-            "providers": results,
-            "healthy_count": sum(1 for r in results.values() if r.get("healthy")),
+            provider: {
+                "streams": stats["streams"],
+                "failures": stats["failures"],
+                "last_ttft_ms": stats["last_ms"],
+                "mean_ttft_ms": (
+                    round(stats["total_ms"] / stats["streams"], 1)
+                    if stats["streams"]
+                    else 0.0
+                ),
+            }
+            for provider, stats in self._ttft.items()
+        }
+
+    async def grammar_check(
+        self,
+        text: str,
+        preferred_provider: AIProvider = None,
+        progress: Optional[ProgressCallback] = None,
+        user_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return await self._execute_chunked(
+            "grammar", text, preferred_provider, progress, user_id
+        )
+
+    async def translate(
+        self,
+        text: str,
+        target_language: str,
+        preferred_provider: AIProvider = None,
+        progress: Optional[ProgressCallback] = None,
+        user_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return await self._execute_chunked(
+            "translate",
+            text,
+            preferred_provider,
+            progress,
+            user_id,
+            target_language=target_language,
+        )
+
+    async def _execute_chunked(
+        self,
+        operation: str,
+        text: str,
+        preferred_provider: Optional[AIProvider] = None,
+        progress: Optional[ProgressCallback] = None,
+        user_id: Optional[int] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Run an operation over a long text chunk by chunk.
+
+        Chunks go through ``_execute_with_fallback`` concurrently, at most
+        ``AI_CHUNK_CONCURRENCY`` at a time, so each one is cached on its
+        own and an edit only re-sends the chunks it touched. ``progress``
+        is called with (chunks done, total) as chunks finish.
+        """
+        chunks = split_markdown(text)
+        total = len(chunks)
+        if total <= 1:
+            response = await self._execute_with_fallback(
+                operation, preferred_provider, user_id, text=text, **kwargs
+            )
+            if progress:
+                progress(1, 1)
+            return response
+
+        semaphore = asyncio.Semaphore(AI_CHUNK_CONCURRENCY)
+        done = 0
+
+        async def run(chunk: Chunk) -> Dict[str, Any]:
+            nonlocal done
+            async with semaphore:
+                response = await self._execute_with_fallback(
+                    operation,
+                    preferred_provider,
+                    user_id,
+                    text=chunk.text,
+                    **kwargs,
+                )
+            done += 1
+            if progress:
+                progress(done, total)
+            return response
+
+        tasks = [asyncio.ensure_future(run(chunk)) for chunk in chunks]
+        try:
+            responses = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        result = "".join(
+            chunk.prefix + response["result"] + chunk.suffix
+            for chunk, response in zip(chunks, responses)
+        )
+        providers = dict.fromkeys(r["provider_used"] for r in responses)
+        return {
+            "success": True,
+            "result": result.strip(),
+            "provider_used": ",".join(providers),
+            "cached": all(r.get("cached") for r in responses),
+            "chunks": total,
+            "chunks_cached": sum(1 for r in responses if r.get("cached")),
+            "token_usage": _sum_usage(r["token_usage"] for r in responses),
+        }
+
+    async def health_check(self, deep: bool = False) -> Dict[str, Any]:
+        """Health of every provider, checked concurrently.
+
+        The default check spends no tokens: a provider whose circuit is open
+        is unhealthy, one that served a request in the last
+        ``AI_HEALTH_RECENT`` seconds is healthy, and the others are pinged
+        with a model-list request. ``deep`` runs a short generation on each
+        provider instead. Reports are reused for ``AI_HEALTH_TTL`` seconds.
+        """
+        cached = self._health.get(deep)
+        if cached is not None and cached[0] > time.monotonic():
+            return {**cached[1], "cached": True}
+        report = await self.in_flight.do(
+            ("health", deep), lambda: self._check_health(deep)
+        )
+        return dict(report)
+
+    async def _check_health(self, deep: bool) -> Dict[str, Any]:
+        check = self._generation_check if deep else self._light_check
+        providers = list(self.providers)
+        results = await asyncio.gather(*(check(p) for p in providers))
+        report = {
+            "providers": {
+                provider.value: {
+                    "model": self._get_provider_model(provider),
+                    **result,
+                }
+                for provider, result in zip(providers, results)
+            },
+            "healthy_count": sum(1 for r in results if r["healthy"]),
             "total_count": len(results),
-            "available_operations": ["autocomplete", "grammar", "translate"]
+            "available_operations": ["autocomplete", "grammar", "translate"],
+            "deep": deep,
+            "cached": False,
         }
-    
+        self._health[deep] = (time.monotonic() + AI_HEALTH_TTL, report)
+        return report
+
+    async def _light_check(self, provider: AIProvider) -> Dict[str, Any]:
+        stats = self.provider_health[provider.value]
+        if not stats.available():
+            return {
+                "healthy": False,
+                "source": "circuit",
+                "error": f"Provider {provider.value} circuit is open",
+            }
+        since = stats.since_last_success()
+        if since is not None and since <= AI_HEALTH_RECENT:
+            return {
+                "healthy": True,
+                "source": "traffic",
+                "last_success_s": round(since, 1),
+            }
+
+        if self._health_client is None:
+            self._health_client = self._http_client()
+        url, headers = self._ping_request(provider)
+        started = time.perf_counter()
+        try:
+            response = await self._health_client.get(
+                url, headers=headers, timeout=AI_HEALTH_TIMEOUT
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            return {
+                "healthy": False,
+                "source": "ping",
+                "error": str(e) or type(e).__name__,
+            }
+        return {
+            "healthy": True,
+            "source": "ping",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def _ping_request(self, provider: AIProvider) -> Tuple[str, Dict[str, str]]:
+        """URL and headers of a cheap authenticated request to a provider"""
+        llm = self.providers[provider]
+        if provider == AIProvider.OLLAMA:
+            base_url = (
+                getattr(llm, "base_url", None) or "http://localhost:11434"
+            )
+            return f"{base_url.rstrip('/')}/api/tags", {}
+        if provider == AIProvider.GEMINI:
+            return (
+                "https://generativelanguage.googleapis.com/v1beta/models/"
+                + self._get_provider_model(provider),
+                {"x-goog-api-key": _secret(getattr(llm, "google_api_key", ""))},
+            )
+        if provider == AIProvider.HUGGINGFACE:
+            token = _secret(getattr(llm, "huggingfacehub_api_token", ""))
+            return (
+                "https://huggingface.co/api/whoami-v2",
+                {"Authorization": f"Bearer {token}"},
+            )
+
+        if provider == AIProvider.GROQ:
+            base_url = getattr(llm, "groq_api_base", None)
+            key = getattr(llm, "groq_api_key", "")
+            base_url = base_url or "https://api.groq.com/openai/v1"
+        else:
+            base_url = getattr(llm, "openai_api_base", None)
+            key = getattr(llm, "openai_api_key", "")
+            base_url = base_url or "https://api.openai.com/v1"
+        return (
+            f"{base_url.rstrip('/')}/models",
+            {"Authorization": f"Bearer {_secret(key)}"},
+        )
+
+    async def _generation_check(self, provider: AIProvider) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            result, usage = await asyncio.wait_for(
+                self._invoke_chain(provider, "autocomplete", text="Hello"),
+                timeout=self._timeout(provider),
+            )
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            self._record_usage(
+                None, provider, "health_check", {}, started, error
+            )
+            return {"healthy": False, "source": "generation", "error": error}
+
+        self._record_usage(None, provider, "health_check", usage, started)
+        return {
+            "healthy": True,
+            "source": "generation",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "response_preview": (
+                result[:50] + "..." if len(result) > 50 else result
+            ),
+        }
+
     def _get_provider_model(self, provider: AIProvider) -> str:
         model_mapping = {
             AIProvider.OLLAMA: "llama3:8b",
             AIProvider.OPENAI: "gpt-3.5-turbo",
             AIProvider.GROQ: "llama3-8b-8192",
             AIProvider.GEMINI: "gemini-pro",
-            AIProvider.HUGGINGFACE: "microsoft/DialoGPT-large"
+            AIProvider.HUGGINGFACE: "microsoft/DialoGPT-large",
         }
         return model_mapping.get(provider, "unknown")
-    
+
     def get_available_providers(self) -> List[str]:
         return [provider.value for provider in self.providers.keys()]
-    
+
     def get_token_usage(self) -> Dict[str, int]:
-        return {
-            "total_tokens": self.token_callback.total_tokens,
-            "prompt_tokens": self.token_callback.prompt_tokens,
-            "completion_tokens": self.token_callback.completion_tokens
-        }
-    
+        """Tokens used by all calls since start (or the last reset)"""
+        return self.token_callback.usage()
+
     def reset_token_counter(self):
-        self.token_callback = TokenUsageCallback()
\ No newline at end of file
+        self.token_callback = TokenUsageCallback()
+
+
+def get_ai_service(connection: HTTPConnection) -> UnifiedAIService:
+    """Dependency returning the service created in the app lifespan"""
+    return connection.app.state.ai_service
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import insert
+
+from app.core.database import AsyncSessionLocal
+from app.models.ai_models import AIUsageLog
+
+logger = logging.getLogger(__name__)
+
+# Rows waiting to be written; beyond this they are spilled or dropped
+USAGE_LOG_QUEUE_SIZE = int(os.getenv("USAGE_LOG_QUEUE_SIZE", "10000"))
+# Rows per INSERT, and the longest a row waits for its batch to fill
+USAGE_LOG_BATCH_SIZE = int(os.getenv("USAGE_LOG_BATCH_SIZE", "500"))
+USAGE_LOG_BATCH_WAIT = float(os.getenv("USAGE_LOG_BATCH_WAIT", "1"))
+# JSON Lines file taking rows the queue or the database can't; they are
+# written on the next start. Empty drops them instead.
+USAGE_LOG_SPILL_PATH = os.getenv("USAGE_LOG_SPILL_PATH", "")
+# Seconds shutdown waits for the queue to be written
+USAGE_LOG_SHUTDOWN_TIMEOUT = float(
+    os.getenv("USAGE_LOG_SHUTDOWN_TIMEOUT", "10")
+)
+
+Row = Dict[str, Any]
+
+
+class UsageLogWriter:
+    """Writes ``AIUsageLog`` rows in the background.
+
+    ``submit`` only puts rows on a bounded queue. A single task takes them
+    off in batches and writes each batch with one executemany INSERT, so
+    requests never wait for the database. Rows that don't fit in the queue,
+    or whose batch fails to write, go to the spill file when one is
+    configured and are dropped (and counted) otherwise.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = USAGE_LOG_QUEUE_SIZE,
+        batch_size: int = USAGE_LOG_BATCH_SIZE,
+        batch_wait: float = USAGE_LOG_BATCH_WAIT,
+        spill_path: str = USAGE_LOG_SPILL_PATH,
+        session_factory=None,
+    ):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.spill_path = spill_path
+        self.session_factory = session_factory or AsyncSessionLocal
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._spill_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.dropped = 0
+
+    def submit(self, rows: Iterable[Row]) -> None:
+        rows = list(rows)
+        if self._queue is None:
+            # Not running: nothing would ever take them off the queue
+            self._overflow(rows)
+            return
+        for i, row in enumerate(rows):
+            try:
+                self._queue.put_nowait(row)
+            except asyncio.QueueFull:
+                self._overflow(rows[i:])
+                return
+
+    def _overflow(self, rows: List[Row]) -> None:
+        if not rows:
+            return
+        if not self.spill_path:
+            self.dropped += len(rows)
+            logger.warning("Dropped %d AI usage rows", len(rows))
+            return
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for row in rows:
+                        line = json.dumps(row, default=datetime.isoformat)
+                        f.write(line + "\n")
+        except OSError as e:
+            self.dropped += len(rows)
+            logger.warning("Spilling AI usage rows failed: %s", e)
+            return
+        self.spilled += len(rows)
+
+    def _take_spilled(self) -> List[Row]:
+        """Rows spilled by an earlier run, removed from the spill file"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+        with self._spill_lock:
+            with open(self.spill_path, encoding="utf-8") as f:
+                lines = f.readlines()
+            os.remove(self.spill_path)
+        rows = []
+        for line in lines:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            if row.get("timestamp"):
+                row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            rows.append(row)
+        return rows
+
+    async def _write(self, rows: List[Row]) -> None:
+        try:
+            async with self.session_factory() as session:
+                await session.execute(insert(AIUsageLog), rows)
+                await session.commit()
+        except Exception as e:
+            logger.warning("Writing %d AI usage rows failed: %s", len(rows), e)
+            self._overflow(rows)
+            return
+        self.written += len(rows)
+        self.batches += 1
+
+    async def _next_batch(self) -> List[Row]:
+        """Up to ``batch_size`` rows, waiting ``batch_wait`` after the first"""
+        loop = asyncio.get_running_loop()
+        batch: List[Row] = []
+        first = await self._queue.get()
+        if first is not None:
+            batch.append(first)
+        deadline = loop.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            if self._closing:
+                if self._queue.empty():
+                    break
+                row = self._queue.get_nowait()
+            else:
+                try:
+                    row = await asyncio.wait_for(
+                        self._queue.get(), deadline - loop.time()
+                    )
+                except asyncio.TimeoutError:
+                    break
+            if row is not None:
+                batch.append(row)
+        return batch
+
+    async def _run(self) -> None:
+        spilled = self._take_spilled()
+        for i in range(0, len(spilled), self.batch_size):
+            await self._write(spilled[i : i + self.batch_size])
+        while not (self._closing and self._queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                await self._write(batch)
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = USAGE_LOG_SHUTDOWN_TIMEOUT) -> None:
+        """Write what is queued, spilling what doesn't make it in time"""
+        if self._task is None:
+            return
+        self._closing = True
+        try:
+            # Wakes the task if it is waiting for rows
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("AI usage rows not written before shutdown")
+        queue, self._queue, self._task = self._queue, None, None
+        left = []
+        while not queue.empty():
+            row = queue.get_nowait()
+            if row is not None:
+                left.append(row)
+        self._overflow(left)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+        }
+
+
+usage_log_writer = UsageLogWriter()
@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.ai_models import AIUsageLog
+
+_GROUP_COLUMNS = {
+    "day": func.date(AIUsageLog.timestamp),
+    "provider": AIUsageLog.provider,
+    "operation": AIUsageLog.operation_type,
+}
+
+
+class UsageService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def summarize(
+        self, user_id: int, group_by: Sequence[str], since: datetime
+    ) -> List[Dict[str, Any]]:
+        """AI usage of a user since ``since``, totalled per group.
+
+        ``group_by`` names columns of ``_GROUP_COLUMNS``; rows come ordered
+        by them.
+        """
+        groups = [_GROUP_COLUMNS[name].label(name) for name in group_by]
+        requests = func.sum(AIUsageLog.request_count)
+        query = (
+            select(
+                *groups,
+                requests.label("requests"),
+                func.sum(AIUsageLog.prompt_tokens).label("prompt_tokens"),
+                func.sum(AIUsageLog.completion_tokens).label(
+                    "completion_tokens"
+                ),
+                func.sum(AIUsageLog.tokens_used).label("total_tokens"),
+                func.sum(
+                    case(
+                        (
+                            AIUsageLog.success.is_(False),
+                            AIUsageLog.request_count,
+                        ),
+                        else_=0,
+                    )
+                ).label("errors"),
+                func.sum(AIUsageLog.execution_time).label("execution_time"),
+            )
+            .where(AIUsageLog.user_id == user_id, AIUsageLog.timestamp >= since)
+            .group_by(*groups)
+            .order_by(*groups)
+        )
+        result = await self.db.execute(query)
+
+        rows = []
+        for row in result.mappings():
+            row = dict(row)
+            execution_time = row.pop("execution_time") or 0.0
+            row["avg_latency_ms"] = round(
+                execution_time * 1000 / (row["requests"] or 1), 1
+            )
+            rows.append(row)
+        return rows
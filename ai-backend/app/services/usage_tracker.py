@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.usage_log_writer import UsageLogWriter, usage_log_writer
+
+logger = logging.getLogger(__name__)
+
+# Seconds between writes of the aggregated counters to ai_usage_logs
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "30"))
+
+# (user id, provider, operation, success)
+BucketKey = Tuple[Optional[int], str, str, bool]
+
+_COUNTERS = (
+    "requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "execution_time",
+)
+
+
+def _empty_bucket() -> Dict[str, Any]:
+    bucket: Dict[str, Any] = dict.fromkeys(_COUNTERS, 0)
+    bucket["error"] = None
+    return bucket
+
+
+class UsageTracker:
+    """Token usage of AI calls, aggregated per user, provider and operation.
+
+    Recording a call only bumps in-memory counters. The counters collected
+    since the last flush are handed to the ``UsageLogWriter`` as one
+    ``ai_usage_logs`` row per bucket, every ``USAGE_FLUSH_INTERVAL``
+    seconds and on shutdown.
+    """
+
+    def __init__(
+        self,
+        interval: float = USAGE_FLUSH_INTERVAL,
+        writer: Optional[UsageLogWriter] = None,
+    ):
+        self.interval = interval
+        self.writer = writer if writer is not None else usage_log_writer
+        self._pending: Dict[BucketKey, Dict[str, Any]] = {}
+        self._totals: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.rows_flushed = 0
+
+    def record(
+        self,
+        user_id: Optional[int],
+        provider: str,
+        operation: str,
+        usage: Dict[str, int],
+        execution_time: float,
+        success: bool = True,
+        error: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            for bucket in (
+                self._pending.setdefault(
+                    (user_id, provider, operation, success), _empty_bucket()
+                ),
+                self._totals.setdefault((provider, operation), _empty_bucket()),
+            ):
+                bucket["requests"] += 1
+                bucket["execution_time"] += execution_time
+                for name in ("prompt_tokens", "completion_tokens"):
+                    bucket[name] += usage.get(name, 0)
+                bucket["total_tokens"] += usage.get("total_tokens", 0)
+                if error:
+                    bucket["error"] = error
+
+    def _drain(self) -> Dict[BucketKey, Dict[str, Any]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    @staticmethod
+    def _rows(pending: Dict[BucketKey, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return [
+            {
+                "user_id": user_id,
+                "operation_type": operation,
+                "provider": provider,
+                "request_count": counters["requests"],
+                "prompt_tokens": counters["prompt_tokens"],
+                "completion_tokens": counters["completion_tokens"],
+                "tokens_used": counters["total_tokens"],
+                "execution_time": counters["execution_time"],
+                "success": success,
+                "error_message": counters["error"],
+                "timestamp": now,
+            }
+            for (user_id, provider, operation, success), counters in (
+                pending.items()
+            )
+        ]
+
+    def flush(self) -> int:
+        """Hand the counters collected since the last flush to the writer"""
+        pending = self._drain()
+        if pending:
+            self.writer.submit(self._rows(pending))
+            self.rows_flushed += len(pending)
+        return len(pending)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {
+                f"{provider}:{operation}": {
+                    name: round(bucket[name], 3) for name in _COUNTERS
+                }
+                for (provider, operation), bucket in self._totals.items()
+            }
+            pending = len(self._pending)
+        return {
+            "pending_rows": pending,
+            "rows_flushed": self.rows_flushed,
+            "totals": totals,
+        }
+
+
+usage_tracker = UsageTracker()
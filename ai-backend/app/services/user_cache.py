@@ -0,0 +1,211 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.models.user import User
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# "memory" (per process) or "sqlite" (shared by every worker on the host)
+USER_CACHE_BACKEND = os.getenv("USER_CACHE_BACKEND", "memory")
+USER_CACHE_PATH = os.getenv("USER_CACHE_PATH", "./user_cache.db")
+# Seconds a lookup waits on another worker's write lock before it is
+# treated as a miss; lookups run on the event loop
+USER_CACHE_SQLITE_TIMEOUT = float(
+    os.getenv("USER_CACHE_SQLITE_TIMEOUT", "0.05")
+)
+
+
+class CacheBackend(ABC):
+    """Key/value store with per-entry TTL used by ``UserCache``"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None: ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str) -> None: ...
+
+
+class InMemoryBackend(CacheBackend):
+    def __init__(self, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + ttl, value)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+
+class SQLiteBackend(CacheBackend):
+    """Local stand-in for a networked cache such as Redis.
+
+    Entries live in a SQLite file, so every worker process on the host
+    shares them, the same way they would share a cache server. Calls
+    run on the event loop, so a busy database gives up after ``timeout``
+    seconds: a lookup becomes a miss and a write is skipped.
+    """
+
+    PRUNE_EVERY = 64
+
+    def __init__(
+        self,
+        path: str = USER_CACHE_PATH,
+        timeout: float = USER_CACHE_SQLITE_TIMEOUT,
+    ):
+        self._conn = sqlite3.connect(
+            path,
+            timeout=timeout,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                ).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time() + ttl),
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._prune()
+        except sqlite3.OperationalError:
+            pass
+
+    def _prune(self) -> None:
+        self._conn.execute(
+            "DELETE FROM cache WHERE expires_at <= ?", (time.time(),)
+        )
+
+    def delete_prefix(self, prefix: str) -> None:
+        escaped = (
+            prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key LIKE ? ESCAPE '\\' "
+                    "OR expires_at <= ?",
+                    (escaped + "%", time.time()),
+                )
+        except sqlite3.OperationalError:
+            pass
+
+
+class UserCache:
+    """Users resolved from access tokens, keyed by token subject and expiry.
+
+    Only non-secret columns are cached. Cached users are detached
+    ``User`` instances and must not be added to a session.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = USER_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(subject: str, exp: Any) -> str:
+        return f"user:{subject}:{exp}"
+
+    def get(self, subject: str, exp: Any) -> Optional[User]:
+        value = self.backend.get(self._key(subject, exp))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        created_at = value["created_at"]
+        return User(
+            id=value["id"],
+            email=value["email"],
+            created_at=(
+                datetime.fromisoformat(created_at) if created_at else None
+            ),
+        )
+
+    def set(self, subject: str, exp: Any, user: User) -> None:
+        # Never outlive the token itself
+        ttl = self.ttl
+        if isinstance(exp, (int, float)):
+            ttl = min(ttl, exp - time.time())
+        if ttl <= 0:
+            return
+        value = {
+            "id": user.id,
+            "email": user.email,
+            "created_at": (
+                user.created_at.isoformat() if user.created_at else None
+            ),
+        }
+        self.backend.set(self._key(subject, exp), value, ttl)
+
+    def invalidate(self, subject: str) -> None:
+        self.backend.delete_prefix(f"user:{subject}:")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_backend(name: str = USER_CACHE_BACKEND) -> CacheBackend:
+    if name == "sqlite":
+        return SQLiteBackend()
+    return InMemoryBackend()
+
+
+user_cache = UserCache(create_backend())
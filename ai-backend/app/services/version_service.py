@@ -0,0 +1,431 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from difflib import SequenceMatcher
+from typing import Any, List, Optional, Sequence, Set, Tuple, Union
+
+import zstandard
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import LRUCache
+from app.models.ai_models import DocumentVersion
+from app.models.note import Note
+
+# Record a version of a note whenever it is saved
+NOTE_VERSIONS = os.getenv("NOTE_VERSIONS", "1") == "1"
+# Versions per chain: a keyframe and the deltas that follow it. Getting
+# any version decodes at most this many rows.
+NOTE_VERSION_KEYFRAME_INTERVAL = int(
+    os.getenv("NOTE_VERSION_KEYFRAME_INTERVAL", "20")
+)
+NOTE_VERSION_ZSTD_LEVEL = int(os.getenv("NOTE_VERSION_ZSTD_LEVEL", "3"))
+# Diffing and compressing versions of notes of at least this many
+# characters runs on a thread pool, off the event loop
+NOTE_VERSION_INLINE_MAX_SIZE = int(
+    os.getenv("NOTE_VERSION_INLINE_MAX_SIZE", "32768")
+)
+NOTE_VERSION_WORKERS = int(os.getenv("NOTE_VERSION_WORKERS", "2"))
+# Retention of autosaves: all of those from the last KEEP_ALL_HOURS, then
+# the last of each hour up to KEEP_HOURLY_DAYS old, then the last of each
+# day up to KEEP_DAYS old. Named versions and the latest one are kept.
+NOTE_VERSION_KEEP_ALL_HOURS = float(
+    os.getenv("NOTE_VERSION_KEEP_ALL_HOURS", "24")
+)
+NOTE_VERSION_KEEP_HOURLY_DAYS = float(
+    os.getenv("NOTE_VERSION_KEEP_HOURLY_DAYS", "7")
+)
+NOTE_VERSION_KEEP_DAYS = float(os.getenv("NOTE_VERSION_KEEP_DAYS", "90"))
+# Autosaves of a note record a version at most once per this many
+# seconds; named versions always record
+NOTE_VERSION_MIN_INTERVAL = float(os.getenv("NOTE_VERSION_MIN_INTERVAL", "60"))
+
+FULL = "full"
+DELTA = "delta"
+
+# Content split after each newline. A delta is a list of the ranges
+# [start, end) of the previous version's lines to copy, and of text.
+Lines = List[str]
+Delta = List[Union[List[int], str]]
+# What decoding a version needs: storage, data and content of its row
+Stored = Tuple[Optional[str], Optional[bytes], Optional[str]]
+# What encoding a version sets: its storage, data and chain
+Encoded = Tuple[str, bytes, int]
+
+# Note id -> when an autosave of it last recorded a version
+_last_recorded = LRUCache(max_entries=10000)
+
+_version_executor = ThreadPoolExecutor(
+    max_workers=NOTE_VERSION_WORKERS, thread_name_prefix="versions"
+)
+# zstd contexts can't be shared between threads
+_local = threading.local()
+
+
+def _compressor() -> zstandard.ZstdCompressor:
+    compressor = getattr(_local, "compressor", None)
+    if compressor is None:
+        compressor = zstandard.ZstdCompressor(level=NOTE_VERSION_ZSTD_LEVEL)
+        _local.compressor = compressor
+    return compressor
+
+
+def _decompressor() -> zstandard.ZstdDecompressor:
+    decompressor = getattr(_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _local.decompressor = zstandard.ZstdDecompressor()
+    return decompressor
+
+
+async def _run(size: int, fn, *args):
+    """``fn(*args)``, on the thread pool if the note is large"""
+    if size < NOTE_VERSION_INLINE_MAX_SIZE:
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_version_executor, fn, *args)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def diff_lines(a: Lines, b: Lines) -> Delta:
+    # Edits are mostly in one place; matching only what lies between the
+    # common start and end keeps large notes cheap to diff
+    shortest = min(len(a), len(b))
+    start = 0
+    while start < shortest and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < shortest - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+
+    delta: Delta = [[0, start]] if start else []
+    matcher = SequenceMatcher(
+        None, a[start : len(a) - end], b[start : len(b) - end]
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([start + i1, start + i2])
+        elif j2 > j1:
+            delta.append("".join(b[start + j1 : start + j2]))
+    if end:
+        delta.append([len(a) - end, len(a)])
+    return delta
+
+
+def apply_delta(a: Lines, delta: Delta) -> Lines:
+    lines: Lines = []
+    for part in delta:
+        if isinstance(part, str):
+            lines.extend(part.splitlines(keepends=True))
+        else:
+            lines.extend(a[part[0] : part[1]])
+    return lines
+
+
+def _is_keyframe(version) -> bool:
+    return version.storage != DELTA
+
+
+def _stored(version: DocumentVersion) -> Stored:
+    return version.storage, version.data, version.content
+
+
+def _decode(stored: Stored, previous: Optional[Lines]) -> Lines:
+    """Lines of a version, given those of the version before it"""
+    storage, data, content = stored
+    if storage is None:
+        return content.splitlines(keepends=True)
+    data = _decompressor().decompress(data)
+    if storage == FULL:
+        return data.decode().splitlines(keepends=True)
+    return apply_delta(previous, json.loads(data))
+
+
+def _chain_lines(chain: Sequence[Stored]) -> Lines:
+    lines = None
+    for stored in chain:
+        lines = _decode(stored, lines)
+    return lines
+
+
+def _encode(
+    lines: Lines, previous: Optional[Lines], previous_chain: int
+) -> Encoded:
+    """``lines`` stored as a delta from ``previous`` if there is one and
+    the chain isn't full, else as a keyframe"""
+    if (
+        previous is not None
+        and previous_chain + 1 < NOTE_VERSION_KEYFRAME_INTERVAL
+    ):
+        delta = json.dumps(diff_lines(previous, lines), separators=(",", ":"))
+        data = _compressor().compress(delta.encode())
+        # Past a tenth of the text a delta saves little over a keyframe,
+        # and costs a longer chain to every later version
+        if len(data) * 10 <= sum(map(len, lines)):
+            return DELTA, data, previous_chain + 1
+    return FULL, _compressor().compress("".join(lines).encode()), 0
+
+
+def _encode_next(
+    chain: Sequence[Stored], content: str, previous_chain: int
+) -> Encoded:
+    """``content`` stored as the version following ``chain``"""
+    previous = _chain_lines(chain) if chain else None
+    return _encode(content.splitlines(keepends=True), previous, previous_chain)
+
+
+def _reencode(
+    chain: Sequence[Stored], kept: Sequence[bool]
+) -> List[Optional[Encoded]]:
+    """Versions of ``chain`` stored again without the ones not kept"""
+    encoded: List[Optional[Encoded]] = []
+    lines = previous = None
+    previous_chain = 0
+    for stored, keep in zip(chain, kept):
+        lines = _decode(stored, lines)
+        if not keep:
+            encoded.append(None)
+            continue
+        encoded.append(_encode(lines, previous, previous_chain))
+        previous, previous_chain = lines, encoded[-1][2]
+    return encoded
+
+
+def _set_encoded(version: DocumentVersion, encoded: Encoded) -> None:
+    version.content = None
+    version.storage, version.data, version.chain = encoded
+
+
+def retained(versions: Sequence[Any], now: datetime) -> Set[int]:
+    """Ids of the versions the retention policy keeps, oldest first in
+    ``versions``: rows with id, created_at and is_auto_save"""
+    keep_all = now - timedelta(hours=NOTE_VERSION_KEEP_ALL_HOURS)
+    hourly = now - timedelta(days=NOTE_VERSION_KEEP_HOURLY_DAYS)
+    daily = now - timedelta(days=NOTE_VERSION_KEEP_DAYS)
+    kept: Set[int] = set()
+    periods = set()
+    for i, version in enumerate(reversed(versions)):
+        created = version.created_at
+        if i == 0 or not version.is_auto_save or created >= keep_all:
+            kept.add(version.id)
+            continue
+        if created >= hourly:
+            period = (
+                "hour",
+                created.replace(minute=0, second=0, microsecond=0),
+            )
+        elif created >= daily:
+            period = ("day", created.date())
+        else:
+            continue
+        # The newest autosave of each period stands for it
+        if period not in periods:
+            periods.add(period)
+            kept.add(version.id)
+    return kept
+
+
+class VersionService:
+    """Version history of notes, kept compact.
+
+    Versions are stored as chains: a keyframe holding the whole content,
+    then deltas each holding the line changes from the version before,
+    all zstd compressed. A chain is at most NOTE_VERSION_KEYFRAME_INTERVAL
+    versions long, which bounds the cost of reconstructing any of them.
+    Saving the same content as the latest version records nothing.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _chain(
+        self, note_id: int, version_number: Optional[int] = None
+    ) -> List[DocumentVersion]:
+        """The versions from the keyframe of ``version_number`` (default
+        the latest) up to it"""
+        keyframe = select(func.max(DocumentVersion.version_number)).where(
+            DocumentVersion.note_id == note_id,
+            or_(
+                DocumentVersion.storage != DELTA,
+                DocumentVersion.storage.is_(None),
+            ),
+        )
+        query = select(DocumentVersion).where(
+            DocumentVersion.note_id == note_id
+        )
+        if version_number is not None:
+            keyframe = keyframe.where(
+                DocumentVersion.version_number <= version_number
+            )
+            query = query.where(
+                DocumentVersion.version_number <= version_number
+            )
+        query = query.where(
+            DocumentVersion.version_number >= keyframe.scalar_subquery()
+        ).order_by(DocumentVersion.version_number)
+        result = await self.db.execute(query)
+        return list(result.scalars())
+
+    async def record(
+        self,
+        note: Note,
+        is_auto_save: bool = True,
+        change_description: Optional[str] = None,
+    ) -> Optional[DocumentVersion]:
+        """Add the note's current content as its latest version.
+
+        Content equal to the latest version's isn't stored again; naming
+        it turns that version into a named one instead. An autosave
+        records nothing, and returns None, if the note's last one did
+        less than NOTE_VERSION_MIN_INTERVAL seconds ago. The caller
+        commits.
+        """
+        now = time.monotonic()
+        if is_auto_save:
+            last = _last_recorded.get(note.id)
+            if last is not None and now - last < NOTE_VERSION_MIN_INTERVAL:
+                return None
+            _last_recorded.set(note.id, now)
+        content = note.content or ""
+        digest = content_hash(content)
+        chain = await self._chain(note.id)
+        latest = chain[-1] if chain else None
+        if latest is not None and latest.content_hash == digest:
+            if not is_auto_save and latest.is_auto_save:
+                latest.is_auto_save = False
+                latest.change_description = change_description
+            return latest
+
+        version = DocumentVersion(
+            note_id=note.id,
+            user_id=note.user_id,
+            version_number=latest.version_number + 1 if latest else 1,
+            content_hash=digest,
+            change_description=change_description,
+            is_auto_save=is_auto_save,
+            created_at=_utcnow(),
+            size=len(content),
+        )
+        encoded = await _run(
+            len(content),
+            _encode_next,
+            [_stored(v) for v in chain],
+            content,
+            (latest.chain or 0) if latest else 0,
+        )
+        _set_encoded(version, encoded)
+        self.db.add(version)
+        if latest is not None and version.storage == FULL:
+            # Once per chain: old autosaves are dropped as a new one starts
+            await self.thin(note.id)
+        return version
+
+    async def get(
+        self, note_id: int, user_id: int, version_number: int
+    ) -> Optional[Tuple[DocumentVersion, str]]:
+        """A version of a user's note and its content"""
+        chain = await self._chain(note_id, version_number)
+        if (
+            not chain
+            or chain[-1].version_number != version_number
+            or chain[-1].user_id != user_id
+        ):
+            return None
+        lines = await _run(
+            chain[-1].size or 0, _chain_lines, [_stored(v) for v in chain]
+        )
+        return chain[-1], "".join(lines)
+
+    async def history(
+        self, note_id: int, user_id: int, limit: int
+    ) -> List[DocumentVersion]:
+        """A user's versions of a note, newest first"""
+        result = await self.db.execute(
+            select(DocumentVersion)
+            .where(
+                DocumentVersion.note_id == note_id,
+                DocumentVersion.user_id == user_id,
+            )
+            .order_by(DocumentVersion.version_number.desc())
+            .limit(limit)
+        )
+        return list(result.scalars())
+
+    async def thin(self, note_id: int, now: Optional[datetime] = None) -> int:
+        """Drop the versions the retention policy doesn't keep.
+
+        Chains that lose versions are stored again from their first kept
+        version on, since the deltas after a dropped version were made
+        against it. Returns the number of versions dropped.
+        """
+        # The policy needs no content: blobs are only loaded for the
+        # chains that lose versions
+        result = await self.db.execute(
+            select(
+                DocumentVersion.id,
+                DocumentVersion.version_number,
+                DocumentVersion.created_at,
+                DocumentVersion.is_auto_save,
+                DocumentVersion.storage,
+            )
+            .where(DocumentVersion.note_id == note_id)
+            .order_by(DocumentVersion.version_number)
+        )
+        versions = result.all()
+        kept = retained(versions, now or _utcnow())
+        dropped = [i for i, v in enumerate(versions) if v.id not in kept]
+        if not dropped:
+            return 0
+
+        # From the keyframe before the first dropped version to the one
+        # after the last; the chains after that don't depend on them
+        start = dropped[0]
+        while not _is_keyframe(versions[start]):
+            start -= 1
+        end = dropped[-1] + 1
+        while end < len(versions) and not _is_keyframe(versions[end]):
+            end += 1
+
+        result = await self.db.execute(
+            select(DocumentVersion)
+            .where(
+                DocumentVersion.note_id == note_id,
+                DocumentVersion.version_number.between(
+                    versions[start].version_number,
+                    versions[end - 1].version_number,
+                ),
+            )
+            .order_by(DocumentVersion.version_number)
+        )
+        affected = list(result.scalars())
+        encoded = await _run(
+            max(v.size or 0 for v in affected),
+            _reencode,
+            [_stored(v) for v in affected],
+            [v.id in kept for v in affected],
+        )
+        for version, stored in zip(affected, encoded):
+            if stored is None:
+                await self.db.delete(version)
+            else:
+                _set_encoded(version, stored)
+        return len(dropped)
+
+    async def delete_note_versions(self, note_id: int, user_id: int) -> None:
+        await self.db.execute(
+            delete(DocumentVersion).where(
+                DocumentVersion.note_id == note_id,
+                DocumentVersion.user_id == user_id,
+            )
+        )
@@ -0,0 +1,76 @@
+"""Cost of building UnifiedAIService per request versus sharing one.
+
+Requests go to a local OpenAI-compatible stub (benchmarks/stub_provider.py)
+that charges CONNECT_DELAY per new connection, standing in for the TCP and
+TLS handshakes a remote provider needs.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_ai_service
+"""
+
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.stub_provider import StubProvider
+
+REQUESTS = 200
+CONNECT_DELAY = 0.03
+
+
+async def timed(fn):
+    start = time.perf_counter()
+    await fn()
+    return time.perf_counter() - start
+
+
+async def main():
+    async with StubProvider(connect_delay=CONNECT_DELAY) as stub:
+        os.environ["OPENAI_API_KEY"] = "bench"
+        os.environ["OPENAI_API_BASE"] = stub.base_url
+        from app.services.unified_ai_service import (
+            AIProvider,
+            UnifiedAIService,
+        )
+
+        build = []
+        for _ in range(REQUESTS // 4):
+            start = time.perf_counter()
+            await UnifiedAIService().aclose()
+            build.append(time.perf_counter() - start)
+
+        async def per_request():
+            service = UnifiedAIService()
+            await service._execute_with_chain(
+                AIProvider.OPENAI, "autocomplete", text="# Notes"
+            )
+            await service.aclose()
+
+        shared = UnifiedAIService()
+
+        async def singleton():
+            await shared._execute_with_chain(
+                AIProvider.OPENAI, "autocomplete", text="# Notes"
+            )
+
+        await singleton()  # open the pooled connection
+        results = {}
+        for name, fn in (("per request", per_request), ("shared", singleton)):
+            before = stub.connections
+            latencies = [await timed(fn) for _ in range(REQUESTS)]
+            results[name] = (latencies, stub.connections - before)
+        await shared.aclose()
+
+    print(f"construct UnifiedAIService  {statistics.mean(build) * 1e3:.2f} ms")
+    for name, (latencies, connections) in results.items():
+        print(
+            f"{name:<12} p50 {statistics.median(latencies) * 1e3:6.2f} ms"
+            f"  mean {statistics.mean(latencies) * 1e3:6.2f} ms"
+            f"  new connections {connections}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
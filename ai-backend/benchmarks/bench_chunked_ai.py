@@ -0,0 +1,82 @@
+"""Chunked grammar checks of a long note against a local stub provider.
+
+The stub (benchmarks/stub_provider.py) takes LATENCY seconds per prompt.
+Reports wall time for a full check with different fan-out limits, then
+for re-checking the note after a one-paragraph edit, when only the
+changed chunk is sent again. The splitter is first checked to give back
+the document unchanged and no empty prompts, on edge cases included.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_chunked_ai
+"""
+
+import asyncio
+import os
+import time
+
+from benchmarks.corpus import make_note
+from benchmarks.stub_provider import StubProvider
+
+NOTE_SIZE = 120_000
+LATENCY = 0.5
+
+SPLIT_CASES = (
+    "\n\n" + "y" * 3000,
+    "  \n\t\n" + "y " * 1500 + "\n\n  \n",
+    "# Title\n\n" + "word " * 600 + "\n\n\n",
+    "\n\n\n",
+)
+
+
+def check_splits(split_markdown, note):
+    for text in SPLIT_CASES + (note,):
+        chunks = split_markdown(text, 1000)
+        assert "".join("".join(chunk) for chunk in chunks) == text
+        assert all(chunk.text for chunk in chunks) or len(chunks) == 1
+
+
+async def main():
+    async with StubProvider(latency=LATENCY) as stub:
+        os.environ["OPENAI_API_KEY"] = "bench"
+        os.environ["OPENAI_API_BASE"] = stub.base_url
+        from app.services import unified_ai_service as service_module
+        from app.services.ai_cache import AICache
+        from app.services.ai_chunker import split_markdown
+        from app.services.unified_ai_service import (
+            AIProvider,
+            UnifiedAIService,
+        )
+
+        note = make_note(NOTE_SIZE, seed=7)
+        check_splits(split_markdown, note)
+        print(f"{len(note)} chars, {len(split_markdown(note))} chunks")
+        for concurrency in (1, 4, 8):
+            service_module.AI_CHUNK_CONCURRENCY = concurrency
+            service = UnifiedAIService(cache=AICache())
+            service.providers = {
+                AIProvider.OPENAI: service.providers[AIProvider.OPENAI]
+            }
+            before = stub.requests
+            start = time.perf_counter()
+            await service.grammar_check(note)
+            print(
+                f"fan-out {concurrency}: {time.perf_counter() - start:5.2f} s,"
+                f" {stub.requests - before} prompts"
+            )
+
+        middle = len(note) // 2
+        edited = note[:middle] + "An edited sentence. " + note[middle:]
+        before = stub.requests
+        start = time.perf_counter()
+        response = await service.grammar_check(edited)
+        print(
+            f"after edit: {time.perf_counter() - start:5.2f} s,"
+            f" {stub.requests - before} prompts,"
+            f" {response['chunks_cached']}/{response['chunks']} chunks cached"
+        )
+        await service.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
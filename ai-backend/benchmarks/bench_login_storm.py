@@ -0,0 +1,102 @@
+"""Latency of other endpoints while a burst of logins is hashing passwords.
+
+Runs the app in-process against a throwaway SQLite database, fires
+LOGINS concurrent logins and probes GET /health every few milliseconds
+meanwhile. A probe's latency is measured from when it was due, so time
+spent waiting for a blocked event loop counts against it. "inline"
+reproduces the old behaviour of hashing on the event loop; "executor"
+is the current one, where logins that find the hashing queue full for
+too long are turned away with 503.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_login_storm
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+LOGINS = 40
+PROBE_INTERVAL = 0.005
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def storm(client):
+    await client.post(
+        "/auth/register", json={"email": "storm@x.io", "password": "secret1"}
+    )
+    probes = []
+    done = asyncio.Event()
+
+    async def probe():
+        due = time.perf_counter()
+        while not done.is_set():
+            await client.get("/health")
+            probes.append(time.perf_counter() - due)
+            due = time.perf_counter() + PROBE_INTERVAL
+            await asyncio.sleep(PROBE_INTERVAL)
+
+    async def login():
+        response = await client.post(
+            "/auth/login",
+            data={"username": "storm@x.io", "password": "secret1"},
+        )
+        return response.status_code
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    codes = await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    return elapsed, probes, codes
+
+
+async def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+    import httpx
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from app.core.database import engine
+    from app.services import auth_service
+    import main as app_main
+
+    engine.echo = False
+    executor_hash = auth_service._run_password_hash
+
+    async def inline_hash(fn, *args):
+        return fn(*args)
+
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with app_main.lifespan(app_main.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            for mode, runner in (
+                ("inline", inline_hash),
+                ("executor", executor_hash),
+            ):
+                auth_service._run_password_hash = runner
+                elapsed, probes, codes = await storm(client)
+                print(
+                    f"{mode:<9} {LOGINS} logins in {elapsed:.2f}s"
+                    f" ({codes.count(503)} turned away),"
+                    f" /health p50 {statistics.median(probes) * 1000:.1f}ms"
+                    f" p99 {percentile(probes, 99) * 1000:.1f}ms"
+                    f" max {max(probes) * 1000:.1f}ms ({len(probes)} probes)"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""Per-render cost of markdown.markdown() versus the pooled renderer.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_markdown_renderer
+"""
+
+import timeit
+
+import markdown
+
+from app.services.markdown_renderer import (
+    MARKDOWN_EXTENSIONS,
+    TAB_LENGTH,
+    MarkdownPool,
+)
+from benchmarks.corpus import make_note
+
+SIZES = (200, 2_000, 20_000, 200_000)
+
+
+def main():
+    pool = MarkdownPool(max_size=1)
+    print(f"{'size':>9} {'markdown()':>12} {'pooled':>12} {'saving':>8}")
+    for size in SIZES:
+        note = make_note(size, seed=size)
+        assert pool.convert(note) == markdown.markdown(
+            note, extensions=list(MARKDOWN_EXTENSIONS), tab_length=TAB_LENGTH
+        )
+        number = max(3, 200_000 // size)
+
+        fresh = (
+            min(
+                timeit.repeat(
+                    lambda: markdown.markdown(
+                        note,
+                        extensions=list(MARKDOWN_EXTENSIONS),
+                        tab_length=TAB_LENGTH,
+                    ),
+                    number=number,
+                    repeat=3,
+                )
+            )
+            / number
+        )
+        pooled = (
+            min(
+                timeit.repeat(
+                    lambda: pool.convert(note), number=number, repeat=3
+                )
+            )
+            / number
+        )
+
+        print(
+            f"{len(note):>9} {fresh * 1000:>10.3f}ms {pooled * 1000:>10.3f}ms"
+            f" {(1 - pooled / fresh) * 100:>7.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Autosave throughput: PUT /notes/{id} and DELETE /notes/{id}.
+
+Saves a note of NOTE_SIZE characters SAVES times in a row, each with
+one more character typed, then deletes DELETES notes, and reports the
+requests per second and the SQL statements each request ran.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_note_autosave
+
+and with NOTE_WRITE_BEHIND=1 to save through the write buffer, whose
+writes happen after the saves are timed.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+NOTE_SIZE = 20_000
+SAVES = 500
+DELETES = 200
+
+
+async def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+    import httpx
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from sqlalchemy import event
+
+    from app.core.database import engine
+    from benchmarks.corpus import make_note
+    import main as app_main
+
+    engine.echo = False
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with app_main.lifespan(app_main.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            user = {"email": "autosave@x.io", "password": "secret1"}
+            await client.post("/auth/register", json=user)
+            response = await client.post(
+                "/auth/login",
+                data={"username": user["email"], "password": user["password"]},
+            )
+            token = response.json()["access_token"]
+            client.headers["Authorization"] = f"Bearer {token}"
+
+            content = make_note(NOTE_SIZE, 0)
+            response = await client.post(
+                "/notes/", json={"title": "Draft", "content": content}
+            )
+            url = f"/notes/{response.json()['id']}"
+            note_ids = []
+            for i in range(DELETES):
+                response = await client.post(
+                    "/notes/", json={"title": f"Old {i}", "content": content}
+                )
+                note_ids.append(response.json()["id"])
+            # The user is cached from here on
+            await client.put(url, json={"content": content})
+
+            statements = 0
+            start = time.perf_counter()
+            for i in range(SAVES):
+                content = content[:i] + "x" + content[i:]
+                response = await client.put(url, json={"content": content})
+                assert response.status_code == 200
+            elapsed = time.perf_counter() - start
+            print(
+                f"put    {SAVES / elapsed:7.0f} saves/s"
+                f" {statements / SAVES:4.1f} statements per save"
+            )
+
+            statements = 0
+            start = time.perf_counter()
+            for note_id in note_ids:
+                response = await client.delete(f"/notes/{note_id}")
+                assert response.status_code == 200
+            elapsed = time.perf_counter() - start
+            print(
+                f"delete {DELETES / elapsed:7.0f} deletes/s"
+                f" {statements / DELETES:4.1f} statements per delete"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
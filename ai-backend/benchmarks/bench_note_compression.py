@@ -0,0 +1,140 @@
+"""Note content stored plain vs zstd compressed with a trained dictionary.
+
+Fills a throwaway SQLite database with NOTES synthetic notes whose sizes
+are log-normal around a few KB (from a few hundred bytes to a couple of
+hundred KB), and measures the file size, reading one note's content and
+saving one note, first with content stored plain, then after turning
+NOTE_COMPRESSION on and migrating the existing rows. The synthetic notes
+draw on a small vocabulary, so they compress better than real prose.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_note_compression
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+NOTES = 5000
+BATCH = 500
+READS = 2000
+WRITES = 500
+
+
+def sizes(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        int(min(max(rng.lognormvariate(8, 1.2), 200), 200_000))
+        for _ in range(count)
+    ]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def db_size(path):
+    return os.path.getsize(path) / 2**20
+
+
+async def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from sqlalchemy import insert, select, text, update
+
+    from app.core import compressed_text
+    from app.core.database import AsyncSessionLocal, create_tables, engine
+    from app.models import ai_models, note, user  # noqa: F401
+    from benchmarks.corpus import make_note
+
+    engine.echo = False
+    await create_tables()
+    note_sizes = sizes(NOTES)
+    async with AsyncSessionLocal() as session:
+        session.add(user.User(id=1, email="c@x.io", password_hash="x"))
+        for start in range(0, NOTES, BATCH):
+            await session.execute(
+                insert(note.Note),
+                [
+                    {
+                        "title": f"Note {i}",
+                        "content": make_note(note_sizes[i], i),
+                        "user_id": 1,
+                    }
+                    for i in range(start, start + BATCH)
+                ],
+            )
+        await session.commit()
+    total = sum(note_sizes)
+    print(
+        f"{NOTES} notes, {total / 2**20:.0f} MiB of content, median "
+        f"{statistics.median(note_sizes) / 1024:.1f} KB, "
+        f"max {max(note_sizes) / 1024:.0f} KB"
+    )
+
+    async def vacuumed_size():
+        async with engine.connect() as conn:
+            await conn.execute(text("VACUUM"))
+        return db_size("markdown_editor.db")
+
+    async def measure(label):
+        rng = random.Random(1)
+        read_ms = []
+        write_ms = []
+        async with AsyncSessionLocal() as session:
+            for _ in range(READS):
+                note_id = rng.randint(1, NOTES)
+                start = time.perf_counter()
+                await session.scalar(
+                    select(note.Note.content).where(note.Note.id == note_id)
+                )
+                read_ms.append((time.perf_counter() - start) * 1000)
+            for i in range(WRITES):
+                note_id = rng.randint(1, NOTES)
+                content = make_note(note_sizes[note_id - 1], NOTES + i)
+                start = time.perf_counter()
+                await session.execute(
+                    update(note.Note)
+                    .where(note.Note.id == note_id)
+                    .values(content=content)
+                )
+                await session.commit()
+                write_ms.append((time.perf_counter() - start) * 1000)
+        size = await vacuumed_size()
+        print(
+            f"{label:<10} db {size:6.1f} MiB  "
+            f"read p50 {percentile(read_ms, 0.5):5.2f}ms "
+            f"p99 {percentile(read_ms, 0.99):5.2f}ms  "
+            f"write p50 {percentile(write_ms, 0.5):5.2f}ms "
+            f"p99 {percentile(write_ms, 0.99):5.2f}ms"
+        )
+
+    print(f"{'plain':<10} db {await vacuumed_size():6.1f} MiB after load")
+    await measure("plain")
+
+    compressed_text.NOTE_COMPRESSION = True
+    start = time.perf_counter()
+    async with engine.connect() as conn:
+        await compressed_text.prepare_note_compression(conn)
+    elapsed = time.perf_counter() - start
+    async with engine.connect() as conn:
+        blobs = await conn.scalar(
+            text("SELECT count(*) FROM notes WHERE typeof(content) = 'blob'")
+        )
+    print(f"dictionary trained and {blobs} notes compressed in {elapsed:.1f}s")
+    print(f"{'zstd':<10} db {await vacuumed_size():6.1f} MiB after migration")
+    await measure("zstd")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
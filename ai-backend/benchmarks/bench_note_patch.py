@@ -0,0 +1,101 @@
+"""Autosaving a keystroke in a large note: PUT of the content vs PATCH.
+
+Creates one note of NOTE_SIZE characters and times saving a single typed
+character RUNS times each way, with the size of the request bodies.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_note_patch
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+NOTE_SIZE = 1_000_000
+RUNS = 50
+
+
+async def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+    import httpx
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from app.core.database import engine
+    from benchmarks.corpus import make_note
+    import main as app_main
+
+    engine.echo = False
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with app_main.lifespan(app_main.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            user = {"email": "patch@x.io", "password": "secret1"}
+            await client.post("/auth/register", json=user)
+            response = await client.post(
+                "/auth/login",
+                data={"username": user["email"], "password": user["password"]},
+            )
+            token = response.json()["access_token"]
+            client.headers["Authorization"] = f"Bearer {token}"
+
+            content = make_note(NOTE_SIZE, 0)
+            response = await client.post(
+                "/notes/", json={"title": "Large", "content": content}
+            )
+            note = response.json()
+            url = f"/notes/{note['id']}"
+            version = note["version"]
+
+            put_times, put_bytes = [], 0
+            for i in range(RUNS):
+                content = content[:i] + "x" + content[i:]
+                body = json.dumps({"content": content})
+                start = time.perf_counter()
+                response = await client.put(
+                    url,
+                    content=body,
+                    headers={"Content-Type": "application/json"},
+                )
+                put_times.append(time.perf_counter() - start)
+                put_bytes = len(body) + len(response.content)
+                version = response.json()["version"]
+
+            patch_times, patch_bytes = [], 0
+            for i in range(RUNS):
+                body = json.dumps(
+                    {
+                        "base_version": version,
+                        "ops": [{"op": "insert", "pos": i, "text": "x"}],
+                    }
+                )
+                start = time.perf_counter()
+                response = await client.patch(
+                    url,
+                    content=body,
+                    headers={"Content-Type": "application/json"},
+                )
+                patch_times.append(time.perf_counter() - start)
+                patch_bytes = len(body) + len(response.content)
+                version = response.json()["version"]
+
+            for name, times, size in (
+                ("put", put_times, put_bytes),
+                ("patch", patch_times, patch_bytes),
+            ):
+                print(
+                    f"{name:<6} {statistics.median(times) * 1000:8.1f}ms"
+                    f" {size / 1024:10.1f} KiB per save"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
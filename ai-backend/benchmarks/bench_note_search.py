@@ -0,0 +1,119 @@
+"""Full-text search over NOTES synthetic notes.
+
+Fills a throwaway SQLite database with NOTES notes of about NOTE_SIZE
+characters spread over USERS users, builds the FTS5 index from them, and
+times a page of one user's search results for a few kinds of query. A
+LIKE scan, the only way to search before, is timed for comparison; it
+has to read every one of the user's notes, whereas the index only
+touches the matching ones. Each note ends with tags of known frequency
+so queries match a known number of notes.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_note_search
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+NOTES = 100_000
+USERS = 100
+NOTE_SIZE = 1000
+BATCH = 5000
+PAGE = 20
+RUNS = 5
+
+QUERIES = (
+    # (label, query, LIKE pattern)
+    ("rare word", "project42", "%project42 %"),
+    ("prefix", "project42*", "%project42%"),
+    ("two words", "project42 owner5", None),
+    ("phrase", '"cache render"', "%cache render%"),
+    ("common word", "latency", "%latency%"),
+)
+
+
+def make_notes(start, count, contents):
+    return [
+        {
+            "title": f"Note {i}",
+            "content": contents[i % len(contents)]
+            + f"\n\nTags: project{i // USERS % 500} owner{i // USERS % 37}\n",
+            "user_id": i % USERS + 1,
+        }
+        for i in range(start, start + count)
+    ]
+
+
+async def timed(fn):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = await fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+
+async def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from sqlalchemy import insert, select
+
+    from app.core.database import AsyncSessionLocal, create_tables, engine
+    from app.models import ai_models, note, user  # noqa: F401
+    from app.services.note_search import create_search_index, search_notes
+    from benchmarks.corpus import make_note
+
+    engine.echo = False
+    await create_tables()
+    contents = [make_note(NOTE_SIZE, seed) for seed in range(1000)]
+    async with AsyncSessionLocal() as session:
+        for user_id in range(1, USERS + 1):
+            session.add(
+                user.User(
+                    id=user_id, email=f"s{user_id}@x.io", password_hash="x"
+                )
+            )
+        for start in range(0, NOTES, BATCH):
+            await session.execute(
+                insert(note.Note), make_notes(start, BATCH, contents)
+            )
+        await session.commit()
+
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        await create_search_index(conn)
+    print(
+        f"index built over {NOTES} notes in {time.perf_counter() - start:.1f}s"
+    )
+    print(
+        f"database size {os.path.getsize('markdown_editor.db') / 2**20:.0f} MiB"
+    )
+
+    async with AsyncSessionLocal() as session:
+        for label, query, pattern in QUERIES:
+            fts_ms, (hits, _) = await timed(
+                lambda: search_notes(session, 1, query, PAGE)
+            )
+            line = f"{label:<12} fts {fts_ms:7.2f}ms ({len(hits)} hits)"
+            if pattern is not None:
+                # What filtering by substring costs: every note is read
+                like = select(note.Note.id).where(
+                    note.Note.user_id == 1, note.Note.content.like(pattern)
+                )
+                like_ms, result = await timed(lambda: session.execute(like))
+                matches = len(result.all())
+                line += f"  like scan {like_ms:8.2f}ms ({matches} matches)"
+            print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
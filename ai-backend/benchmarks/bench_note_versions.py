@@ -0,0 +1,106 @@
+"""Storage and retrieval of note versions.
+
+Records SAVES autosaves of a note of about NOTE_SIZE characters, each
+with a few lines edited, and compares the bytes stored with those of a
+full copy per version. Then times getting the latest version, the one
+furthest along its chain (the worst case) and a keyframe.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_note_versions
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+NOTE_SIZE = 200_000
+SAVES = 500
+EDITS_PER_SAVE = 3
+RUNS = 20
+
+
+async def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from sqlalchemy import func, select
+
+    from app.core.database import AsyncSessionLocal, create_tables, engine
+    from app.models import ai_models, note, user
+    from app.services.version_service import VersionService
+    from benchmarks.corpus import make_note
+
+    engine.echo = False
+    await create_tables()
+    rnd = random.Random(0)
+    lines = make_note(NOTE_SIZE, 0).splitlines(keepends=True)
+    async with AsyncSessionLocal() as session:
+        session.add(user.User(id=1, email="v@x.io", password_hash="x"))
+        doc = note.Note(title="Versions", content="".join(lines), user_id=1)
+        session.add(doc)
+        await session.flush()
+
+        raw = 0
+        record_times = []
+        for i in range(SAVES):
+            for _ in range(EDITS_PER_SAVE):
+                j = rnd.randrange(len(lines))
+                lines[j] = f"edit {i} " + lines[j]
+            doc.content = "".join(lines)
+            raw += len(doc.content.encode())
+            start = time.perf_counter()
+            await VersionService(session).record(doc)
+            record_times.append(time.perf_counter() - start)
+        await session.commit()
+
+        DV = ai_models.DocumentVersion
+        result = await session.execute(
+            select(DV.storage, func.count(), func.sum(func.length(DV.data)))
+            .where(DV.note_id == doc.id)
+            .group_by(DV.storage)
+        )
+        stored = 0
+        for storage, count, size in result:
+            stored += size
+            print(f"{storage:<6} {count:4d} versions {size / 1024:10.1f} KiB")
+        print(
+            f"stored {stored / 2**20:.2f} MiB for {raw / 2**20:.1f} MiB"
+            f" of versions ({raw / stored:.0f}x)"
+        )
+        print(
+            f"record {statistics.median(record_times) * 1000:.1f}ms"
+            " per save (median)"
+        )
+
+        chains = (
+            await session.execute(
+                select(DV.version_number, DV.chain).where(DV.note_id == doc.id)
+            )
+        ).all()
+        longest = max(chains, key=lambda row: row.chain)
+        keyframe = max(row.version_number for row in chains if row.chain == 0)
+        service = VersionService(session)
+        for label, number in (
+            ("latest", SAVES),
+            (f"chain of {longest.chain + 1}", longest.version_number),
+            ("keyframe", keyframe),
+        ):
+            times = []
+            for _ in range(RUNS):
+                session.expunge_all()
+                start = time.perf_counter()
+                await service.get(doc.id, 1, number)
+                times.append(time.perf_counter() - start)
+            print(f"get {label:<12} {statistics.median(times) * 1000:6.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""GET /notes/ for a user with many large notes.
+
+Fills a throwaway SQLite database with NOTES notes of about NOTE_SIZE
+characters, then compares the full list (the default response) with a
+page of the list view and with a page deep into the list, reached by its
+cursor.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_notes_list
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+NOTES = 2000
+NOTE_SIZE = 20_000
+PAGE = 50
+RUNS = 5
+
+
+async def timed(client, params):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        response = await client.get("/notes/", params=params)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), response
+
+
+async def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+    import httpx
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from sqlalchemy import insert
+
+    from app.core.database import AsyncSessionLocal, engine
+    from app.models.note import Note
+    from benchmarks.corpus import make_note
+    import main as app_main
+
+    engine.echo = False
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with app_main.lifespan(app_main.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            user = {"email": "notes@x.io", "password": "secret1"}
+            response = await client.post("/auth/register", json=user)
+            user_id = response.json()["id"]
+            async with AsyncSessionLocal() as session:
+                contents = [make_note(NOTE_SIZE, seed) for seed in range(20)]
+                await session.execute(
+                    insert(Note),
+                    [
+                        {
+                            "title": f"Note {i}",
+                            "content": contents[i % len(contents)],
+                            "user_id": user_id,
+                        }
+                        for i in range(NOTES)
+                    ],
+                )
+                await session.commit()
+            response = await client.post(
+                "/auth/login",
+                data={"username": user["email"], "password": user["password"]},
+            )
+            token = response.json()["access_token"]
+            client.headers["Authorization"] = f"Bearer {token}"
+
+            cursor = None
+            for _ in range(NOTES // PAGE // 2):
+                params = {"limit": PAGE, "view": "list"}
+                if cursor:
+                    params["cursor"] = cursor
+                response = await client.get("/notes/", params=params)
+                cursor = response.json()["next_cursor"]
+
+            for name, params in (
+                ("full list", {}),
+                ("list page", {"limit": PAGE, "view": "list"}),
+                (
+                    "deep page",
+                    {"limit": PAGE, "view": "list", "cursor": cursor},
+                ),
+            ):
+                elapsed, response = await timed(client, params)
+                print(
+                    f"{name:<10} {elapsed * 1000:8.1f}ms"
+                    f" {len(response.content) / 1024:10.1f} KiB"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
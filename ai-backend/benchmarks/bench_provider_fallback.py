@@ -0,0 +1,86 @@
+"""Sequential versus hedged provider fallback against local stand-ins.
+
+Two OpenAI-compatible stubs (benchmarks/stub_provider.py) play the
+primary and the backup provider:
+
+- "hanging primary": the primary never answers within its timeout.
+- "slow tail": the primary usually answers in 50 ms but 10% of calls
+  take 1.5 s, while the backup answers in 80 ms.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_provider_fallback
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from langchain_openai import ChatOpenAI
+
+from benchmarks.stub_provider import StubProvider
+
+REQUESTS = 100
+PRIMARY_TIMEOUT = "1"
+
+
+def client(stub):
+    return ChatOpenAI(
+        api_key="bench", base_url=stub.base_url, model="stub", max_retries=0
+    )
+
+
+async def measure(service, requests):
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        await service.autocomplete(f"# Notes {i}")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def scenario(name, primary_latency, backup_latency, requests):
+    from app.services.ai_cache import AICache
+    from app.services.unified_ai_service import AIProvider, UnifiedAIService
+
+    async with (
+        StubProvider(latency=primary_latency) as primary,
+        StubProvider(latency=backup_latency) as backup,
+    ):
+        for hedge in (False, True):
+            service = UnifiedAIService(
+                cache=AICache(ttl=0),
+                providers={
+                    AIProvider.GROQ: client(primary),
+                    AIProvider.OPENAI: client(backup),
+                },
+                hedge=hedge,
+            )
+            # Warm up the connections and the latency percentiles
+            await measure(service, 30)
+            latencies = sorted(await measure(service, requests))
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            print(
+                f"{name:<16} {'hedged' if hedge else 'sequential':<10}"
+                f" p50 {statistics.median(latencies) * 1e3:7.1f} ms"
+                f"  p99 {p99 * 1e3:7.1f} ms"
+                f"  hedged {service.hedged}"
+            )
+
+
+async def main():
+    os.environ["AI_TIMEOUT_GROQ"] = PRIMARY_TIMEOUT
+    random.seed(1)
+    await scenario("hanging primary", 30.0, 0.08, 5)
+    await scenario(
+        "slow tail",
+        lambda: 1.5 if random.random() < 0.1 else 0.05,
+        0.08,
+        REQUESTS,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Request latency while the preferred provider is down.
+
+Two local OpenAI-compatible stubs (benchmarks/stub_provider.py) stand in
+for providers: the first in the static priority order hangs past its
+timeout, the second answers in 80 ms. Hedging is off so only the
+routing differs:
+
+- "static": the old fixed order, dead provider retried every time;
+- "ranked": providers ordered by recent latency and error rate;
+- "pinned": requests name the dead provider as preferred, so only the
+  circuit breaker keeps them from waiting on it.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_provider_outage
+"""
+
+import asyncio
+import os
+import statistics
+import time
+
+from langchain_openai import ChatOpenAI
+
+from benchmarks.stub_provider import StubProvider
+
+REQUESTS = 40
+
+
+def client(stub):
+    return ChatOpenAI(
+        api_key="bench", base_url=stub.base_url, model="stub", max_retries=0
+    )
+
+
+async def main():
+    os.environ["AI_TIMEOUT_GROQ"] = "0.5"
+    from app.services.ai_cache import AICache
+    from app.services.provider_health import ProviderHealth
+    from app.services.unified_ai_service import AIProvider, UnifiedAIService
+
+    async with (
+        StubProvider(latency=30) as dead,
+        StubProvider(latency=0.08) as healthy,
+    ):
+        no_breaker = dict(failure_threshold=10**9, min_calls=10**9)
+        for name, health, preferred in (
+            ("static", ProviderHealth(**no_breaker), None),
+            ("ranked", ProviderHealth(), None),
+            ("pinned", ProviderHealth(), AIProvider.GROQ),
+        ):
+            service = UnifiedAIService(
+                cache=AICache(ttl=0),
+                providers={
+                    AIProvider.GROQ: client(dead),
+                    AIProvider.OPENAI: client(healthy),
+                },
+                hedge=False,
+            )
+            service.provider_health = health
+            if name == "static":
+                # Keep the static order, as before
+                health.rank = lambda providers, default_latency: providers
+            latencies = []
+            for i in range(REQUESTS):
+                start = time.perf_counter()
+                await service.autocomplete(f"# Notes {i}", preferred)
+                latencies.append(time.perf_counter() - start)
+            groq = health["groq"].stats()
+            print(
+                f"{name:<7} mean {statistics.mean(latencies) * 1e3:6.1f} ms"
+                f"  p50 {statistics.median(latencies) * 1e3:6.1f} ms"
+                f"  calls to dead provider {groq['failures']}"
+                f"  state {groq['state']}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
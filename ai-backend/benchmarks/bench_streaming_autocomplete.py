@@ -0,0 +1,66 @@
+"""Time until the user sees text: streamed versus non-streamed autocomplete.
+
+Uses a local OpenAI-compatible stub (benchmarks/stub_provider.py) that
+takes FIRST_TOKEN seconds to start answering and TOKEN_DELAY seconds per
+further word, roughly the pace of a hosted model.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_streaming_autocomplete
+"""
+
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.stub_provider import StubProvider
+
+REQUESTS = 20
+FIRST_TOKEN = 0.3
+TOKEN_DELAY = 0.02
+REPLY = " ".join(f"word{i}" for i in range(60))
+
+
+async def main():
+    stub = StubProvider(
+        reply=REPLY, latency=FIRST_TOKEN, token_delay=TOKEN_DELAY
+    )
+    async with stub:
+        os.environ["OPENAI_API_KEY"] = "bench"
+        os.environ["OPENAI_API_BASE"] = stub.base_url
+        from app.services.unified_ai_service import (
+            AIProvider,
+            UnifiedAIService,
+        )
+
+        service = UnifiedAIService()
+        service.providers = {
+            AIProvider.OPENAI: service.providers[AIProvider.OPENAI]
+        }
+
+        blocking = []
+        for _ in range(REQUESTS):
+            start = time.perf_counter()
+            await service.autocomplete("# Notes")
+            blocking.append(time.perf_counter() - start)
+
+        first, total = [], []
+        for _ in range(REQUESTS):
+            start = time.perf_counter()
+            seen = None
+            async for event in service.stream_autocomplete("# Notes"):
+                if event["event"] == "token" and seen is None:
+                    seen = time.perf_counter() - start
+            first.append(seen)
+            total.append(time.perf_counter() - start)
+        await service.aclose()
+
+    ms = lambda values: f"{statistics.median(values) * 1e3:7.1f} ms"
+    print(f"ainvoke   first text {ms(blocking)}")
+    print(f"astream   first text {ms(first)}   complete {ms(total)}")
+    print(service.get_streaming_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""Time-to-first-byte and peak memory of full versus streamed renders.
+
+Streamed output is first checked to match a full render byte for byte,
+on every note and on edge cases the block splitter has to get right.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_streaming_render
+"""
+
+import time
+import tracemalloc
+
+from app.services import incremental_renderer as incremental
+from app.services.markdown_renderer import render_markdown
+from benchmarks.corpus import make_note
+
+SIZES = (100_000, 500_000, 1_000_000, 2_000_000)
+
+EDGE_CASES = (
+    "\t\nx",
+    "    \n\nx",
+    " \t \n\n\nx\n\ny",
+    "    \n    code\n\nx",
+    "- a\n\n  b\n\nc",
+    "    code\n\n\n    more\n\nx",
+)
+
+
+def check_output(note):
+    renderer = incremental.IncrementalRenderer()
+    for content in EDGE_CASES + (note,):
+        assert renderer.render(content) == render_markdown(content), content
+
+
+def measure(render):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    for _ in render():
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first, total, peak
+
+
+def main():
+    print(
+        f"{'size':>9} | {'full ttfb':>10} {'full peak':>10}"
+        f" | {'stream ttfb':>11} {'stream total':>12} {'stream peak':>11}"
+    )
+    for size in SIZES:
+        note = make_note(size, seed=size)
+        check_output(note)
+        # A cold block cache for every size: nothing is reused
+        incremental.incremental_renderer = incremental.IncrementalRenderer()
+
+        full_first, _, full_peak = measure(lambda: [render_markdown(note)])
+        stream_first, stream_total, stream_peak = measure(
+            lambda: incremental.iter_note_html(note)
+        )
+        print(
+            f"{len(note):>9} | {full_first * 1000:>8.0f}ms"
+            f" {full_peak / 2**20:>8.1f}MB"
+            f" | {stream_first * 1000:>9.0f}ms {stream_total * 1000:>10.0f}ms"
+            f" {stream_peak / 2**20:>9.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Per-request token verification cost: python-jose versus TokenVerifier.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_token_verifier
+"""
+
+import timeit
+
+from app.services.auth_service import AuthService
+from app.services.token_verifier import TokenVerifier
+
+NUMBER = 20_000
+
+
+def jose_path(token):
+    # What get_current_user used to do on every request
+    from jose import jwt
+    from app.services.auth_service import SECRET_KEY, ALGORITHM
+
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def main():
+    token = AuthService(db=None).create_access_token({"sub": "bench@x.io"})
+    cold = TokenVerifier(cache_size=0)
+    warm = TokenVerifier()
+    assert jose_path(token) == cold.verify(token) == warm.verify(token)
+
+    for name, fn in (
+        ("python-jose decode", lambda: jose_path(token)),
+        ("TokenVerifier, cache miss", lambda: cold.verify(token)),
+        ("TokenVerifier, cache hit", lambda: warm.verify(token)),
+    ):
+        per_call = min(timeit.repeat(fn, number=NUMBER, repeat=3)) / NUMBER
+        print(f"{name:<28} {per_call * 1e6:>8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
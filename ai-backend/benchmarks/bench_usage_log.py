@@ -0,0 +1,108 @@
+"""Cost of recording AI usage rows on the request path.
+
+Writes ROWS usage rows to a throwaway SQLite database from CONCURRENCY
+concurrent "requests": "per-call" adds and commits one row per call, the
+way a request handler would; "writer" submits each row to a
+UsageLogWriter, which inserts them in batches in the background. The
+time a request spends recording its row is reported, plus the time until
+every row is in the database.
+
+Run from the ai-backend directory:
+
+    python -m benchmarks.bench_usage_log
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROWS = 2000
+CONCURRENCY = 50
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def make_row(i):
+    return {
+        "user_id": None,
+        "operation_type": "autocomplete",
+        "provider": "openai",
+        "request_count": 1,
+        "prompt_tokens": 10,
+        "completion_tokens": 2,
+        "tokens_used": 12,
+        "execution_time": 0.1,
+        "success": True,
+        "timestamp": datetime.now(timezone.utc),
+    }
+
+
+async def run(record):
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def request(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await record(make_row(i))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(ROWS)))
+    return time.perf_counter() - start, latencies
+
+
+async def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    from app.core.database import AsyncSessionLocal, create_tables, engine
+    from app.models import ai_models, note, user  # noqa: F401
+    from app.services.usage_log_writer import UsageLogWriter
+
+    engine.echo = False
+    await create_tables()
+
+    async def per_call(row):
+        async with AsyncSessionLocal() as session:
+            session.add(ai_models.AIUsageLog(**row))
+            await session.commit()
+
+    writer = UsageLogWriter()
+
+    async def submit(row):
+        writer.submit([row])
+
+    elapsed, latencies = await run(per_call)
+    report("per-call", elapsed, elapsed, latencies)
+
+    writer.start()
+    start = time.perf_counter()
+    elapsed, latencies = await run(submit)
+    await writer.stop()
+    stored = time.perf_counter() - start
+    report("writer", elapsed, stored, latencies)
+    print(f"          {writer.batches} INSERTs, {writer.dropped} rows dropped")
+
+
+def report(mode, elapsed, stored, latencies):
+    print(
+        f"{mode:<9} {ROWS} rows, recording p50"
+        f" {statistics.median(latencies) * 1000:.3f}ms"
+        f" p99 {percentile(latencies, 99) * 1000:.3f}ms,"
+        f" requests done in {elapsed:.2f}s, stored in {stored:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""Synthetic Markdown notes shared by the benchmarks."""
+
+import random
+
+WORDS = (
+    "markdown editor note draft release service cache render token "
+    "provider latency request response database index query version "
+    "content preview autosave session user profile config deploy "
+    "backend frontend document section table block paragraph list"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    words[0] = words[0].capitalize()
+    if rng.random() < 0.2:
+        i = rng.randrange(len(words))
+        words[i] = f"**{words[i]}**"
+    if rng.random() < 0.15:
+        i = rng.randrange(len(words))
+        words[i] = f"[{words[i]}](https://example.com/{words[i]})"
+    return " ".join(words) + "."
+
+
+def _block(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.12:
+        level = rng.randint(1, 3)
+        return "#" * level + " " + _sentence(rng).rstrip(".")
+    if kind < 0.25:
+        return "\n".join(
+            f"- {_sentence(rng)}" for _ in range(rng.randint(2, 5))
+        )
+    if kind < 0.33:
+        body = "\n".join(
+            f"value_{i} = compute({rng.choice(WORDS)!r})"
+            for i in range(rng.randint(2, 6))
+        )
+        return "```python\n" + body + "\n```"
+    if kind < 0.40:
+        rows = [
+            f"| {rng.choice(WORDS)} | {rng.randint(1, 999)} | {rng.choice(WORDS)} |"
+            for _ in range(rng.randint(2, 6))
+        ]
+        return "| name | count | tag |\n| --- | --- | --- |\n" + "\n".join(rows)
+    if kind < 0.45:
+        return "> " + _sentence(rng)
+    return "\n".join(_sentence(rng) for _ in range(rng.randint(1, 4)))
+
+
+def make_note(size: int, seed: int = 0) -> str:
+    """Return a Markdown document of roughly ``size`` characters"""
+    rng = random.Random(seed)
+    blocks = []
+    total = 0
+    while total < size:
+        block = _block(rng)
+        blocks.append(block)
+        total += len(block) + 2
+    return "\n\n".join(blocks)
@@ -0,0 +1,163 @@
+"""Local stand-in for an OpenAI-compatible chat completions API.
+
+A tiny HTTP/1.1 server with keep-alive that answers every request with a
+fixed completion, streamed word by word when the request asks for it.
+``connect_delay`` is paid once per new connection to stand in for the TCP
+and TLS handshakes of a remote provider, ``latency`` (seconds, or a
+callable returning them) once per request before the first token and ``token_delay`` between streamed tokens.
+Every completion reports 10 prompt and 2 completion tokens of usage.
+Setting ``status`` makes every request fail with that HTTP status.
+"""
+
+import asyncio
+import json
+
+
+class StubProvider:
+    def __init__(
+        self,
+        reply: str = "continued text",
+        latency=0.0,
+        connect_delay: float = 0.0,
+        token_delay: float = 0.0,
+        status: int = 200,
+    ):
+        self.reply = reply
+        self.latency = latency
+        self.connect_delay = connect_delay
+        self.token_delay = token_delay
+        self.status = status
+        self.connections = 0
+        self.requests = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1"
+
+    async def start(self) -> "StubProvider":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self) -> "StubProvider":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    USAGE = {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+
+    def _body(self) -> bytes:
+        return json.dumps(
+            {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stub",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": self.reply,
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": self.USAGE,
+            }
+        ).encode()
+
+    def _chunk(
+        self, content: str, finish: bool = False, usage: bool = False
+    ) -> bytes:
+        event = {
+            "id": "stub",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "stub",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": content},
+                    "finish_reason": "stop" if finish else None,
+                }
+            ],
+        }
+        if usage:
+            # Like OpenAI's stream_options.include_usage: a last chunk
+            # without choices
+            event["choices"] = []
+            event["usage"] = self.USAGE
+        data = b"data: " + json.dumps(event).encode() + b"\n\n"
+        return b"%x\r\n%s\r\n" % (len(data), data)
+
+    async def _stream(self, writer, include_usage: bool = False) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        words = self.reply.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+                word = " " + word
+            writer.write(self._chunk(word))
+            await writer.drain()
+        writer.write(self._chunk("", finish=True))
+        if include_usage:
+            writer.write(self._chunk("", usage=True))
+        done = b"data: [DONE]\n\n"
+        writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(done), done))
+        await writer.drain()
+
+    async def _respond(self, writer, status: int, body: bytes) -> None:
+        writer.write(
+            b"HTTP/1.1 %d Stub\r\n"
+            b"Content-Type: application/json\r\n"
+            b"Content-Length: %d\r\n\r\n" % (status, len(body)) + body
+        )
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                request = json.loads(await reader.readexactly(length) or b"{}")
+                self.requests += 1
+                latency = self.latency
+                await asyncio.sleep(latency() if callable(latency) else latency)
+                if self.status != 200:
+                    error = {"error": {"message": "stub failure"}}
+                    await self._respond(
+                        writer, self.status, json.dumps(error).encode()
+                    )
+                elif request.get("stream"):
+                    options = request.get("stream_options") or {}
+                    await self._stream(writer, options.get("include_usage"))
+                else:
+                    # The model generates every token either way
+                    words = len(self.reply.split(" "))
+                    await asyncio.sleep(self.token_delay * (words - 1))
+                    await self._respond(writer, 200, self._body())
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.CancelledError,
+            ConnectionError,
+        ):
+            pass
+        finally:
+            writer.close()
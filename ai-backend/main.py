@@ -4,13 +4,25 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
 import json
 from datetime import datetime
-from app.core.database import create_tables
+from app.core.compressed_text import prepare_note_compression
+from app.core.database import create_tables, engine
+from app.services.ai_cache import ai_cache
+from app.services.incremental_renderer import incremental_renderer
+from app.services.markdown_renderer import render_cache
+from app.services.note_search import create_search_index
+from app.services.note_write_buffer import note_write_buffer
+from app.services.render_executor import render_executor
+from app.services.token_verifier import token_verifier
+from app.services.unified_ai_service import UnifiedAIService
+from app.services.usage_log_writer import usage_log_writer
+from app.services.usage_tracker import usage_tracker
+from app.services.user_cache import user_cache
 
 from app.routes.simple_ai_routes import router as ai_router
 from app.routes.auth import router as auth_router
 from app.routes.notes import router as notes_router
 
-from app.models import user, note
+from app.models import user, note, ai_models
 
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -23,7 +35,20 @@ class DateTimeEncoder(json.JSONEncoder):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await create_tables()
+    async with engine.connect() as conn:
+        await prepare_note_compression(conn)
+    async with engine.begin() as conn:
+        await create_search_index(conn)
+    await note_write_buffer.start()
+    app.state.ai_service = UnifiedAIService()
+    usage_log_writer.start()
+    usage_tracker.start()
     yield
+    await note_write_buffer.stop()
+    await usage_tracker.stop()
+    await usage_log_writer.stop()
+    await app.state.ai_service.aclose()
+    render_executor.shutdown()
 
 
 app = FastAPI(
@@ -42,7 +67,7 @@ app.add_middleware(
         "http://127.0.0.1:5173",
     ],
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
     allow_headers=["*"],
 )
 
@@ -59,10 +84,24 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    ai_service = getattr(app.state, "ai_service", None)
     return {
         "status": "health",
         "service": "markdown-editor",
         "version": "1.0.0",
+        "note_write_buffer": note_write_buffer.stats(),
+        "render_cache": render_cache.stats(),
+        "render_executor": render_executor.stats(),
+        "incremental_renderer": incremental_renderer.stats(),
+        "user_cache": user_cache.stats(),
+        "token_verifier": token_verifier.stats(),
+        "ai_cache": ai_cache.stats(),
+        "ai_providers": (ai_service.get_provider_stats() if ai_service else {}),
+        "ai_streaming": (
+            ai_service.get_streaming_stats() if ai_service else {}
+        ),
+        "ai_usage": usage_tracker.stats(),
+        "ai_usage_log": usage_log_writer.stats(),
     }
 
 